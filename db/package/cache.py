@@ -0,0 +1,146 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Generic, Hashable, Iterable, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class LRUTTLCache(Generic[K, V]):
+    """
+    件数上限（LRU）と有効期限（TTL）を持つインメモリキャッシュ
+
+    全件をまとめてロードした場合は「全件ロード済み」として扱い、
+    TTL内かつ追い出しが発生していない間はキャッシュにないキー＝DBにも存在しないと判断できる
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        self._loaded_at: float | None = None
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @property
+    def is_complete(self) -> bool:
+        """
+        全件ロード済みで、かつその内容が有効期限内かどうか
+        """
+        with self._lock:
+            return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    def lookup(self, key: K) -> tuple[bool, V | None]:
+        """
+        キーに対応する値を取得する
+
+        Parameters
+        ----------
+        key : K
+            キー
+
+        Returns
+        -------
+        tuple[bool, V | None]
+            (見つかったかどうか, 値)
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return False, None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return True, item[1]
+
+    def set(self, key: K, value: V) -> None:
+        """
+        値を保存する
+
+        Parameters
+        ----------
+        key : K
+            キー
+        value : V
+            値
+        """
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                # 追い出しが発生した時点で全件ロード済みではなくなる
+                self._loaded_at = None
+
+    def delete(self, key: K) -> None:
+        """
+        値を削除する
+
+        Parameters
+        ----------
+        key : K
+            キー
+        """
+        with self._lock:
+            self._data.pop(key, None)
+
+    def replace_all(self, items: Iterable[tuple[K, V]]) -> None:
+        """
+        キャッシュの内容を全件入れ替え、全件ロード済みとして扱う
+
+        Parameters
+        ----------
+        items : Iterable[tuple[K, V]]
+            (キー, 値)のリスト
+        """
+        with self._lock:
+            self._data.clear()
+            self._loaded_at = time.monotonic()
+            for key, value in items:
+                self.set(key, value)
+
+    def values(self) -> list[V]:
+        """
+        有効期限内の値を全て取得する
+
+        Returns
+        -------
+        list[V]
+            値のリスト
+        """
+        with self._lock:
+            now = time.monotonic()
+            return [value for expires_at, value in self._data.values() if expires_at >= now]
+
+    def clear(self) -> None:
+        """
+        キャッシュを空にする
+        """
+        with self._lock:
+            self._data.clear()
+            self._loaded_at = None
+
+    def stats(self) -> dict[str, Any]:
+        """
+        キャッシュの統計情報を取得する
+
+        Returns
+        -------
+        dict[str, Any]
+            件数・ヒット数・ミス数・全件ロード済みかどうか
+        """
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "complete": self.is_complete,
+        }
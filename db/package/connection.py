@@ -1,6 +1,7 @@
 import os
+import threading
 
-from sqlalchemy import create_engine
+from sqlalchemy import Engine, create_engine, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
@@ -15,7 +16,78 @@ POSTGRES_PASSWORD = get_env("POSTGRES_PASSWORD", "password")
 
 SQLALCHEMY_DATABASE_URL = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@db:5432/main"
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# 読み取り専用のセッションの接続先（レプリカなど）　空の場合はSQLALCHEMY_DATABASE_URLを使う
+SQLALCHEMY_READ_DATABASE_URL = get_env("SQLALCHEMY_READ_DATABASE_URL", "")
+# 読み取り専用のセッションで実行する文のタイムアウト（ミリ秒）
+READ_STATEMENT_TIMEOUT_MS = int(get_env("DB_READ_STATEMENT_TIMEOUT_MS", "30000"))
+
+# engine・sessionmakerはimport時には作らず、最初に使う時に作る
+# create_engineはDBドライバのimportを伴うため、起動時はゲートウェイへの接続と並行してwarm_upで作る
+_lock = threading.Lock()
+_engines: dict[str, Engine] = {}
+_sessionmakers: dict[str, sessionmaker] = {}
+
+
+def get_engine(read: bool = False) -> Engine:
+    """
+    engineを取得する　初回は作成する
+
+    Parameters
+    ----------
+    read : bool
+        読み取り専用のセッションの接続先の場合はTrue
+
+    Returns
+    -------
+    Engine
+        engine
+    """
+    key = "read" if read and SQLALCHEMY_READ_DATABASE_URL != "" else "main"
+    engine = _engines.get(key)
+    if engine is not None:
+        return engine
+
+    with _lock:
+        if key not in _engines:
+            _engines[key] = create_engine(SQLALCHEMY_READ_DATABASE_URL if key == "read" else SQLALCHEMY_DATABASE_URL)
+        return _engines[key]
+
+
+def get_sessionmaker(read: bool = False) -> sessionmaker:
+    """
+    sessionmakerを取得する　初回は作成する
+
+    Parameters
+    ----------
+    read : bool
+        読み取り専用のセッションの場合はTrue
+
+    Returns
+    -------
+    sessionmaker
+        sessionmaker
+    """
+    key = "read" if read else "main"
+    factory = _sessionmakers.get(key)
+    if factory is not None:
+        return factory
+
+    engine = get_engine(read)
+    with _lock:
+        if key not in _sessionmakers:
+            _sessionmakers[key] = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        return _sessionmakers[key]
+
+
+def warm_up() -> None:
+    """
+    engineを作成し、接続プールに接続を1つ用意しておく
+
+    起動直後の最初のクエリで接続の確立を待たないようにする
+    """
+    for read in (False, True):
+        with get_engine(read).connect() as connection:
+            connection.execute(text("SELECT 1"))
+
 
 Base = declarative_base()
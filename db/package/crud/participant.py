@@ -1,8 +1,16 @@
 import re
+from datetime import datetime, UTC
+from typing import Iterable
 
+from sqlalchemy import update as sql_update
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
 
-from .. import models
+from .. import models, schemas
+from ..cache import LRUTTLCache
+
+# discord_account_idをキーとした参加者のキャッシュ
+cache: LRUTTLCache[int, schemas.Participant] = LRUTTLCache(maxsize=20000, ttl=60 * 60)
 
 
 # ------
@@ -25,6 +33,93 @@ def normalizer_spaces(s: str) -> str:
     return re.sub(r"[\s 　]", "", s)
 
 
+# ------
+# Cache
+# ------
+def _cache_put(participant: models.Participant) -> schemas.Participant:
+    """
+    Participantモデルのスナップショットをキャッシュに保存する
+
+    Parameters
+    ----------
+    participant : models.Participant
+        Participantモデル
+
+    Returns
+    -------
+    schemas.Participant
+        保存したスナップショット
+    """
+    snapshot = schemas.Participant.model_validate(participant)
+    cache.set(snapshot.discord_account_id, snapshot)
+    return snapshot
+
+
+def load_cache(db: Session) -> int:
+    """
+    全ての参加者をまとめて読み込み、キャッシュを入れ替える
+
+    Parameters
+    ----------
+    db : Session
+        SQLAlchemyで確立したセッション
+
+    Returns
+    -------
+    int
+        読み込んだ件数
+    """
+    return len(get_all_snapshots(db))
+
+
+def get_all_snapshots(db: Session) -> list[schemas.Participant]:
+    """
+    全ての参加者をDBから読み込み、読み込んだ内容でキャッシュを入れ替える
+
+    他のプロセスやDBの直接の編集による変更を反映するため、一覧の出力ではキャッシュを使わずにこれを使う
+
+    Parameters
+    ----------
+    db : Session
+        SQLAlchemyで確立したセッション
+
+    Returns
+    -------
+    list[schemas.Participant]
+        全ての参加者のスナップショット
+    """
+    snapshots = [schemas.Participant.model_validate(p) for p in get_all(db)]
+    cache.replace_all((s.discord_account_id, s) for s in snapshots)
+    return snapshots
+
+
+def get_cached(db: Session, discord_id: int) -> schemas.Participant | None:
+    """
+    参加者をキャッシュから取得する　キャッシュになければDBから読み込んでキャッシュする
+
+    Parameters
+    ----------
+    db : Session
+        SQLAlchemyで確立したセッション
+    discord_id : int
+        参加者のDiscord User ID
+
+    Returns
+    -------
+    schemas.Participant | None
+        見つかった参加者、見つからなかった場合はNone
+    """
+    found, snapshot = cache.lookup(discord_id)
+    if found:
+        return snapshot
+
+    # 全件ロード済みでも、他のプロセスがその後に登録した参加者はキャッシュにないため、DBを確認する
+    participant = get(db, discord_id)
+    if participant is None:
+        return None
+    return _cache_put(participant)
+
+
 # ------
 # Participant
 # ------
@@ -95,12 +190,15 @@ def get(db: Session, discord_id: int) -> models.Participant | None:
     models.Participant | None
         見つかったParticipantモデル、見つからなかった場合はNone
     """
-    return db.query(models.Participant).filter(models.Participant.discord_account_id == discord_id).first()
+    return db.query(models.Participant).filter(
+        models.Participant.discord_account_id == discord_id,
+        models.Participant.deleted_at.is_(None)
+    ).first()
 
 
 def get_all(db: Session) -> list[models.Participant]:
     """
-    全ての参加者を取得する
+    削除されていない全ての参加者を取得する
 
     Parameters
     ----------
@@ -112,7 +210,7 @@ def get_all(db: Session) -> list[models.Participant]:
     list[models.Participant]
         全てのParticipantモデル
     """
-    return db.query(models.Participant).all()
+    return db.query(models.Participant).filter(models.Participant.deleted_at.is_(None)).all()
 
 
 def create(
@@ -154,6 +252,7 @@ def create(
     db.add(db_participant)
     db.commit()
     db.refresh(db_participant)
+    _cache_put(db_participant)
     return db_participant
 
 
@@ -180,6 +279,8 @@ def update(
     discord_account_id : int
         更新するDiscord ID
     """
+    old_discord_account_id = participant.discord_account_id
+
     participant.fullname = normalizer_fullname(fullname)
     participant.univ_name = normalizer_univ_name(univ_name)
     participant.discord_account_id = discord_account_id
@@ -190,6 +291,10 @@ def update(
 
     db.commit()
     db.refresh(participant)
+
+    if old_discord_account_id != participant.discord_account_id:
+        cache.delete(old_discord_account_id)
+    _cache_put(participant)
     return participant
 
 
@@ -224,3 +329,159 @@ def create_or_update(
         return update(db, participant, fullname, univ_name, discord_account_id)
 
     return create(db, fullname, univ_name, discord_account_id)
+
+
+def soft_delete(db: Session, participant: models.Participant) -> models.Participant:
+    """
+    参加者を論理削除する
+
+    Parameters
+    ----------
+    db : Session
+        SQLAlchemyで確立したセッション
+    participant : models.Participant
+        削除するParticipantモデル
+
+    Returns
+    -------
+    models.Participant
+        削除したParticipantモデル
+    """
+    participant.deleted_at = datetime.now(UTC)
+    db.commit()
+    db.refresh(participant)
+
+    cache.delete(participant.discord_account_id)
+    return participant
+
+
+def bulk_create_or_update(
+        db: Session,
+        rows: Iterable[tuple[int, str, str]],
+        batch_size: int = 1000
+) -> tuple[int, list[tuple[int, str]]]:
+    """
+    参加者をまとめて作成・更新する
+
+    rowsは逐次読み込まれ、正規化・バリデーションの上batch_size件ずつ複数行のUPSERTで書き込まれる
+    全ての書き込みは1トランザクションで行い、最後に1度だけcommitする
+
+    Parameters
+    ----------
+    db : Session
+        SQLAlchemyで確立したセッション
+    rows : Iterable[tuple[int, str, str]]
+        (Discord ID, フルネーム, 大学名)のイテラブル
+    batch_size : int
+        1回のINSERT文で書き込む件数
+
+    Returns
+    -------
+    tuple[int, list[tuple[int, str]]]
+        (書き込んだ件数, [(rowsでのindex, エラー内容)])
+    """
+    written: list[schemas.Participant] = []
+    errors: list[tuple[int, str]] = []
+    # 同一文の中で同じ行を2回更新できないため、バッチ内ではDiscord IDで重複を除く
+    batch: dict[int, dict] = {}
+
+    def flush() -> None:
+        if len(batch) == 0:
+            return
+        stmt = insert(models.Participant).values(list(batch.values()))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[models.Participant.discord_account_id],
+            index_where=models.Participant.deleted_at.is_(None),
+            set_={
+                "fullname": stmt.excluded.fullname,
+                "univ_name": stmt.excluded.univ_name,
+                "updated_at": datetime.now(UTC),
+            }
+        ).returning(*models.Participant.__table__.columns)
+        written.extend(schemas.Participant.model_validate(dict(row._mapping)) for row in db.execute(stmt))
+        batch.clear()
+
+    try:
+        for index, (discord_account_id, fullname, univ_name) in enumerate(rows):
+            participant = models.Participant(
+                fullname=normalizer_fullname(fullname),
+                univ_name=normalizer_univ_name(univ_name),
+                discord_account_id=discord_account_id
+            )
+            # バリデーション
+            if not validates(participant):
+                errors.append((index, "氏名または所属学校名が空です"))
+                continue
+
+            batch[discord_account_id] = {
+                "fullname": participant.fullname,
+                "univ_name": participant.univ_name,
+                "discord_account_id": participant.discord_account_id,
+            }
+            if len(batch) >= batch_size:
+                flush()
+        flush()
+
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    for snapshot in written:
+        cache.set(snapshot.discord_account_id, snapshot)
+
+    return len(written), errors
+
+
+def sync_members(
+        db: Session,
+        members: dict[int, tuple[str, str]],
+        mark_left: bool = True
+) -> tuple[int, int]:
+    """
+    ギルドのメンバー一覧と突き合わせ、参加者の表示名・ユーザ名のスナップショットと脱退の有無を更新する
+
+    変化のあった参加者だけを、主キーを指定した一括UPDATEで書き込み、最後に1度だけcommitする
+
+    Parameters
+    ----------
+    db : Session
+        SQLAlchemyで確立したセッション
+    members : dict[int, tuple[str, str]]
+        {DiscordのユーザID: (表示名, ユーザ名)}　ギルドの全メンバー
+    mark_left : bool
+        membersにいない参加者を脱退済みにする場合はTrue
+        membersが全てのギルドのメンバーを含まない場合（他のプロセスが担当するシャードがある場合）はFalseにする
+
+    Returns
+    -------
+    tuple[int, int]
+        (更新した件数, 新しく脱退済みにした件数)
+    """
+    now = datetime.now(UTC)
+    updates: list[dict] = []
+    left = 0
+    for participant in get_all(db):
+        member = members.get(participant.discord_account_id)
+        if member is not None:
+            display_name, username = member
+            if (participant.display_name, participant.username) == (display_name, username) \
+                    and participant.left_at is None:
+                continue
+            updates.append({
+                "id": participant.id,
+                "display_name": display_name,
+                "username": username,
+                "left_at": None,
+                "member_synced_at": now,
+            })
+        elif mark_left and participant.left_at is None:
+            # 脱退前のスナップショットは残す
+            updates.append({"id": participant.id, "left_at": now, "member_synced_at": now})
+            left += 1
+
+    if len(updates) > 0:
+        db.execute(sql_update(models.Participant), updates)
+        db.commit()
+        load_cache(db)
+    return len(updates), left
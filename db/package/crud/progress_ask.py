@@ -1,3 +1,6 @@
+from datetime import datetime, UTC
+
+from sqlalchemy import and_, delete, insert, select, update
 from sqlalchemy.orm import Session
 
 from .. import models
@@ -27,7 +30,8 @@ def get(db: Session, guild_id: int, ask_message_id: int) -> models.ProgressAsk |
     """
     return db.query(models.ProgressAsk).filter(
         models.ProgressAsk.guild_id == guild_id,
-        models.ProgressAsk.ask_message_id == ask_message_id
+        models.ProgressAsk.ask_message_id == ask_message_id,
+        models.ProgressAsk.deleted_at.is_(None)
     ).first()
 
 
@@ -39,7 +43,10 @@ def create(
         summary_channel_id: int,
         summary_message_id: int,
         role_ids: list[int],
-        contents: list[str]
+        contents: list[str],
+        closes_at: datetime | None = None,
+        emojis: str | None = None,
+        part_message_ids: list[int] | None = None
 ) -> models.ProgressAsk:
     """
     進捗報告の情報を保存する
@@ -62,6 +69,12 @@ def create(
         進捗報告の対象ロールID
     contents : list[str]
         手順のリスト
+    closes_at : datetime | None
+        締切　なければNone
+    emojis : str | None
+        手順のリアクションに使う絵文字（空白区切り）　Noneの場合は既定の絵文字
+    part_message_ids : list[int] | None
+        進捗報告（公開側）の2つ目以降のメッセージID
 
     Returns
     -------
@@ -75,7 +88,9 @@ def create(
         ask_channel_id=ask_channel_id,
         ask_message_id=ask_message_id,
         summary_channel_id=summary_channel_id,
-        summary_message_id=summary_message_id
+        summary_message_id=summary_message_id,
+        closes_at=closes_at,
+        emojis=emojis
     )
     db.add(db_progress_ask)
     # idを取得するためにcommit
@@ -97,7 +112,196 @@ def create(
         )
         db.add(db_progress_ask_content)
 
+    for part_index, message_id in enumerate(part_message_ids or [], start=1):
+        db_progress_ask_message = models.ProgressAskMessages(
+            progress_ask_id=db_progress_ask.id,
+            message_id=message_id,
+            part_index=part_index
+        )
+        db.add(db_progress_ask_message)
+
     # 最終commit
     db.commit()
 
     return db_progress_ask
+
+
+def soft_delete(db: Session, progress_ask: models.ProgressAsk) -> models.ProgressAsk:
+    """
+    進捗報告を対象ロール・手順・メッセージごと論理削除する
+
+    Parameters
+    ----------
+    db : Session
+        SQLAlchemyで確立したセッション
+    progress_ask : models.ProgressAsk
+        削除するProgressAskモデル
+
+    Returns
+    -------
+    models.ProgressAsk
+        削除したProgressAskモデル
+    """
+    now = datetime.now(UTC)
+
+    for role in progress_ask.roles:
+        role.deleted_at = now
+    for content in progress_ask.contents:
+        content.deleted_at = now
+    for message in progress_ask.messages:
+        message.deleted_at = now
+    progress_ask.deleted_at = now
+
+    db.commit()
+    db.refresh(progress_ask)
+    return progress_ask
+
+
+def get_active_index(
+        db: Session
+) -> list[tuple[int, int, int, datetime | None, str | None, list[int]]]:
+    """
+    締め切られていない進捗報告のID・ギルドID・メッセージID・締切・絵文字・2つ目以降のメッセージIDの一覧を取得する
+
+    Parameters
+    ----------
+    db : Session
+        SQLAlchemyで確立したセッション
+
+    Returns
+    -------
+    list[tuple[int, int, int, datetime | None, str | None, list[int]]]
+        (進捗報告のID, GuildID, 進捗報告（公開側）のメッセージID, 締切, 絵文字, 2つ目以降のメッセージIDのリスト)のリスト
+    """
+    active = and_(
+        models.ProgressAsk.deleted_at.is_(None),
+        models.ProgressAsk.closed_at.is_(None)
+    )
+
+    # 2つ目以降のメッセージはまとめて1回で取得する
+    part_message_ids: dict[int, list[int]] = {}
+    for progress_ask_id, message_id in db.execute(
+            select(models.ProgressAskMessages.progress_ask_id, models.ProgressAskMessages.message_id).join(
+                models.ProgressAsk, models.ProgressAsk.id == models.ProgressAskMessages.progress_ask_id
+            ).where(
+                active,
+                models.ProgressAskMessages.deleted_at.is_(None)
+            ).order_by(
+                models.ProgressAskMessages.progress_ask_id,
+                models.ProgressAskMessages.part_index
+            )
+    ):
+        part_message_ids.setdefault(progress_ask_id, []).append(message_id)
+
+    return [
+        (progress_ask_id, guild_id, ask_message_id, closes_at, emojis, part_message_ids.get(progress_ask_id, []))
+        for progress_ask_id, guild_id, ask_message_id, closes_at, emojis in db.query(
+            models.ProgressAsk.id,
+            models.ProgressAsk.guild_id,
+            models.ProgressAsk.ask_message_id,
+            models.ProgressAsk.closes_at,
+            models.ProgressAsk.emojis
+        ).filter(active)
+    ]
+
+
+def set_closes_at(db: Session, progress_ask: models.ProgressAsk, closes_at: datetime | None) -> models.ProgressAsk:
+    """
+    進捗報告の締切を設定する　締切が過去の場合はそのまま締め切る
+
+    Parameters
+    ----------
+    db : Session
+        SQLAlchemyで確立したセッション
+    progress_ask : models.ProgressAsk
+        対象のProgressAskモデル
+    closes_at : datetime | None
+        締切　Noneの場合は締切なし
+
+    Returns
+    -------
+    models.ProgressAsk
+        更新したProgressAskモデル
+    """
+    progress_ask.closes_at = closes_at
+    if closes_at is not None and closes_at <= datetime.now(UTC):
+        progress_ask.closed_at = closes_at
+
+    db.commit()
+    db.refresh(progress_ask)
+    return progress_ask
+
+
+def close_expired(db: Session) -> list[int]:
+    """
+    締切を過ぎた進捗報告を締め切る
+
+    Parameters
+    ----------
+    db : Session
+        SQLAlchemyで確立したセッション
+
+    Returns
+    -------
+    list[int]
+        締め切った進捗報告（公開側）のメッセージIDのリスト
+    """
+    result = db.execute(
+        update(models.ProgressAsk).where(
+            models.ProgressAsk.deleted_at.is_(None),
+            models.ProgressAsk.closed_at.is_(None),
+            models.ProgressAsk.closes_at <= datetime.now(UTC)
+        ).values(
+            closed_at=models.ProgressAsk.closes_at
+        ).returning(models.ProgressAsk.ask_message_id)
+    )
+    ask_message_ids = list(result.scalars())
+    db.commit()
+    return ask_message_ids
+
+
+def archive_closed(db: Session, closed_before: datetime) -> int:
+    """
+    closed_beforeより前に締め切られた進捗報告を、対象ロール・手順・メッセージ・リアクションごとアーカイブテーブルに移動する
+
+    Parameters
+    ----------
+    db : Session
+        SQLAlchemyで確立したセッション
+    closed_before : datetime
+        この日時より前に締め切られたものを移動する
+
+    Returns
+    -------
+    int
+        移動した進捗報告の件数
+    """
+    ids: list[int] = list(db.scalars(
+        select(models.ProgressAsk.id).where(
+            models.ProgressAsk.closed_at.is_not(None),
+            models.ProgressAsk.closed_at < closed_before
+        )
+    ))
+    if len(ids) == 0:
+        return 0
+
+    # 子テーブルから移動し、最後に親を移動する
+    for source, archive, key in [
+        (models.ProgressAskContents, models.ProgressAskContentsArchive, models.ProgressAskContents.progress_ask_id),
+        (models.ProgressAskRoles, models.ProgressAskRolesArchive, models.ProgressAskRoles.progress_ask_id),
+        (models.ProgressAskMessages, models.ProgressAskMessagesArchive, models.ProgressAskMessages.progress_ask_id),
+        (models.ProgressAskReactions, models.ProgressAskReactionsArchive,
+         models.ProgressAskReactions.progress_ask_id),
+        (models.ProgressAsk, models.ProgressAskArchive, models.ProgressAsk.id),
+    ]:
+        columns = list(source.__table__.columns)
+        db.execute(
+            insert(archive).from_select(
+                [column.name for column in columns],
+                select(*columns).where(key.in_(ids))
+            )
+        )
+        db.execute(delete(source).where(key.in_(ids)))
+
+    db.commit()
+    return len(ids)
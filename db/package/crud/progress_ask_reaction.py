@@ -0,0 +1,148 @@
+from typing import Iterator
+
+from sqlalchemy import BigInteger, and_, delete, func, literal, select, tuple_, union
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.orm import Session
+
+from .. import models
+
+
+# ------
+# ProgressAskReaction
+# ------
+
+def get_by_ask(db: Session, progress_ask_id: int) -> list[tuple[int, int]]:
+    """
+    進捗報告へのリアクションを全て取得する
+
+    Parameters
+    ----------
+    db : Session
+        SQLAlchemyで確立したセッション
+    progress_ask_id : int
+        進捗報告のID
+
+    Returns
+    -------
+    list[tuple[int, int]]
+        (ユーザID, 手順のindex)のリスト
+    """
+    return [
+        (user_id, step_index)
+        for user_id, step_index in db.execute(
+            select(models.ProgressAskReactions.user_id, models.ProgressAskReactions.step_index).where(
+                models.ProgressAskReactions.progress_ask_id == progress_ask_id
+            )
+        )
+    ]
+
+
+def apply_operations(db: Session, operations: dict[tuple[int, int, int], bool]) -> None:
+    """
+    リアクションの追加・削除をまとめて反映する
+
+    追加は複数行のINSERT 1文、削除は複数行のDELETE 1文で行い、1度だけcommitする
+
+    Parameters
+    ----------
+    db : Session
+        SQLAlchemyで確立したセッション
+    operations : dict[tuple[int, int, int], bool]
+        {(進捗報告のID, ユーザID, 手順のindex): 追加の場合True、削除の場合False}
+    """
+    adds = [key for key, add in operations.items() if add]
+    removes = [key for key, add in operations.items() if not add]
+
+    if len(adds) > 0:
+        db.execute(
+            insert(models.ProgressAskReactions).values([
+                {"progress_ask_id": progress_ask_id, "user_id": user_id, "step_index": step_index}
+                for progress_ask_id, user_id, step_index in adds
+            ]).on_conflict_do_nothing(
+                index_elements=["progress_ask_id", "user_id", "step_index"]
+            )
+        )
+
+    if len(removes) > 0:
+        db.execute(
+            delete(models.ProgressAskReactions).where(
+                tuple_(
+                    models.ProgressAskReactions.progress_ask_id,
+                    models.ProgressAskReactions.user_id,
+                    models.ProgressAskReactions.step_index
+                ).in_(removes)
+            )
+        )
+
+    db.commit()
+
+
+def iter_matrix(
+        db: Session,
+        progress_ask_id: int,
+        member_ids: list[int],
+        batch_size: int = 1000
+) -> Iterator[tuple[int, str | None, str | None, int]]:
+    """
+    進捗報告のメンバーごとの進捗を、参加者情報と合わせて1つのクエリで順に取得する
+
+    対象はmember_idsとリアクションを付けたユーザの和集合
+    ORMオブジェクトは作らず、サーバーサイドカーソルでbatch_size行ずつ読み込む
+    セッションを閉じる前に最後まで読み込むこと
+
+    Parameters
+    ----------
+    db : Session
+        SQLAlchemyで確立したセッション
+    progress_ask_id : int
+        進捗報告のID
+    member_ids : list[int]
+        対象ロールのメンバーのIDのリスト
+    batch_size : int
+        1度に読み込む行数
+
+    Returns
+    -------
+    Iterator[tuple[int, str | None, str | None, int]]
+        (ユーザID, 氏名, 所属学校名, 完了した手順のビットマスク)のイテレータ
+        参加者情報が登録されていない場合、氏名と所属学校名はNone
+    """
+    reactions = models.ProgressAskReactions
+
+    members = union(
+        select(func.unnest(literal(member_ids, ARRAY(BigInteger))).label("user_id")),
+        select(reactions.user_id).where(reactions.progress_ask_id == progress_ask_id)
+    ).subquery("members")
+
+    masks = select(
+        reactions.user_id,
+        func.bit_or(literal(1, BigInteger).op("<<")(reactions.step_index)).label("mask")
+    ).where(
+        reactions.progress_ask_id == progress_ask_id
+    ).group_by(
+        reactions.user_id
+    ).subquery("masks")
+
+    statement = select(
+        members.c.user_id,
+        models.Participant.fullname,
+        models.Participant.univ_name,
+        func.coalesce(masks.c.mask, 0)
+    ).outerjoin(
+        models.Participant,
+        and_(
+            models.Participant.discord_account_id == members.c.user_id,
+            models.Participant.deleted_at.is_(None)
+        )
+    ).outerjoin(
+        masks, masks.c.user_id == members.c.user_id
+    ).order_by(
+        models.Participant.univ_name.nulls_last(),
+        models.Participant.fullname.nulls_last(),
+        members.c.user_id
+    ).execution_options(
+        yield_per=batch_size
+    )
+
+    for user_id, fullname, univ_name, mask in db.execute(statement):
+        yield user_id, fullname, univ_name, mask
@@ -0,0 +1,163 @@
+import fcntl
+import json
+import logging
+import os
+import sqlite3
+import threading
+from typing import Hashable
+
+# ジャーナルを置くディレクトリ　コンテナを作り直しても残るようボリュームをマウントする
+# 空文字の場合はジャーナルを使わない
+JOURNAL_DIR = os.environ.get("JOURNAL_DIR", "/var/lib/discord/journal")
+
+logger = logging.getLogger("OperationJournal")
+
+
+class OperationJournal:
+    """
+    DBに反映する前の操作を記録するローカルのジャーナル（SQLite・WALモード）
+
+    受け付けた操作を処理する前に追記し、DBに反映できたら済みにする（行を削除する）
+    プロセスが途中で終了しても、起動時に済みになっていない操作を読み出して処理し直せる
+    操作は「キーに対して追加／削除」の形で、同じ操作を2回反映しても結果は変わらないため、
+    反映した後・済みにする前に終了した操作をもう一度反映しても問題ない
+    済みにする操作は通し番号で判定するため、1つのファイルを使えるのは1つのプロセスだけとし、
+    他のプロセスが開いている場合はOSErrorを送出する
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        # 他のプロセスの未反映の操作を済みにしたり、反映し直したりしないよう、ファイルを占有する
+        self._lock_file = open(f"{path}.lock", "w")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._lock_file.close()
+            raise
+        # 追記・済みにするのは主にflushのスレッドから行うが、close・flushは他のスレッドからも呼ばれる
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        # WALモードではコミットごとのfsyncを省いても、OSが落ちない限り書き込みは失われない
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS operations ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "key TEXT NOT NULL, "
+            "value INTEGER NOT NULL)"
+        )
+
+        # metrics
+        self.appended = 0
+        self.completed = 0
+
+    def append_many(self, operations: dict[Hashable, bool]) -> int | None:
+        """
+        複数の操作を1つのトランザクションで追記する
+
+        Parameters
+        ----------
+        operations : dict[Hashable, bool]
+            {キー: 追加の場合はTrue}
+
+        Returns
+        -------
+        int | None
+            最後の操作の通し番号　操作がない場合はNone
+        """
+        if len(operations) == 0:
+            return None
+        with self._lock:
+            self._connection.execute("BEGIN")
+            try:
+                self._connection.executemany(
+                    "INSERT INTO operations (key, value) VALUES (?, ?)",
+                    [(json.dumps(key), int(value)) for key, value in operations.items()]
+                )
+                seq = self._connection.execute("SELECT last_insert_rowid()").fetchone()[0]
+                self._connection.execute("COMMIT")
+            except sqlite3.Error:
+                self._connection.execute("ROLLBACK")
+                raise
+        self.appended += len(operations)
+        return seq
+
+    def complete(self, seq: int) -> None:
+        """
+        通し番号がseq以下の操作を済みにする
+
+        Parameters
+        ----------
+        seq : int
+            操作の通し番号
+        """
+        with self._lock:
+            cursor = self._connection.execute("DELETE FROM operations WHERE seq <= ?", (seq,))
+        self.completed += cursor.rowcount
+
+    def pending(self) -> list[tuple[int, Hashable, bool]]:
+        """
+        済みになっていない操作を、追記した順に取得する
+
+        Returns
+        -------
+        list[tuple[int, Hashable, bool]]
+            (通し番号, キー, 追加の場合はTrue)のリスト　JSONの配列のキーはタプルにする
+        """
+        with self._lock:
+            rows = self._connection.execute("SELECT seq, key, value FROM operations ORDER BY seq").fetchall()
+        result: list[tuple[int, Hashable, bool]] = []
+        for seq, key, value in rows:
+            key = json.loads(key)
+            result.append((seq, tuple(key) if isinstance(key, list) else key, bool(value)))
+        return result
+
+    def close(self) -> None:
+        """
+        ジャーナルを閉じる
+        """
+        with self._lock:
+            self._connection.close()
+        self._lock_file.close()
+
+    def stats(self) -> dict:
+        """
+        ジャーナルの統計情報を取得する
+
+        Returns
+        -------
+        dict
+            追記した操作数・済みにした操作数
+        """
+        return {
+            "appended": self.appended,
+            "completed": self.completed,
+        }
+
+
+def open_journal(name: str, instance: str | None = None) -> OperationJournal | None:
+    """
+    JOURNAL_DIRにジャーナルを開く　使えない場合はジャーナルなしで動作するようNoneを返す
+
+    Parameters
+    ----------
+    name : str
+        ジャーナルの名前（ファイル名に使う）
+    instance : str | None
+        ボリュームを共有する複数のプロセスでファイルを分けるための識別子（担当シャードなど）
+        再起動後に同じファイルを開けるよう、再起動しても変わらない値にする
+
+    Returns
+    -------
+    OperationJournal | None
+        ジャーナル
+    """
+    if JOURNAL_DIR == "":
+        return None
+    try:
+        os.makedirs(JOURNAL_DIR, exist_ok=True)
+        file_name = name if instance is None else f"{name}.{instance}"
+        return OperationJournal(os.path.join(JOURNAL_DIR, f"{file_name}.sqlite3"))
+    except (OSError, sqlite3.Error):
+        logger.exception(f"Failed to open journal: {name}")
+        return None
@@ -1,6 +1,6 @@
 from datetime import datetime, UTC
 
-from sqlalchemy import Column, Integer, String, DateTime, BigInteger, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, BigInteger, ForeignKey, Index, UniqueConstraint, text, func
 from sqlalchemy.orm import relationship
 
 from .connection import Base
@@ -8,12 +8,24 @@ from .connection import Base
 
 class Participant(Base):
     __tablename__ = "participants"
+    __table_args__ = (
+        # 削除されていない行のみを対象とした部分インデックス
+        Index("ix_participants_discord_account_id", "discord_account_id",
+              unique=True, postgresql_where=text("deleted_at IS NULL")),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     fullname = Column(String, nullable=False)
     univ_name = Column(String, nullable=True)
     discord_account_id = Column(BigInteger, nullable=False)
 
+    # ギルドのメンバー一覧との突き合わせで保存する、Discord上の表示名・ユーザ名のスナップショット
+    display_name = Column(String, nullable=True)
+    username = Column(String, nullable=True)
+    # ギルドから脱退したことを確認した日時　再加入した場合はNoneに戻す
+    left_at = Column(DateTime, nullable=True)
+    member_synced_at = Column(DateTime, nullable=True)
+
     created_at = Column(DateTime, default=datetime.now(UTC))
     updated_at = Column(DateTime, default=datetime.now(UTC))
     deleted_at = Column(DateTime, nullable=True)
@@ -21,6 +33,10 @@ class Participant(Base):
 
 class ProgressAsk(Base):
     __tablename__ = "progress_asks"
+    __table_args__ = (
+        Index("ix_progress_asks_guild_id_ask_message_id", "guild_id", "ask_message_id",
+              postgresql_where=text("deleted_at IS NULL")),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     guild_id = Column(BigInteger, nullable=False)
@@ -29,8 +45,35 @@ class ProgressAsk(Base):
     summary_channel_id = Column(BigInteger, nullable=False)
     summary_message_id = Column(BigInteger, nullable=False)
 
-    contents = relationship("ProgressAskContents", back_populates="progress_ask")
-    roles = relationship("ProgressAskRoles", back_populates="progress_ask")
+    # 締切（任意）と、実際に締め切られた日時
+    closes_at = Column(DateTime, nullable=True)
+    closed_at = Column(DateTime, nullable=True)
+
+    # 手順のリアクションに使う絵文字（空白区切り）　Noneの場合は既定の絵文字
+    emojis = Column(String, nullable=True)
+
+    # 削除されていない行のみを読み込む
+    contents = relationship(
+        "ProgressAskContents",
+        back_populates="progress_ask",
+        primaryjoin="and_(ProgressAsk.id == ProgressAskContents.progress_ask_id, "
+                    "ProgressAskContents.deleted_at.is_(None))",
+        order_by="ProgressAskContents.id"
+    )
+    roles = relationship(
+        "ProgressAskRoles",
+        back_populates="progress_ask",
+        primaryjoin="and_(ProgressAsk.id == ProgressAskRoles.progress_ask_id, "
+                    "ProgressAskRoles.deleted_at.is_(None))",
+        order_by="ProgressAskRoles.id"
+    )
+    messages = relationship(
+        "ProgressAskMessages",
+        back_populates="progress_ask",
+        primaryjoin="and_(ProgressAsk.id == ProgressAskMessages.progress_ask_id, "
+                    "ProgressAskMessages.deleted_at.is_(None))",
+        order_by="ProgressAskMessages.part_index"
+    )
 
     created_at = Column(DateTime, default=datetime.now(UTC))
     updated_at = Column(DateTime, default=datetime.now(UTC))
@@ -39,6 +82,10 @@ class ProgressAsk(Base):
 
 class ProgressAskContents(Base):
     __tablename__ = "progress_ask_contents"
+    __table_args__ = (
+        Index("ix_progress_ask_contents_progress_ask_id", "progress_ask_id",
+              postgresql_where=text("deleted_at IS NULL")),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     progress_ask_id = Column(Integer, ForeignKey("progress_asks.id"))
@@ -53,6 +100,10 @@ class ProgressAskContents(Base):
 
 class ProgressAskRoles(Base):
     __tablename__ = "progress_ask_roles"
+    __table_args__ = (
+        Index("ix_progress_ask_roles_progress_ask_id", "progress_ask_id",
+              postgresql_where=text("deleted_at IS NULL")),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     progress_ask_id = Column(Integer, ForeignKey("progress_asks.id"))
@@ -63,3 +114,123 @@ class ProgressAskRoles(Base):
     created_at = Column(DateTime, default=datetime.now(UTC))
     updated_at = Column(DateTime, default=datetime.now(UTC))
     deleted_at = Column(DateTime, nullable=True)
+
+
+class ProgressAskMessages(Base):
+    """
+    進捗報告（公開側）の2つ目以降のメッセージ
+
+    手順が絵文字の数より多い進捗報告は、絵文字の数ずつ複数のメッセージに分ける
+    part_index番目のメッセージの手順のindexは part_index * 絵文字の数 から始まる
+    """
+    __tablename__ = "progress_ask_messages"
+    __table_args__ = (
+        Index("ix_progress_ask_messages_progress_ask_id", "progress_ask_id",
+              postgresql_where=text("deleted_at IS NULL")),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    progress_ask_id = Column(Integer, ForeignKey("progress_asks.id"))
+    progress_ask = relationship("ProgressAsk", back_populates="messages")
+
+    message_id = Column(BigInteger, nullable=False)
+    part_index = Column(Integer, nullable=False)
+
+    created_at = Column(DateTime, default=datetime.now(UTC))
+    updated_at = Column(DateTime, default=datetime.now(UTC))
+    deleted_at = Column(DateTime, nullable=True)
+
+
+class ProgressAskReactions(Base):
+    """
+    進捗報告へのリアクション（ユーザごとに完了した手順）
+    """
+    __tablename__ = "progress_ask_reactions"
+    __table_args__ = (
+        UniqueConstraint("progress_ask_id", "user_id", "step_index"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    progress_ask_id = Column(Integer, ForeignKey("progress_asks.id"), nullable=False)
+    user_id = Column(BigInteger, nullable=False)
+    step_index = Column(Integer, nullable=False)
+
+    created_at = Column(DateTime, server_default=func.now())
+
+
+# ------
+# Archive
+# 締め切られた進捗報告の移動先　元のidをそのまま保持する
+# ------
+class ProgressAskArchive(Base):
+    __tablename__ = "progress_asks_archive"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    guild_id = Column(BigInteger, nullable=False)
+    ask_channel_id = Column(BigInteger, nullable=False)
+    ask_message_id = Column(BigInteger, nullable=False)
+    summary_channel_id = Column(BigInteger, nullable=False)
+    summary_message_id = Column(BigInteger, nullable=False)
+    closes_at = Column(DateTime, nullable=True)
+    closed_at = Column(DateTime, nullable=True)
+    emojis = Column(String, nullable=True)
+
+    created_at = Column(DateTime)
+    updated_at = Column(DateTime)
+    deleted_at = Column(DateTime, nullable=True)
+    archived_at = Column(DateTime, server_default=func.now())
+
+
+class ProgressAskContentsArchive(Base):
+    __tablename__ = "progress_ask_contents_archive"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    progress_ask_id = Column(Integer, index=True)
+
+    content = Column(String, nullable=False)
+
+    created_at = Column(DateTime)
+    updated_at = Column(DateTime)
+    deleted_at = Column(DateTime, nullable=True)
+    archived_at = Column(DateTime, server_default=func.now())
+
+
+class ProgressAskRolesArchive(Base):
+    __tablename__ = "progress_ask_roles_archive"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    progress_ask_id = Column(Integer, index=True)
+
+    role_id = Column(BigInteger, nullable=False)
+
+    created_at = Column(DateTime)
+    updated_at = Column(DateTime)
+    deleted_at = Column(DateTime, nullable=True)
+    archived_at = Column(DateTime, server_default=func.now())
+
+
+class ProgressAskMessagesArchive(Base):
+    __tablename__ = "progress_ask_messages_archive"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    progress_ask_id = Column(Integer, index=True)
+
+    message_id = Column(BigInteger, nullable=False)
+    part_index = Column(Integer, nullable=False)
+
+    created_at = Column(DateTime)
+    updated_at = Column(DateTime)
+    deleted_at = Column(DateTime, nullable=True)
+    archived_at = Column(DateTime, server_default=func.now())
+
+
+class ProgressAskReactionsArchive(Base):
+    __tablename__ = "progress_ask_reactions_archive"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    progress_ask_id = Column(Integer, index=True)
+    user_id = Column(BigInteger, nullable=False)
+    step_index = Column(Integer, nullable=False)
+
+    created_at = Column(DateTime)
+    archived_at = Column(DateTime, server_default=func.now())
@@ -0,0 +1,26 @@
+from datetime import datetime
+
+from pydantic import BaseModel, ConfigDict
+
+
+class Participant(BaseModel):
+    """
+    参加者情報のスナップショット
+
+    セッションに紐付かないため、キャッシュに保持してセッション外から参照できる
+    """
+    model_config = ConfigDict(from_attributes=True, frozen=True)
+
+    id: int
+    fullname: str
+    univ_name: str | None
+    discord_account_id: int
+
+    display_name: str | None = None
+    username: str | None = None
+    left_at: datetime | None = None
+    member_synced_at: datetime | None = None
+
+    created_at: datetime | None
+    updated_at: datetime | None
+    deleted_at: datetime | None
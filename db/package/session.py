@@ -1,14 +1,41 @@
 from contextlib import contextmanager
 
-from .connection import SessionLocal
+from sqlalchemy import text
+
+from .connection import READ_STATEMENT_TIMEOUT_MS, get_sessionmaker
 
 
 def db_context():
-    db = SessionLocal()
+    db = get_sessionmaker()()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def read_db_context(replica: bool = True):
+    """
+    読み取り専用のセッションを作成する
+
+    トランザクションを読み取り専用にし、文のタイムアウトを設定するため、
+    一覧・出力などの重い読み取りが書き込みのロックを取ったり、長時間接続を占有したりしない
+    トランザクションの中でcommitすると以降は読み取り専用でなくなるため、書き込みを行う関数には渡さない
+
+    Parameters
+    ----------
+    replica : bool
+        レプリカ（SQLALCHEMY_READ_DATABASE_URL）を使う場合はTrue
+        直前に書き込んだ内容を読む必要がある場合は、レプリカの遅延を避けるためFalseにする
+    """
+    db = get_sessionmaker(read=replica)()
     try:
+        db.execute(text("SET TRANSACTION READ ONLY"))
+        db.execute(text(f"SET LOCAL statement_timeout = {READ_STATEMENT_TIMEOUT_MS}"))
         yield db
     finally:
+        db.rollback()
         db.close()
 
 
 get_db = contextmanager(db_context)
+get_read_db = contextmanager(read_db_context)
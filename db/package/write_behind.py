@@ -0,0 +1,350 @@
+import atexit
+import logging
+import sqlite3
+import threading
+import time
+from typing import Callable, Generic, Hashable, TypeVar
+
+from sqlalchemy.exc import InterfaceError, OperationalError
+from sqlalchemy.orm import Session
+
+from .journal import OperationJournal
+from .session import get_db
+
+K = TypeVar("K", bound=Hashable)
+
+
+class WriteBehindBuffer(Generic[K]):
+    """
+    書き込みをメモリ上に溜め、まとめてDBに反映するバッファ
+
+    キーごとに最後の操作（True: 追加、False: 削除）だけを保持するため、
+    同じキーへの追加と削除が繰り返されても1件の操作にまとまる
+    flush_interval秒ごと、またはmax_operations件溜まった時点で別スレッドからflush_funcを呼び出し、
+    プロセス終了時には残っている操作を全て反映する
+    反映に失敗した場合は間隔を空けて再試行し、max_retries回続けて失敗した場合は操作を分割して反映し直す
+    1件だけでも反映できない操作（外部キー制約違反など）はログに残して破棄し、他の操作を巻き込まないようにする
+    DBに接続できないなど一時的な失敗の場合は、破棄せずに再試行を続ける
+    journalを指定した場合は、受け付けた操作をジャーナルに追記し、DBに反映できたら済みにする
+    putの呼び出し元（イベントループ）でディスクに書き込まないよう、追記はflushとは別のスレッドが
+    journal_interval秒ごとにまとめて1回のコミットで行う（プロセスが異常終了した場合に失われうるのはこの間の操作のみ）
+    起動時にはジャーナルに残っている（前回のプロセスで反映できなかった）操作を読み込んで反映し直す
+    """
+
+    def __init__(
+            self,
+            name: str,
+            flush_func: Callable[[Session, dict[K, bool]], None],
+            flush_interval: float = 0.5,
+            max_operations: int = 500,
+            journal: OperationJournal | None = None,
+            journal_interval: float = 0.02,
+            max_retries: int = 3,
+            retry_backoff: float = 1.0,
+            max_retry_backoff: float = 60.0
+    ) -> None:
+        self.name = name
+        self.flush_func = flush_func
+        self.flush_interval = flush_interval
+        self.max_operations = max_operations
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.max_retry_backoff = max_retry_backoff
+        self.journal = journal
+        self.journal_interval = journal_interval
+        self.logger = logging.getLogger(f"WriteBehindBuffer.{name}")
+
+        self._pending: dict[K, bool] = {}
+        # ジャーナルにまだ追記していない操作
+        self._unjournaled: dict[K, bool] = {}
+        self._condition = threading.Condition()
+        # ジャーナルに追記していない操作があることをジャーナルのスレッドに知らせる
+        self._journal_wakeup = threading.Event()
+        # flushは常に1つのスレッドからのみ行う
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        # ジャーナルに追記した最後の操作の通し番号
+        self._last_seq: int | None = None
+        # 続けて失敗した回数と、次に再試行する時刻（time.monotonic）
+        self._failures = 0
+        self._retry_at = 0.0
+        # 反映中の操作の件数
+        self._in_flight = 0
+
+        # metrics
+        self.replayed = 0
+        self.journal_errors = 0
+        self.received = 0
+        self.flushed = 0
+        self.flush_count = 0
+        self.flush_errors = 0
+        self.retries = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.last_flush_latency = 0.0
+
+        if self.journal is not None:
+            self._replay_journal()
+
+        self._thread = threading.Thread(target=self._run, name=f"write-behind-{name}", daemon=True)
+        self._thread.start()
+        self._journal_thread: threading.Thread | None = None
+        if self.journal is not None:
+            self._journal_thread = threading.Thread(
+                target=self._run_journal, name=f"write-behind-journal-{name}", daemon=True
+            )
+            self._journal_thread.start()
+        atexit.register(self.close)
+
+    def put(self, key: K, add: bool) -> None:
+        """
+        操作を追加する
+
+        Parameters
+        ----------
+        key : K
+            操作対象のキー
+        add : bool
+            追加の場合はTrue、削除の場合はFalse
+        """
+        with self._condition:
+            if self._closed:
+                raise RuntimeError(f"WriteBehindBuffer {self.name} is closed")
+            if self.journal is not None:
+                self._unjournaled[key] = add
+                self._journal_wakeup.set()
+            self._pending[key] = add
+            self.received += 1
+            self.max_depth = max(self.max_depth, len(self._pending))
+            if len(self._pending) >= self.max_operations:
+                self._condition.notify()
+
+    def _replay_journal(self) -> None:
+        # 前回のプロセスで反映できなかった操作を反映待ちに戻す　同じキーは後の操作が優先される
+        try:
+            operations = self.journal.pending()
+        except sqlite3.Error:
+            self.journal_errors += 1
+            self.logger.exception("Failed to read journal")
+            return
+
+        for seq, key, add in operations:
+            self._pending[key] = add
+            self._last_seq = seq
+        self.replayed = len(operations)
+        if self.replayed > 0:
+            self.logger.info(f"Replaying {self.replayed} operations from journal")
+
+    def _run_journal(self) -> None:
+        while True:
+            self._journal_wakeup.wait()
+            # 短い間隔で受け付けた操作を、まとめて1回のコミットで追記する
+            time.sleep(self.journal_interval)
+            with self._condition:
+                self._journal_wakeup.clear()
+                operations, self._unjournaled = self._unjournaled, {}
+                closed = self._closed
+
+            if len(operations) > 0:
+                # 追記できない場合もDBへの反映は続ける
+                try:
+                    seq = self.journal.append_many(operations)
+                except sqlite3.Error:
+                    self.journal_errors += 1
+                    self.logger.exception("Failed to append to journal")
+                else:
+                    with self._condition:
+                        self._last_seq = seq
+            if closed:
+                return
+
+    @property
+    def depth(self) -> int:
+        """
+        反映待ちの操作の件数
+        """
+        return len(self._pending)
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                if not self._closed:
+                    backoff = self._retry_at - time.monotonic()
+                    if backoff > 0:
+                        # 失敗した後は、件数が溜まっていても間隔を空けてから再試行する
+                        self._condition.wait(backoff)
+                    elif len(self._pending) < self.max_operations:
+                        self._condition.wait(self.flush_interval)
+                if self._closed:
+                    return
+            if time.monotonic() >= self._retry_at:
+                self.flush()
+
+    def _apply(self, operations: dict[K, bool]) -> None:
+        with get_db() as db:
+            self.flush_func(db, operations)
+
+    def _apply_split(self, operations: dict[K, bool]) -> dict[K, bool]:
+        """
+        操作を二分しながら反映し、1件でも反映できない操作を破棄する
+
+        Parameters
+        ----------
+        operations : dict[K, bool]
+            反映する操作
+
+        Returns
+        -------
+        dict[K, bool]
+            一時的な失敗により反映できなかった操作
+        """
+        try:
+            self._apply(operations)
+            return {}
+        except (OperationalError, InterfaceError):
+            return operations
+        except Exception:
+            if len(operations) == 1:
+                self.dropped += 1
+                self.logger.exception(f"Dropped operation that cannot be flushed: {operations}")
+                return {}
+
+        items = list(operations.items())
+        middle = len(items) // 2
+        remaining = self._apply_split(dict(items[:middle]))
+        if len(remaining) > 0:
+            # 一時的な失敗の場合は、残りも反映せずに再試行に回す
+            remaining.update(items[middle:])
+            return remaining
+        return self._apply_split(dict(items[middle:]))
+
+    def flush(self) -> None:
+        """
+        反映待ちの操作をDBに反映する
+
+        失敗した場合は、その間に追加された操作を上書きしないようにして反映待ちに戻し、間隔を空けて再試行する
+        max_retries回続けて失敗した場合は、操作を分割して反映し、反映できない操作を破棄する
+        """
+        with self._flush_lock:
+            with self._condition:
+                if len(self._pending) == 0:
+                    return
+                # 通し番号がlast_seq以下の操作は、追記する前に受け付けているため全てoperationsに含まれる
+                # （まだ追記していない操作は、次以降のflushで済みにする）
+                operations, self._pending = self._pending, {}
+                last_seq = self._last_seq
+                self._in_flight = len(operations)
+
+            started_at = time.perf_counter()
+            dropped = self.dropped
+            try:
+                self._apply(operations)
+            except Exception as e:
+                self.flush_errors += 1
+                self._failures += 1
+                self.logger.exception(f"Failed to flush {len(operations)} operations (attempt {self._failures})")
+
+                remaining = operations
+                if self._failures >= self.max_retries and not isinstance(e, (OperationalError, InterfaceError)):
+                    remaining = self._apply_split(operations)
+
+                if len(remaining) > 0:
+                    self.retries += 1
+                    backoff = min(self.retry_backoff * 2 ** (self._failures - 1), self.max_retry_backoff)
+                    self._retry_at = time.monotonic() + backoff
+                    with self._condition:
+                        remaining.update(self._pending)
+                        self._pending = remaining
+                        self._in_flight = 0
+                    return
+
+            self._in_flight = 0
+            self._failures = 0
+            self._retry_at = 0.0
+            self.last_flush_latency = time.perf_counter() - started_at
+            self.flushed += len(operations) - (self.dropped - dropped)
+            self.flush_count += 1
+
+            # 反映した操作はジャーナル上で済みにする　済みにできなくても次回の起動時に反映し直すだけで済む
+            if self.journal is not None and last_seq is not None:
+                try:
+                    self.journal.complete(last_seq)
+                except sqlite3.Error:
+                    self.journal_errors += 1
+                    self.logger.exception("Failed to complete journal operations")
+
+    def close(self, timeout: float | None = None) -> bool:
+        """
+        バッファを閉じ、残っている操作を全て反映する
+
+        反映は別のスレッドで行い、timeoutを指定した場合はその秒数だけ待つ
+        待ちきれなかった場合は反映を続けたまま戻り、未反映の件数をログに残す
+        （ジャーナルを使う場合、反映できなかった操作は次回の起動時に反映し直す）
+
+        Parameters
+        ----------
+        timeout : float | None
+            待つ秒数の上限　Noneの場合は反映が終わるまで待つ
+
+        Returns
+        -------
+        bool
+            待っている間に反映が終わった場合はTrue
+        """
+        with self._condition:
+            if self._closed:
+                return True
+            self._closed = True
+            self._condition.notify()
+            self._journal_wakeup.set()
+        atexit.unregister(self.close)
+
+        finisher = threading.Thread(target=self._finish, name=f"write-behind-close-{self.name}", daemon=True)
+        finisher.start()
+        finisher.join(timeout)
+        if finisher.is_alive():
+            self.logger.warning(
+                f"Timed out closing after {timeout}s; {self.depth + self._in_flight} operations still pending"
+            )
+            # プロセスの終了時には反映が終わるまで待つ
+            atexit.register(finisher.join)
+            return False
+        return True
+
+    def _finish(self) -> None:
+        self._thread.join()
+        if self._journal_thread is not None:
+            self._journal_thread.join()
+        self.flush()
+        if self.depth > 0:
+            self.logger.error(f"Closed with {self.depth} operations not flushed")
+        if self.journal is not None:
+            self.journal.close()
+
+    def stats(self) -> dict:
+        """
+        バッファの統計情報を取得する
+
+        Returns
+        -------
+        dict
+            反映待ちの件数・最大件数・受け付けた操作数・反映した操作数・flush回数・失敗回数・再試行に回した回数・
+            破棄した操作数・直近のflushにかかった秒数、
+            ジャーナルを使う場合は起動時に読み込んだ操作数・ジャーナルの失敗回数
+        """
+        journal_stats = {} if self.journal is None else {
+            "replayed": self.replayed,
+            "journal_errors": self.journal_errors,
+        }
+        return {
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "received": self.received,
+            "flushed": self.flushed,
+            "flushes": self.flush_count,
+            "errors": self.flush_errors,
+            "retries": self.retries,
+            "dropped": self.dropped,
+            "last_flush_ms": round(self.last_flush_latency * 1000, 2),
+            **journal_stats,
+        }
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 
 import discord
@@ -5,6 +6,7 @@ import sentry_sdk
 from discord.ext import commands
 
 from config import bot_config
+from utils import api_stats, role_index, scheduler, startup
 
 logging.basicConfig(
     level=logging.INFO,
@@ -22,15 +24,60 @@ if bot_config.TOKEN is None or bot_config.TOKEN == "":
     exit(0)
 
 # bot init
-bot = commands.Bot(help_command=None,
+bot_options = dict(help_command=None,
                    case_insensitive=True,
                    activity=discord.Game("©Yuki Watanabe"),
                    intents=discord.Intents.all()
                    )
 
+if bot_config.SHARD_COUNT == "":
+    bot = commands.Bot(**bot_options)
+else:
+    # 複数プロセスで動かす場合は、プロセスごとにDISCORD_SHARD_IDSで担当を分ける
+    try:
+        shard_ids = bot_config.parse_shard_ids(bot_config.SHARD_IDS)
+        shard_count = bot_config.parse_shard_count(bot_config.SHARD_COUNT, shard_ids)
+    except ValueError as e:
+        logging.error(f"Invalid sharding config: {e}")
+        exit(1)
+
+    bot = commands.AutoShardedBot(shard_count=shard_count, shard_ids=shard_ids, **bot_options)
+
+# Discord APIの呼び出し状況を記録
+api_stats.install(bot)
+# スラッシュコマンドの実行中はバックグラウンドの処理より優先する
+scheduler.install(bot)
+# ロールの所属メンバーの索引をメンバーのイベントで更新
+role_index.install(bot)
+
 bot.load_extension("cogs.Admin")
 bot.load_extension("cogs.CogManager")
-bot.load_extension("cogs.PersonalInfoAcquirer")
-bot.load_extension("cogs.ProgressAsk")
+bot.load_extension("cogs.JobManager")
+
+# DBを使うCogは、ゲートウェイへの接続と並行してDBの準備をしてから読み込む
+deferred_extensions_loaded = asyncio.Event()
+
+
+async def load_deferred_extensions():
+    try:
+        await asyncio.to_thread(startup.warm_up)
+    except Exception:
+        logging.exception("Failed to warm up")
+
+    for extension in startup.DEFERRED_EXTENSIONS:
+        try:
+            bot.load_extension(extension)
+        except Exception:
+            logging.exception(f"Failed to load {extension}")
+    deferred_extensions_loaded.set()
+
+
+@bot.event
+async def on_connect():
+    # 全てのCogのコマンドが揃ってから同期する（途中で同期すると未読み込みのコマンドが削除される）
+    await deferred_extensions_loaded.wait()
+    await bot.sync_commands()
+
 
+bot.loop.create_task(load_deferred_extensions())
 bot.run(bot_config.TOKEN)
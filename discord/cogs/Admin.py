@@ -7,6 +7,19 @@ class Admin(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
+    def stats(self) -> dict[str, dict]:
+        """
+        /statsに表示する統計情報を取得する
+
+        Returns
+        -------
+        dict[str, dict]
+            {項目名: 統計情報}
+        """
+        if bot_config.owner_notifier is None:
+            return {}
+        return {"owner_notifier": bot_config.owner_notifier.stats()}
+
     @commands.Cog.listener(name="on_ready")
     async def on_ready(self):
         await bot_config.NOTIFY_TO_OWNER(self.bot, "Ready!")
@@ -1,20 +1,126 @@
 import glob
+import json
+import logging
+import os
+import time
 
 import discord
 from discord.commands import Option, slash_command
-from discord.ext import commands
+from discord.ext import commands, tasks
+
+from db.package.crud import participant as participant_crud
+from redis_crud.package.store import get_store
+from utils.api_stats import api_stats, merge_snapshots
+from utils.scheduler import scheduler
+from utils.sharding import get_local_shard_ids, process_label
+
+# 各プロセスの統計情報 {プロセスのラベル: JSON}
+PROCESS_STATS_KEY = "stats:processes"
+# この秒数以上更新されていないプロセスの統計情報は集計しない
+PROCESS_STATS_STALE_AFTER = 120
+
+# Cogのファイルがあるディレクトリ
+COGS_DIR = os.path.dirname(os.path.abspath(__file__))
+# Cogのファイル一覧をキャッシュする秒数
+COG_FILES_TTL = 60
 
 
 class CogManager(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.logger = logging.getLogger(type(self).__name__)
+        self.store = get_store()
+
+        # Cogのファイル一覧（補完のたびにディレクトリを読まないようキャッシュする）
+        self.cog_files: list[str] = []
+        self.cog_files_loaded_at = 0.0
+
+        self.publish_stats_task.start()
+
+    def cog_unload(self):
+        self.publish_stats_task.cancel()
+
+    def collect_process_stats(self) -> dict:
+        """
+        このプロセスの統計情報を集める
+
+        Returns
+        -------
+        dict
+            統計情報
+        """
+        latencies = getattr(self.bot, "latencies", None) or [(self.bot.shard_id or 0, self.bot.latency)]
+        return {
+            "updated_at": time.time(),
+            "shard_ids": get_local_shard_ids(self.bot),
+            "guilds": len(self.bot.guilds),
+            "latencies": {str(shard_id): latency for shard_id, latency in latencies},
+            "api": api_stats.snapshot(),
+        }
+
+    @tasks.loop(seconds=30)
+    async def publish_stats_task(self):
+        """
+        このプロセスの統計情報をStateStoreに書き込み、他のプロセスから集計できるようにする
+        """
+        await self.store.hset(PROCESS_STATS_KEY, process_label(self.bot), json.dumps(self.collect_process_stats()))
+
+    @publish_stats_task.before_loop
+    async def before_publish_stats_task(self):
+        await self.bot.wait_until_ready()
 
     async def autocomplete_loaded_cog_names(self, ctx: discord.commands.context.ApplicationContext):
         return [value for value in self.bot.cogs.keys() if value.startswith(ctx.value)]
 
+    def get_cog_files(self, refresh: bool = False) -> list[str]:
+        """
+        Cogのファイル名（拡張子なし）の一覧を取得する
+
+        Parameters
+        ----------
+        refresh : bool
+            Trueの場合はキャッシュを使わずに読み直す
+
+        Returns
+        -------
+        list[str]
+            ファイル名のリスト
+        """
+        if refresh or time.monotonic() - self.cog_files_loaded_at > COG_FILES_TTL:
+            self.cog_files = sorted(
+                os.path.basename(path).removesuffix(".py") for path in glob.glob(os.path.join(COGS_DIR, "*.py"))
+            )
+            self.cog_files_loaded_at = time.monotonic()
+        return self.cog_files
+
     async def autocomplete_all_cogfile_names(self, ctx: discord.commands.context.ApplicationContext):
-        values = [cog.removeprefix("./app/cogs/").removesuffix(".py") for cog in glob.glob("./app/cogs/*.py")]
-        return [value for value in values if value.startswith(ctx.value)]
+        return [value for value in self.get_cog_files() if value.startswith(ctx.value)]
+
+    async def reload_with_state(self, modulename: str) -> None:
+        """
+        Cogの状態を引き継いでリロードする
+
+        export_state / import_stateを持つCogは、リロード前に処理中の仕事を片付けて状態を書き出し、
+        リロード後のCogに読み込ませる　リロードに失敗した場合も、その時点のCogに読み込ませる
+
+        Parameters
+        ----------
+        modulename : str
+            Cogのモジュール名
+        """
+        cog = self.bot.get_cog(modulename)
+        state = None
+        if callable(getattr(cog, "export_state", None)):
+            started_at = time.perf_counter()
+            state = await cog.export_state()
+            self.logger.info(f"Exported state of {modulename} in {time.perf_counter() - started_at:.2f}s")
+
+        try:
+            self.bot.reload_extension(f"cogs.{modulename}")
+        finally:
+            new_cog = self.bot.get_cog(modulename)
+            if state is not None and callable(getattr(new_cog, "import_state", None)):
+                await new_cog.import_state(state)
 
     @slash_command(name="reload", description="指定したCogをリロードします")
     @commands.is_owner()
@@ -22,7 +128,7 @@ class CogManager(commands.Cog):
                      modulename: Option(str, 'provide cog name', autocomplete=autocomplete_loaded_cog_names)):
         msg = await ctx.respond(f":repeat: Reloading {modulename}")
         try:
-            self.bot.reload_extension(f"cogs.{modulename}")
+            await self.reload_with_state(modulename)
             await msg.edit_original_response(content=":thumbsup: Reloaded")
         except Exception:
             await msg.edit_original_response(content=":exclamation: Failed")
@@ -32,7 +138,8 @@ class CogManager(commands.Cog):
     async def load(self, ctx, modulename: Option(str, 'provide cog name', autocomplete=autocomplete_all_cogfile_names)):
         msg = await ctx.respond(f":arrow_up: Loading {modulename}")
         try:
-            self.bot.load_extention(f"cogs.{modulename}")
+            self.bot.load_extension(f"cogs.{modulename}")
+            self.get_cog_files(refresh=True)
             await msg.edit_original_response(content=":thumbsup: Loaded")
         except Exception:
             await msg.edit_original_response(content=":exclamation: Failed")
@@ -48,6 +155,88 @@ class CogManager(commands.Cog):
         except Exception:
             await msg.edit_original_response(content=":exclamation: Failed")
 
+    @slash_command(name="stats", description="Discord APIの呼び出し状況を表示します")
+    @commands.is_owner()
+    async def stats(self, ctx):
+        # 全プロセスの統計情報を集計する（このプロセスの分は最新の値を使う）
+        processes: dict[str, dict] = {}
+        for label, value in (await self.store.hgetall(PROCESS_STATS_KEY)).items():
+            process_stats = json.loads(value)
+            if time.time() - process_stats["updated_at"] < PROCESS_STATS_STALE_AFTER:
+                processes[label] = process_stats
+        processes[process_label(self.bot)] = self.collect_process_stats()
+
+        snapshot = merge_snapshots([process_stats["api"] for process_stats in processes.values()])
+
+        def format_counter(counter: dict, limit: int = 15) -> str:
+            if len(counter) == 0:
+                return "なし"
+            lines = [f"{count:>6} {key}" for key, count in sorted(counter.items(), key=lambda x: -x[1])[:limit]]
+            return "```\n" + "\n".join(lines) + "\n```"
+
+        paths = sorted(set(snapshot["cache_hits"]) | set(snapshot["fetches"]))
+        access_paths = {
+            path: f"hit {snapshot['cache_hits'].get(path, 0)} / fetch {snapshot['fetches'].get(path, 0)}"
+            for path in paths
+        }
+
+        embed = discord.Embed(
+            title="API Stats",
+            description=f"直近{int(snapshot['window'])}秒間の集計"
+        ).add_field(
+            name="アクセス経路別（キャッシュ / HTTP）",
+            value="```\n" + "\n".join(f"{path}: {v}" for path, v in access_paths.items()) + "\n```"
+            if len(access_paths) > 0 else "なし",
+            inline=False
+        ).add_field(
+            name=f"ルート別リクエスト数（計{sum(snapshot['requests'].values())}）",
+            value=format_counter(snapshot["requests"]),
+            inline=False
+        ).add_field(
+            name="429",
+            value=f"{snapshot['rate_limited']}回 / retry-after計 {snapshot['retry_after_total']:.2f}秒",
+            inline=False
+        ).add_field(
+            name="参加者キャッシュ",
+            value=" / ".join(f"{k}: {v}" for k, v in participant_crud.cache.stats().items()),
+            inline=False
+        ).add_field(
+            name="スケジューラ（優先度別）",
+            value="```\n" + "\n".join(
+                f"{priority}: " + " / ".join(f"{k}: {v}" for k, v in values.items())
+                for priority, values in scheduler.stats().items()
+            ) + "\n```",
+            inline=False
+        )
+
+        # statsメソッドを持つCogの統計情報（このプロセスの分）
+        for cog_name, cog in self.bot.cogs.items():
+            if not callable(getattr(cog, "stats", None)) or cog is self:
+                continue
+            cog_stats = cog.stats()
+            if len(cog_stats) == 0:
+                continue
+            embed.add_field(
+                name=cog_name,
+                value="```\n" + "\n".join(
+                    f"{item}: " + " / ".join(f"{k}: {v}" for k, v in values.items())
+                    for item, values in cog_stats.items()
+                ) + "\n```",
+                inline=False
+            )
+
+        embed.add_field(
+            name=f"プロセス（{len(processes)}）",
+            value="```\n" + "\n".join(
+                f"{label}: guilds {process_stats['guilds']} / latency " + ", ".join(
+                    f"#{shard_id} {latency * 1000:.0f}ms" for shard_id, latency in process_stats["latencies"].items()
+                )
+                for label, process_stats in processes.items()
+            ) + "\n```",
+            inline=False
+        )
+        await ctx.respond(embed=embed, ephemeral=True)
+
 
 def setup(bot):
     return bot.add_cog(CogManager(bot))
@@ -0,0 +1,63 @@
+import discord
+from discord.commands import slash_command
+from discord.ext import commands
+
+from utils.jobs import STATUS_LABELS, job_runner
+
+
+class JobManager(commands.Cog):
+    """
+    管理者コマンドから投入したジョブを確認・キャンセルするためのCog
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+
+    def stats(self) -> dict[str, dict]:
+        """
+        /statsに表示する統計情報を取得する
+
+        Returns
+        -------
+        dict[str, dict]
+            {項目名: 統計情報}
+        """
+        return {"jobs": job_runner.stats()}
+
+    @slash_command(name="jobs", description="ジョブの一覧を表示")
+    @commands.has_permissions(administrator=True)
+    async def jobs(self, ctx: discord.commands.context.ApplicationContext):
+        jobs = job_runner.list_jobs(ctx.guild.id)[:20]
+        if len(jobs) == 0:
+            await ctx.respond("ジョブはありません。", ephemeral=True)
+            return
+
+        await ctx.respond(
+            embed=discord.Embed(
+                title="ジョブ",
+                description="\n".join(
+                    f"#{job.job_id} {job.description}：{STATUS_LABELS[job.status]}"
+                    + (f"（{job.progress}）" if job.progress != "" and job.active else "")
+                    + f"　<@{job.user_id}>"
+                    for job in jobs
+                )
+            ),
+            ephemeral=True
+        )
+
+    @slash_command(name="cancel_job", description="ジョブをキャンセル")
+    @commands.has_permissions(administrator=True)
+    async def cancel_job(
+            self,
+            ctx: discord.commands.context.ApplicationContext,
+            job_id: discord.Option(int, "ジョブID"),
+    ):
+        job = job_runner.cancel(job_id, ctx.guild.id)
+        if job is None:
+            await ctx.respond("待機中・実行中のジョブが見つかりません。", ephemeral=True)
+            return
+        await ctx.respond(f"ジョブ #{job.job_id}（{job.description}）をキャンセルしました。", ephemeral=True)
+
+
+def setup(bot):
+    return bot.add_cog(JobManager(bot))
@@ -1,12 +1,150 @@
-import tempfile
+import asyncio
+import csv
+import io
+import logging
+import time
+from typing import Iterator
 
 import discord
 from discord.commands import slash_command
-from discord.ext import commands
+from discord.ext import commands, tasks
 
 from db.package.crud import participant as participant_crud
-from db.package.models import Participant
-from db.package.session import get_db
+from db.package.schemas import Participant
+from db.package.session import get_db, get_read_db
+from utils.api_stats import api_stats
+from utils.jobs import Job, job_runner
+from utils.role_index import role_index
+from utils.scheduler import RECONCILE, interaction_priority, scheduler
+from utils.sharding import get_local_shard_ids, get_shard_count
+from utils.single_flight import SingleFlight
+from utils.timing import PhaseTimer
+
+# 同じメンバーへの同時のfetchは1回にまとめ、結果を短時間使い回す
+MEMBER_FETCHES: SingleFlight[discord.Member | None] = SingleFlight("member", ttl=10)
+
+
+async def get_or_fetch_member(guild: discord.Guild, user_id: int, path: str) -> discord.Member | None:
+    """
+    メンバーを取得またはfetchする
+
+    Parameters
+    ----------
+    guild : discord.Guild
+        ギルド
+    user_id : int
+        検索対象のユーザID
+    path : str
+        統計情報に記録する呼び出し元の名前
+
+    Returns
+    -------
+    discord.Member | None
+        メンバー　ギルドにいない場合はNone
+    """
+    member = guild.get_member(user_id)
+    if member is not None:
+        api_stats.record_cache_hit(path)
+        return member
+
+    async def fetch() -> discord.Member | None:
+        api_stats.record_fetch(path)
+        try:
+            return await guild.fetch_member(user_id)
+        except discord.NotFound:
+            return None
+
+    return await MEMBER_FETCHES.do((guild.id, user_id), fetch)
+
+
+def register_participant(fullname: str, univ_name: str, discord_account_id: int) -> bool:
+    """
+    参加者情報を登録・更新する
+
+    Parameters
+    ----------
+    fullname : str
+        氏名
+    univ_name : str
+        所属学校名
+    discord_account_id : int
+        DiscordのユーザID
+
+    Returns
+    -------
+    bool
+        登録できた場合はTrue
+    """
+    with get_db() as db:
+        return participant_crud.create_or_update(db, fullname, univ_name, discord_account_id) is not None
+
+
+def iter_participant_csv(data: bytes, errors: list[str], line_numbers: list[int]) -> Iterator[tuple[int, str, str]]:
+    """
+    参加者CSV（DiscordID,氏名,所属学校名）を1行ずつパースする
+
+    パースできない行はerrorsに追加し、yieldした行の行番号はline_numbersに追加する
+
+    Parameters
+    ----------
+    data : bytes
+        CSVファイルの中身
+    errors : list[str]
+        エラーの追加先
+    line_numbers : list[int]
+        yieldした行の行番号の追加先
+
+    Yields
+    ------
+    tuple[int, str, str]
+        (DiscordID, 氏名, 所属学校名)
+    """
+    reader = csv.reader(io.TextIOWrapper(io.BytesIO(data), encoding="utf-8-sig", newline=""))
+    for row in reader:
+        # 空行はスキップ
+        if len(row) == 0 or all(cell.strip() == "" for cell in row):
+            continue
+
+        if len(row) != 3:
+            errors.append(f"{reader.line_num}行目：列数が不正です")
+            continue
+
+        try:
+            discord_account_id = int(row[0].strip())
+        except ValueError:
+            # 1行目はヘッダとみなす
+            if reader.line_num != 1:
+                errors.append(f"{reader.line_num}行目：DiscordIDが不正です")
+            continue
+
+        line_numbers.append(reader.line_num)
+        yield discord_account_id, row[1], row[2]
+
+
+def import_participant_csv(data: bytes) -> tuple[int, list[str]]:
+    """
+    参加者CSVを読み込んでDBに一括登録する
+
+    Parameters
+    ----------
+    data : bytes
+        CSVファイルの中身
+
+    Returns
+    -------
+    tuple[int, list[str]]
+        (登録・更新した件数, エラーのリスト)
+    """
+    errors: list[str] = []
+    line_numbers: list[int] = []
+
+    with get_db() as db:
+        count, invalid_rows = participant_crud.bulk_create_or_update(
+            db, iter_participant_csv(data, errors, line_numbers)
+        )
+
+    errors.extend(f"{line_numbers[index]}行目：{reason}" for index, reason in invalid_rows)
+    return count, errors
 
 
 class PersonalInfoInputModal(discord.ui.Modal):
@@ -22,6 +160,7 @@ class PersonalInfoInputModal(discord.ui.Modal):
         self.add_item(discord.ui.InputText(label="氏名", placeholder="山田太郎"))
         self.add_item(discord.ui.InputText(label="所属学校名", placeholder="〇〇大学"))
 
+    @interaction_priority
     async def callback(self, interaction: discord.Interaction):
         # 入力された情報を取得
         fullname: str | None = self.children[0].value
@@ -31,17 +170,25 @@ class PersonalInfoInputModal(discord.ui.Modal):
             await interaction.response.send_message("入力された情報が不正です。", ephemeral=True)
             return
 
+        # DBの混雑で応答期限を過ぎないよう、先に応答しておく
+        timer = PhaseTimer(logging.getLogger(type(self).__name__), "PersonalInfoInputModal.callback")
+        await interaction.response.defer(ephemeral=True)
+        timer.mark("defer")
+
         # 取得した情報をDBに登録
         # 空白除去等はCRUD側で実施 ／ エラーハンドリングはlistenerで実施する
-        with get_db() as db:
-            # 既に登録されている場合は更新、されていない場合は新規登録
-            # バリデーションエラーが発生した場合はエラーメッセージを表示
-            if participant_crud.create_or_update(db, fullname, univ_name, interaction.user.id) is None:
-                await interaction.response.send_message("情報の登録に失敗しました。", ephemeral=True)
-                return
+        # 既に登録されている場合は更新、されていない場合は新規登録
+        # バリデーションエラーが発生した場合はエラーメッセージを表示
+        registered = await asyncio.to_thread(register_participant, fullname, univ_name, interaction.user.id)
+        timer.mark("db")
 
         # ephemeralでresponse
-        await interaction.response.send_message("参加者情報を登録しました！", ephemeral=True)
+        if registered:
+            await interaction.followup.send("参加者情報を登録しました！", ephemeral=True)
+        else:
+            await interaction.followup.send("情報の登録に失敗しました。", ephemeral=True)
+        timer.mark("followup")
+        timer.log()
 
 
 class AddRoleModal(discord.ui.Modal):
@@ -61,6 +208,7 @@ class AddRoleModal(discord.ui.Modal):
             placeholder="userID,roleID"
         ))
 
+    @interaction_priority
     async def callback(self, interaction: discord.Interaction):
         # csv形式のデータをパース
         raw_csv_data: str | None = self.children[0].value
@@ -69,12 +217,42 @@ class AddRoleModal(discord.ui.Modal):
             await interaction.response.send_message("入力された情報が不正です。", ephemeral=True)
             return
 
+        # 行数に比例して時間がかかるため、先に応答し、ジョブとして実行する
+        await interaction.response.defer(ephemeral=True)
+
+        async def run(job: Job) -> dict:
+            return await self.add_roles(interaction.guild, raw_csv_data, job)
+
+        await job_runner.submit(
+            interaction.followup, "add_roles", interaction.guild.id, interaction.user.id, "ロールの一括追加", run
+        )
+
+    async def add_roles(self, guild: discord.Guild, raw_csv_data: str, job: Job) -> dict:
+        """
+        CSVの行ごとにユーザにロールを追加する
+
+        Parameters
+        ----------
+        guild : discord.Guild
+            ギルド
+        raw_csv_data : str
+            userID,roleID のCSV
+        job : Job
+            進捗を報告するジョブ
+
+        Returns
+        -------
+        dict
+            結果のメッセージ（followup.sendの引数）
+        """
+        timer = PhaseTimer(logging.getLogger(type(self).__name__), "AddRoleModal.add_roles")
         csv_data: list[list[str]] = [line.split(",") for line in raw_csv_data.split("\n")]
 
         errors: list[str] = []
 
         # csvを元にユーザにロールを追加
-        for d in csv_data:
+        for i, d in enumerate(csv_data):
+            job.report(f"{i}/{len(csv_data)}行")
             # データバリデーション
             if len(d) != 2:
                 errors.append(f"不正な行：{d}")
@@ -88,15 +266,9 @@ class AddRoleModal(discord.ui.Modal):
                 continue
 
             # user_idとrole_idからユーザとロールを取得
-            user: discord.Member | None = interaction.guild.get_member(user_id)
-            role: discord.Role | None = interaction.guild.get_role(role_id)
-
             # ユーザが見つからない場合はfetchしてみて、それでも見つからない場合はNone
-            if user is None:
-                try:
-                    user = await interaction.guild.fetch_member(user_id)
-                except discord.NotFound:
-                    user = None
+            user: discord.Member | None = await get_or_fetch_member(guild, user_id, "AddRoleModal.fetch_member")
+            role: discord.Role | None = guild.get_role(role_id)
 
             # ユーザまたはロールが見つからない場合はエラーとする
             if user is None or role is None:
@@ -105,15 +277,17 @@ class AddRoleModal(discord.ui.Modal):
 
             # ユーザにロールを追加
             await user.add_roles(role)
+        job.report(f"{len(csv_data)}/{len(csv_data)}行")
+        timer.mark("add_roles")
+        timer.log(rows=len(csv_data), errors=len(errors))
 
         # エラーがある場合はエラーメッセージを表示
         if len(errors) > 0:
             msg: str = '\n'.join(errors)
-            await interaction.response.send_message(f"一部の値でエラーが発生しました。\n```\n{msg}\n```", ephemeral=True)
+            return {"content": f"一部の値でエラーが発生しました。\n```\n{msg}\n```"}
 
         # エラーがない場合は成功メッセージを表示
-        else:
-            await interaction.response.send_message("ロールを追加しました！", ephemeral=True)
+        return {"content": "ロールを追加しました！"}
 
 
 class PersonalInfoAcquireView(discord.ui.View):
@@ -129,6 +303,7 @@ class PersonalInfoAcquireView(discord.ui.View):
 
     @discord.ui.button(label="参加者情報を入力する",
                        style=discord.ButtonStyle.primary, custom_id="personal_info_acquire:start")
+    @interaction_priority
     async def acquire_button_callback(self, _: discord.ui.Button, interaction: discord.Interaction):
         await interaction.response.send_modal(PersonalInfoInputModal(title="参加者情報入力"))
 
@@ -142,12 +317,89 @@ class PersonalInfoAcquirer(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
+        self.logger = logging.getLogger(type(self).__name__)
+        self.last_member_sync: dict = {}
+
+        # 起動時にon_readyの後で読み込まれた場合やリロード時はon_readyが呼ばれないため、ここで準備する
+        if self.bot.is_ready():
+            self.bot.loop.create_task(self.on_ready())
+
+        self.member_sync_task.start()
+
+    def cog_unload(self):
+        self.member_sync_task.cancel()
+
+    def stats(self) -> dict[str, dict]:
+        """
+        /statsに表示する統計情報を取得する
+
+        Returns
+        -------
+        dict[str, dict]
+            {項目名: 統計情報}
+        """
+        if len(self.last_member_sync) == 0:
+            return {}
+        return {"last_member_sync": self.last_member_sync}
+
+    @tasks.loop(hours=1)
+    async def member_sync_task(self):
+        """
+        参加者をギルドのメンバー一覧と突き合わせ、表示名・ユーザ名のスナップショットと脱退の有無を更新する
+        """
+        try:
+            await self.sync_members()
+        except Exception:
+            self.logger.exception("Failed to sync participants with guild members")
+
+    @member_sync_task.before_loop
+    async def before_member_sync_task(self):
+        await self.bot.wait_until_ready()
+
+    async def sync_members(self) -> None:
+        """
+        このプロセスが担当するギルドのメンバー一覧と参加者を突き合わせる
+
+        メンバー一覧はギルドのキャッシュから取得し、参加者ごとのAPI呼び出しは行わない
+        全てのシャードを担当し、全てのギルドのメンバー一覧を取得済みの場合だけ、見つからない参加者を脱退済みにする
+        """
+        started_at = time.perf_counter()
+        members: dict[int, tuple[str, str]] = {}
+        for guild in self.bot.guilds:
+            for member in guild.members:
+                if not member.bot:
+                    members[member.id] = (member.display_name, member.name)
+
+        mark_left = len(get_local_shard_ids(self.bot)) == get_shard_count(self.bot) \
+            and all(guild.chunked for guild in self.bot.guilds)
+
+        def run() -> tuple[int, int]:
+            with get_db() as db:
+                return participant_crud.sync_members(db, members, mark_left)
+
+        # インタラクションとサマリー更新を優先する
+        async with scheduler.slot(RECONCILE):
+            updated, left = await asyncio.to_thread(run)
+
+        self.last_member_sync = {
+            "members": len(members),
+            "updated": updated,
+            "left": left,
+            "mark_left": mark_left,
+            "seconds": round(time.perf_counter() - started_at, 2),
+        }
+        self.logger.info(f"Participants synced with guild members: {self.last_member_sync}")
 
     @commands.Cog.listener()
     async def on_ready(self):
         # view永続化
         self.bot.add_view(PersonalInfoAcquireView())
 
+        # 参加者キャッシュをまとめて読み込む
+        with get_read_db() as db:
+            count = participant_crud.load_cache(db)
+        self.logger.info(f"Participant cache loaded: {count}")
+
     @slash_command(name="create_personal_info_button", description="参加者情報入力パネルを生成")
     @commands.has_permissions(administrator=True)
     async def create_personal_info_button(self, ctx: discord.commands.context.ApplicationContext):
@@ -162,30 +414,102 @@ class PersonalInfoAcquirer(commands.Cog):
         """
         参加者情報をCSV形式で出力する
         """
-        with get_db() as db:
-            participants: list[Participant] = participant_crud.get_all(db)
+        # 参加者数に比例して時間がかかるため、先に応答しておく
+        timer = PhaseTimer(self.logger, "list_participants")
+        await ctx.defer(ephemeral=True)
+        timer.mark("defer")
+
+        with get_read_db() as db:
+            participants: list[Participant] = participant_crud.get_all_snapshots(db)
+        timer.mark("db")
 
         csv_data: str = "氏名,所属学校名,DiscordID,discord表示名,discordユーザ名\n"
         for participant in participants:
 
             csv_data += f"{participant.fullname},{participant.univ_name},"
 
+            # ギルドのキャッシュにいなければ、定期的な突き合わせで保存したスナップショットを使う
             user: discord.Member | None = ctx.guild.get_member(participant.discord_account_id)
-            if user is None:
-                try:
-                    user = await ctx.guild.fetch_member(participant.discord_account_id)
-                except discord.NotFound:
-                    user = None
-
-            if user is None:
-                csv_data += f"{participant.discord_account_id},不明,不明\n"
+            if user is not None:
+                api_stats.record_cache_hit("list_participants.member")
+                csv_data += f"{participant.discord_account_id},{user.display_name},{user.name}\n"
+            elif participant.left_at is None and participant.username is not None:
+                api_stats.record_cache_hit("list_participants.snapshot")
+                csv_data += f"{participant.discord_account_id},{participant.display_name},{participant.username}\n"
             else:
-                csv_data += f"{participant.discord_account_id},{user.nick},{user.name}\n"
+                csv_data += f"{participant.discord_account_id},不明,不明\n"
+        timer.mark("members")
+
+        await ctx.followup.send(
+            file=discord.File(io.BytesIO(csv_data.encode("utf-8")), filename="participants.csv"),
+            ephemeral=True
+        )
+        timer.mark("followup")
+        timer.log(participants=len(participants))
+
+    @slash_command(name="import_participants", description="参加者情報をCSVから一括登録")
+    @commands.has_permissions(administrator=True)
+    async def import_participants(self,
+                                  ctx: discord.commands.context.ApplicationContext,
+                                  file: discord.Option(discord.Attachment, "DiscordID,氏名,所属学校名 のCSV")
+                                  ):
+        """
+        参加者情報をCSVから一括登録する
+        """
+        await ctx.defer(ephemeral=True)
+
+        async def run(job: Job) -> dict:
+            job.report("ファイルを読み込み中")
+            data: bytes = await file.read()
+            # 書き込みは1トランザクションで行うため、イベントループを止めないよう別スレッドで実行
+            # 書き込みを始めた後にキャンセルした場合も、書き込み自体は最後まで行われる
+            job.report("登録中")
+            count, errors = await asyncio.to_thread(import_participant_csv, data)
+
+            if len(errors) == 0:
+                return {"content": f"{count}件の参加者情報を登録しました！"}
+            return {
+                "content": f"{count}件の参加者情報を登録しました。{len(errors)}件のエラーがあります。",
+                "file": discord.File(io.BytesIO("\n".join(errors).encode("utf-8")), filename="import_errors.txt"),
+            }
+
+        await job_runner.submit(
+            ctx.followup, "import_participants", ctx.guild.id, ctx.author.id, "参加者情報の一括登録", run
+        )
+
+    @slash_command(name="sync_participants", description="参加者情報をギルドのメンバーと突き合わせ")
+    @commands.has_permissions(administrator=True)
+    async def sync_participants(self, ctx: discord.commands.context.ApplicationContext):
+        """
+        定期的に行っているメンバーとの突き合わせを今すぐ行う
+        """
+        await ctx.defer(ephemeral=True)
+
+        async def run(job: Job) -> dict:
+            await self.sync_members()
+            return {"content": " / ".join(f"{k}: {v}" for k, v in self.last_member_sync.items())}
 
-        with tempfile.TemporaryFile("w", encoding="utf-8") as f:
-            f.write(csv_data)
-            f.seek(0)
-            await ctx.respond(file=discord.File(f.name, filename="participants.csv"))
+        await job_runner.submit(
+            ctx.followup, "sync_participants", ctx.guild.id, ctx.author.id, "参加者情報の突き合わせ", run
+        )
+
+    @slash_command(name="delete_participant", description="参加者情報を削除")
+    @commands.has_permissions(administrator=True)
+    async def delete_participant(self,
+                                 ctx: discord.commands.context.ApplicationContext,
+                                 user: discord.Option(discord.User, "削除する参加者")
+                                 ):
+        """
+        参加者情報を論理削除する
+        """
+        with get_db() as db:
+            participant = participant_crud.get(db, user.id)
+            if participant is None:
+                await ctx.respond("参加者情報が見つかりません。", ephemeral=True)
+                return
+            participant_crud.soft_delete(db, participant)
+
+        await ctx.respond(f"{user.mention}の参加者情報を削除しました。", ephemeral=True)
 
     @slash_command(name="add_role", description="ユーザにロールを追加")
     @commands.has_permissions(administrator=True)
@@ -204,13 +528,25 @@ class PersonalInfoAcquirer(commands.Cog):
         """
         未登録ユーザを表示する
         """
-        with get_db() as db:
-            participants: list[Participant] = participant_crud.get_all(db)
-
-        registered_user_ids: list[int] = [p.discord_account_id for p in participants]
-        unregistered_users: list[discord.Member] = [user
-                                                    for user in ctx.guild.members
-                                                    if user.id not in registered_user_ids]
+        # メンバー数に比例して時間がかかるため、先に応答しておく
+        timer = PhaseTimer(self.logger, "list_unregistered_users")
+        await ctx.defer(ephemeral=True)
+        timer.mark("defer")
+
+        with get_read_db() as db:
+            participants: list[Participant] = participant_crud.get_all_snapshots(db)
+        timer.mark("db")
+
+        registered_user_ids: set[int] = {p.discord_account_id for p in participants}
+        # 未登録のメンバーだけをギルドのキャッシュから取得する
+        unregistered_users: list[discord.Member] = [
+            user for user in [
+                ctx.guild.get_member(member_id)
+                for member_id in role_index.guild_member_ids(ctx.guild)
+                if member_id not in registered_user_ids
+            ] if user is not None
+        ]
+        timer.mark("members")
 
         if mode == "csv":
             # csvで出力
@@ -218,18 +554,20 @@ class PersonalInfoAcquirer(commands.Cog):
             for user in unregistered_users:
                 csv_data += f"{user.id},{user.nick},{user.name}\n"
 
-            with tempfile.TemporaryFile("w", encoding="utf-8") as f:
-                f.write(csv_data)
-                f.seek(0)
-                await ctx.respond(file=discord.File(f.name, filename="unregistered_users.csv"))
+            await ctx.followup.send(
+                file=discord.File(io.BytesIO(csv_data.encode("utf-8")), filename="unregistered_users.csv"),
+                ephemeral=True
+            )
 
         elif mode == "mentions":
             # メンションで出力
             msg: str = " ".join([user.mention for user in unregistered_users])
-            await ctx.respond(f"```\n{msg}\n```")
+            await ctx.followup.send(f"```\n{msg}\n```", ephemeral=True)
 
         else:
-            await ctx.respond("不正なモードです。", ephemeral=True)
+            await ctx.followup.send("不正なモードです。", ephemeral=True)
+        timer.mark("followup")
+        timer.log(unregistered=len(unregistered_users))
 
 
 def setup(bot):
@@ -1,12 +1,42 @@
+import asyncio
+import csv
+import hashlib
+import io
+import json
 import logging
 import re
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, UTC
+from typing import NamedTuple
+from zoneinfo import ZoneInfo
 
 import discord
 from discord.commands import slash_command
-from discord.ext import commands
+from discord.ext import commands, tasks
 
+from db.package import models
 from db.package.crud import progress_ask as progress_ask_crud
-from db.package.session import get_db
+from db.package.crud import progress_ask_reaction as progress_ask_reaction_crud
+from db.package.journal import open_journal
+from db.package.session import get_db, get_read_db
+from db.package.write_behind import WriteBehindBuffer
+from redis_crud.package.store import StateStore, get_store
+from utils.api_stats import api_stats
+from utils.jobs import Job, job_runner
+from utils.progress_state import AskProgress, build_masks
+from utils.role_index import role_index
+from utils.scheduler import RECONCILE, REFRESH, interaction_priority, scheduler
+from utils.single_flight import SingleFlight
+from utils.sharding import assigned_shard_label, get_local_shard_ids, get_shard_count, owns_guild, shard_id_for
+from utils.step_emojis import (
+    CUSTOM_EMOJI_PATTERN,
+    MAX_REACTIONS_PER_MESSAGE,
+    StepEmojis,
+    emoji_key,
+    is_unicode_emoji,
+    parse_step_emojis,
+)
 
 INDEXED_REACTIONS: list[str] = [
     "0️⃣",
@@ -22,39 +52,122 @@ INDEXED_REACTIONS: list[str] = [
     "🔟"
 ]
 
+# 1つの進捗確認に登録できる手順の数の上限（ビットマスクをDBのBIGINTで集計するため63まで）
+MAX_STEPS = 60
+
+# プロセス内に保持する進捗状態の数の上限　超えた場合は最も長く使われていない進捗確認から破棄し、
+# 次に必要になった時にDBから読み込み直す
+MAX_LOADED_ASKS = 200
+
+# 同じIDへの同時のfetchは1回にまとめ、結果を短時間使い回す
+# メッセージはリアクションの状態が変わるため、同時のfetchをまとめるだけで結果は使い回さない
+GUILD_FETCHES: SingleFlight[discord.Guild | None] = SingleFlight("guild", ttl=60)
+CHANNEL_FETCHES: SingleFlight[discord.abc.Messageable | None] = SingleFlight("channel", ttl=60)
+MESSAGE_FETCHES: SingleFlight[discord.Message | None] = SingleFlight("message", ttl=0)
+
+# 締切の入力に使うタイムゾーンと書式
+CLOSE_TIME_ZONE = ZoneInfo("Asia/Tokyo")
+CLOSE_TIME_FORMAT = "%Y-%m-%d %H:%M"
+
+# 突き合わせの際、他の処理による進捗状態の読み込みが終わるのを待つ時間の上限（秒）
+RECONCILE_LOAD_WAIT = 30.0
+
+# Cogの終了時に、残っているリアクションの記録の書き込みを待つ時間の上限（秒）
+REACTION_BUFFER_CLOSE_TIMEOUT = 5.0
+
+# 締め切られてからアーカイブテーブルに移動するまでの猶予
+ARCHIVE_AFTER = timedelta(days=1)
+
+# StateStoreのキー
+# サマリーの更新待ちの進捗確認 {"ギルドID:公開側メッセージID"}　シャードIDごとに分ける
+DIRTY_ASKS_KEY_PREFIX = "progress_ask:dirty:"
+# 最後に描画したサマリーのダイジェスト {公開側メッセージID: ダイジェスト}
+SUMMARY_DIGESTS_KEY = "progress_ask:summary_digest"
+
+
+def get_step_emojis(value: str | None) -> StepEmojis:
+    """
+    DBに保存した絵文字からStepEmojisを取得する
+
+    Parameters
+    ----------
+    value : str | None
+        空白区切りの絵文字　Noneの場合は既定の絵文字
+
+    Returns
+    -------
+    StepEmojis
+        手順の絵文字
+    """
+    return parse_step_emojis(value, tuple(INDEXED_REACTIONS))
+
+
+class TrackedAsk(NamedTuple):
+    """
+    追跡中の進捗確認
+    """
+    progress_ask_id: int
+    guild_id: int
+    closes_at: datetime | None
+    # 手順の絵文字（空白区切り）　Noneの場合は既定の絵文字
+    emojis: str | None = None
+    # 進捗確認（公開側）の2つ目以降のメッセージID
+    part_message_ids: tuple[int, ...] = ()
+
+
+class AskLayout(NamedTuple):
+    """
+    進捗確認（公開側）のメッセージの構成
+    """
+    ask_channel_id: int
+    # 1つ目は進捗確認のメッセージID
+    message_ids: list[int]
+    emojis: StepEmojis
+
+    @staticmethod
+    def of(progress_ask: models.ProgressAsk) -> "AskLayout":
+        return AskLayout(
+            progress_ask.ask_channel_id,
+            [progress_ask.ask_message_id] + [message.message_id for message in progress_ask.messages],
+            get_step_emojis(progress_ask.emojis)
+        )
+
 
 class RateLimit:
     """
     レートリミットを管理するクラス
 
     このクラスは、コマンドの実行回数を制限するために使用されます。
+    カウンタはStateStoreに保存されるため、複数のプロセスで共有されます。
     """
-    data = {}
+    # 解放されずに残ったカウンタが消えるまでの秒数
+    TTL = 60
 
-    def __init__(self, name: str, limit: int) -> None:
+    def __init__(self, name: str, limit: int, store: StateStore | None = None) -> None:
         self.name = name
         self.limit = limit
+        self.store = store if store is not None else get_store()
+        self.key = f"rate_limit:{name}"
 
-        if name not in RateLimit.data:
-            RateLimit.data[name] = [limit, 0]
-
-    def acquire(self) -> bool:
+    async def acquire(self) -> bool:
         """
         レートリミットを取得します。
 
         Returns:
             bool: レートリミットが取得できた場合はTrue、それ以外はFalse
         """
-        if RateLimit.data[self.name][1] < RateLimit.data[self.name][0]:
-            RateLimit.data[self.name][1] += 1
+        if await self.store.incr(self.key, 1, ttl=RateLimit.TTL) <= self.limit:
             return True
+        await self.store.incr(self.key, -1, ttl=RateLimit.TTL)
         return False
 
-    def release(self) -> None:
+    async def release(self) -> None:
         """
         レートリミットを解放します。
         """
-        RateLimit.data[self.name][1] -= 1
+        # TTLで消えた後に解放した場合は0に戻す
+        if await self.store.incr(self.key, -1, ttl=RateLimit.TTL) < 0:
+            await self.store.put(self.key, "0", ttl=RateLimit.TTL)
 
 
 class ProgressAskUtil:
@@ -76,12 +189,18 @@ class ProgressAskUtil:
             ギルド　取得できない場合はNone
         """
         guild = bot.get_guild(guild_id)
-        if guild is None:
+        if guild is not None:
+            api_stats.record_cache_hit("get_or_fetch_guild")
+            return guild
+
+        async def fetch() -> discord.Guild | None:
+            api_stats.record_fetch("get_or_fetch_guild")
             try:
-                guild = await bot.fetch_guild(guild_id)
+                return await bot.fetch_guild(guild_id)
             except discord.NotFound:
                 return None
-        return guild
+
+        return await GUILD_FETCHES.do(guild_id, fetch)
 
     @staticmethod
     async def get_or_fetch_channel(guild: discord.Guild, channel_id: int) -> discord.abc.Messageable | None:
@@ -101,15 +220,25 @@ class ProgressAskUtil:
             チャンネル　取得できない場合はNone
         """
         channel = guild.get_channel(channel_id)
-        if channel is None:
+        if channel is not None:
+            api_stats.record_cache_hit("get_or_fetch_channel")
+            return channel
+
+        async def fetch() -> discord.abc.Messageable | None:
+            api_stats.record_fetch("get_or_fetch_channel")
             try:
-                channel = await guild.fetch_channel(channel_id)
+                return await guild.fetch_channel(channel_id)
             except discord.NotFound:
                 return None
-        return channel
+
+        return await CHANNEL_FETCHES.do(channel_id, fetch)
 
     @staticmethod
-    async def get_or_fetch_message(channel: discord.abc.Messageable, message_id: int) -> discord.Message | None:
+    async def get_or_fetch_message(
+            channel: discord.abc.Messageable,
+            message_id: int,
+            fresh: bool = False
+    ) -> discord.Message | None:
         """
         メッセージを取得またはfetchする
 
@@ -119,23 +248,77 @@ class ProgressAskUtil:
             チャンネル
         message_id : int
             検索対象のメッセージID
+        fresh : bool
+            呼び出した時点より後の状態が必要な場合はTrue　実行中のfetchの結果を共有せず、新しくfetchする
 
         Returns
         -------
         discord.Message | None
             メッセージ　取得できない場合はNone
         """
-        try:
-            return await channel.fetch_message(message_id)
-        except discord.NotFound:
-            return None
+        async def fetch() -> discord.Message | None:
+            api_stats.record_fetch("get_or_fetch_message")
+            try:
+                return await channel.fetch_message(message_id)
+            except discord.NotFound:
+                return None
+
+        if fresh:
+            return await fetch()
+        return await MESSAGE_FETCHES.do(message_id, fetch)
+
+    @staticmethod
+    async def fetch_progress_masks(
+            message: discord.Message,
+            emojis: StepEmojis,
+            step_offset: int = 0,
+            masks: dict[int, int] | None = None
+    ) -> dict[int, int]:
+        """
+        メッセージについたリアクションから、メンバーごとの進捗のビットマスクを作成
+
+        リアクションごとにユーザ一覧をfetchするため、進捗確認ごとに初回のみ使用する
+
+        Parameters
+        ----------
+        message : discord.Message
+            進捗確認（公開側）のメッセージ
+        emojis : StepEmojis
+            手順の絵文字
+        step_offset : int
+            このメッセージの最初の手順のindex
+        masks : dict[int, int] | None
+            結果を追加する辞書　Noneの場合は新しく作成する
+
+        Returns
+        -------
+        dict[int, int]
+            {メンバーID: ビットマスク}
+        """
+        if masks is None:
+            masks = {}
+
+        # リアクション種別ごとにfor文を回す
+        for reaction in message.reactions:
+            # リアクションのindexを取得　進捗確認のものでない場合はスキップ
+            index = emojis.index_of(reaction.emoji)
+            if index is None:
+                continue
+            index += step_offset
+
+            api_stats.record_fetch("fetch_progress_masks.reaction_users")
+            async for user in reaction.users():
+                if user.bot:
+                    continue
+                masks[user.id] = masks.get(user.id, 0) | (1 << index)
+
+        return masks
 
     @staticmethod
-    async def create_progress_summary_embed(
+    def create_progress_summary_embed(
             guild: discord.Guild,
             role_ids: list[int],
-            reactions: list[discord.Reaction],
-            progress_cnt: int
+            progress: AskProgress
     ) -> discord.Embed:
         """
         進捗確認（非公開側）用のEmbedを作成
@@ -146,132 +329,133 @@ class ProgressAskUtil:
             ギルド
         role_ids : list[int]
             カテゴライズ対象のロールIDのリスト
-        reactions : list[discord.Reaction]
-            メッセージについたリアクションのリスト
-        progress_cnt : int
-            進捗の数
+        progress : AskProgress
+            進捗確認の進捗状態
 
         Returns
         -------
         discord.Embed
             進捗確認用のEmbed
         """
-        roles: list[discord.Role] = [guild.get_role(role_id) for role_id in role_ids]
-
-        # {ロール名: {メンション: [進捗のindex]}} の形式で進捗データを作成
-        progress_data: dict[str, dict[str, list[int]]] = {
-            role.name: {
-                member.mention: []
-                for member in role.members
-            } for role in roles
-        }
-
-        guild_members: dict[int, discord.Member] = {
-            member.id: member for member in guild.members if not member.bot}
-
-        # リアクション種別ごとにfor文を回す
-        for reaction in reactions:
-            # リアクションが進捗確認のものでない場合はスキップ
-            if not ProgressAskUtil.is_indexed_reaction(reaction.emoji):
-                continue
-
-            # リアクションのindexを取得
-            index = ProgressAskUtil.get_index(reaction.emoji)
-
-            users = await reaction.users().flatten()
+        roles: list[discord.Role] = [
+            role for role in [guild.get_role(role_id) for role_id in role_ids] if role is not None
+        ]
 
-            # ユーザごとにfor文を回す
-            for user in users:
-                if user.id not in guild_members.keys():
-                    continue
+        # ロールごとに進捗確認を作成
+        # 変化のない行・フィールドはAskProgressのキャッシュを使う
+        fields = progress.render_fields([
+            (role.id, role.name, role_index.member_ids(guild, role.id)) for role in roles
+        ])
 
-                member = guild_members[user.id]
-                # 対象ロールごとに回す
-                for role in roles:
-                    # ユーザが対象ロールに所属している場合
-                    if role in member.roles:
-                        if member.mention not in progress_data[role.name]:
-                            progress_data[role.name][member.mention] = []
-                        progress_data[role.name][member.mention].append(index)
-
-        # indexを昇順にソート
-        for role in progress_data:
-            for member in progress_data[role]:
-                progress_data[role][member].sort()
-
-        # 進捗確認のEmbedを作成
+        # 進捗確認のEmbedを作成　ロールごとの完了人数を先頭に表示する
         embed = discord.Embed(
-            title="進捗確認"
+            title="進捗確認",
+            description=progress.render_counts([(role.id, role.name) for role in roles])
         )
 
-        # ロールごとに進捗確認を追加
-        for role_name, user_data in progress_data.items():
+        for name, value in fields:
             embed.add_field(
-                name=f"**【{role_name}】**",
-                value="\n".join([
-                    f"**{user}**\n{' '.join([ProgressAskUtil.get_reaction(i) if i in indexes else '❌' for i in range(progress_cnt)])}\n"
-                    for user, indexes in user_data.items()
-                ]),
+                name=name,
+                value=value,
                 inline=True
             )
 
         return embed
 
     @staticmethod
-    def get_reaction(index: int) -> str | None:
+    def parse_close_time(value: str) -> datetime | None:
         """
-        indexに対応するリアクションを取得
+        締切の入力をパースする
 
         Parameters
         ----------
-        index : int
-            リアクションのindex
+        value : str
+            "YYYY-MM-DD HH:MM"形式（日本時間）の文字列　空文字の場合は締切なし
 
         Returns
         -------
-        str | None
-            リアクション ない場合はNone
+        datetime | None
+            UTCの締切　締切なしの場合はNone
+
+        Raises
+        ------
+        ValueError
+            書式が不正な場合
         """
-        if index >= len(INDEXED_REACTIONS):
+        value = value.strip()
+        if value == "":
             return None
-        return INDEXED_REACTIONS[index]
+        return datetime.strptime(value, CLOSE_TIME_FORMAT).replace(tzinfo=CLOSE_TIME_ZONE).astimezone(UTC)
 
     @staticmethod
-    def get_index(reaction: str) -> int | None:
+    def as_utc(value: datetime | None) -> datetime | None:
         """
-        リアクションに対応するindexを取得
+        DBから読み込んだ（タイムゾーンなし・UTCの）日時をUTCのawareなdatetimeにする
 
         Parameters
         ----------
-        reaction : str
-            リアクション
+        value : datetime | None
+            日時
 
         Returns
         -------
-        int | None
-            index ない場合はNone
+        datetime | None
+            UTCの日時
         """
-        if reaction not in INDEXED_REACTIONS:
-            return None
-
-        return INDEXED_REACTIONS.index(reaction)
+        if value is None or value.tzinfo is not None:
+            return value
+        return value.replace(tzinfo=UTC)
 
-    @staticmethod
-    def is_indexed_reaction(reaction: str) -> bool:
-        """
-        リアクションが進捗確認のものか判定
 
-        Parameters
-        ----------
-        reaction : str
-            リアクション
+def export_progress_matrix_csv(
+        progress_ask_id: int,
+        contents: list[str],
+        member_roles: dict[int, list[str]]
+) -> io.BytesIO:
+    """
+    進捗確認のメンバー×手順の進捗をCSVに書き出す
+
+    DBから1行ずつ読み込みながら書き出すため、メンバー数が多くてもメモリ上にまとめて保持しない
+
+    Parameters
+    ----------
+    progress_ask_id : int
+        進捗確認のID
+    contents : list[str]
+        手順の内容のリスト
+    member_roles : dict[int, list[str]]
+        {メンバーID: 所属している対象ロール名のリスト}（ギルドのキャッシュから作成する）
+
+    Returns
+    -------
+    io.BytesIO
+        UTF-8（BOM付き）のCSV
+    """
+    buffer = io.BytesIO()
+    writer_stream = io.TextIOWrapper(buffer, encoding="utf-8-sig", newline="")
+    writer = csv.writer(writer_stream)
+    writer.writerow(
+        ["DiscordID", "氏名", "所属学校名", "ロール"]
+        + [f"{i + 1}. {content}" for i, content in enumerate(contents)]
+        + ["完了数"]
+    )
+
+    # 直前に書き込んだリアクションを読むため、レプリカではなくプライマリから読む
+    with get_read_db(replica=False) as db:
+        for user_id, fullname, univ_name, mask in progress_ask_reaction_crud.iter_matrix(
+                db, progress_ask_id, list(member_roles)
+        ):
+            steps = [mask >> i & 1 for i in range(len(contents))]
+            writer.writerow(
+                [str(user_id), fullname or "", univ_name or "", " ".join(member_roles.get(user_id, []))]
+                + steps
+                + [sum(steps)]
+            )
 
-        Returns
-        -------
-        bool
-            進捗確認のリアクションかどうか
-        """
-        return reaction in INDEXED_REACTIONS
+    writer_stream.flush()
+    writer_stream.detach()
+    buffer.seek(0)
+    return buffer
 
 
 class ProgressAskCreateModal(discord.ui.Modal):
@@ -291,7 +475,65 @@ class ProgressAskCreateModal(discord.ui.Modal):
             label="手順",
             placeholder="１行に１つずつ手順を記入してください。"
         ))
+        self.add_item(discord.ui.InputText(
+            style=discord.InputTextStyle.short,
+            label="締切（任意・日本時間）",
+            placeholder="2024-08-31 23:59",
+            required=False
+        ))
+        self.add_item(discord.ui.InputText(
+            style=discord.InputTextStyle.short,
+            label="リアクション（任意・空白区切り）",
+            placeholder="✅ 🔥 123456789012345678（カスタム絵文字はIDでも可）",
+            required=False
+        ))
+
+    @staticmethod
+    def parse_emojis(guild: discord.Guild, value: str) -> list[str] | None:
+        """
+        入力されたリアクションの絵文字をパースする
+
+        Parameters
+        ----------
+        guild : discord.Guild
+            ギルド（カスタム絵文字の検索に使う）
+        value : str
+            空白区切りの絵文字　カスタム絵文字は<:name:id>またはIDで指定する
+
+        Returns
+        -------
+        list[str] | None
+            絵文字のリスト　空の場合はNone（既定の絵文字を使う）
 
+        Raises
+        ------
+        ValueError
+            絵文字でないもの・ギルドにないカスタム絵文字・重複・数の超過がある場合
+        """
+        tokens = value.split()
+        if len(tokens) == 0:
+            return None
+
+        emojis: list[str] = []
+        for token in tokens:
+            # リアクションを付けられないものは、メッセージを送信する前にここで弾く
+            custom_emoji = CUSTOM_EMOJI_PATTERN.fullmatch(token)
+            if token.isdecimal() or custom_emoji is not None:
+                emoji = guild.get_emoji(int(token if custom_emoji is None else custom_emoji.group(1)))
+                if emoji is None:
+                    raise ValueError(f"カスタム絵文字が見つかりません：{token}")
+                token = str(emoji)
+            elif not is_unicode_emoji(token):
+                raise ValueError(f"絵文字ではありません：{token}")
+            emojis.append(token)
+
+        if len(emojis) > MAX_REACTIONS_PER_MESSAGE:
+            raise ValueError(f"リアクションは{MAX_REACTIONS_PER_MESSAGE}個までしか指定できません。")
+        if len({emoji_key(emoji) for emoji in emojis}) != len(emojis):
+            raise ValueError("同じリアクションが重複しています。")
+        return emojis
+
+    @interaction_priority
     async def callback(self, interaction: discord.Interaction):
         # ベースメッセージを取得
         base_message = interaction.message
@@ -302,28 +544,59 @@ class ProgressAskCreateModal(discord.ui.Modal):
         title = self.children[0].value
         contents = self.children[1].value.split("\n")
 
-        if len(contents) > 10:
-            await interaction.response.send_message("進捗確認の手順は10個までしか登録できません。", ephemeral=True)
+        if len(contents) > MAX_STEPS:
+            await interaction.response.send_message(
+                f"進捗確認の手順は{MAX_STEPS}個までしか登録できません。", ephemeral=True)
+            return
+
+        try:
+            closes_at = ProgressAskUtil.parse_close_time(self.children[2].value or "")
+        except ValueError:
+            await interaction.response.send_message(
+                f"締切は {CLOSE_TIME_FORMAT.replace('%', '')} の形式で入力してください。", ephemeral=True)
+            return
+
+        try:
+            custom_emojis = self.parse_emojis(interaction.guild, self.children[3].value or "")
+        except ValueError as e:
+            await interaction.response.send_message(str(e), ephemeral=True)
             return
+        emojis_value = " ".join(custom_emojis) if custom_emojis is not None else None
+        emojis = get_step_emojis(emojis_value)
 
         ask_channel = interaction.guild.get_channel(ask_channel_id)
+        if ask_channel is None:
+            await interaction.response.send_message("進捗確認を送信するチャンネルが見つかりません。", ephemeral=True)
+            return
+
+        # 手順が絵文字の数より多い場合は、絵文字の数ずつメッセージを分ける
+        parts = [contents[i:i + len(emojis)] for i in range(0, len(contents), len(emojis))]
+        part_titles = [
+            "手順" if len(parts) == 1 else f"手順（{part_index + 1}/{len(parts)}）"
+            for part_index in range(len(parts))
+        ]
+        part_ask_contents = [
+            "\n".join(f"{emojis.for_step(index)} {content}" for index, content in enumerate(part))
+            for part in parts
+        ]
 
         # 進捗確認を作成
-        ask_contents = [
-            f"{ProgressAskUtil.get_reaction(index)} {content}"
-            for index, content in enumerate(contents)
+        ask_messages = [
+            await ask_channel.send(
+                content="進捗確認を作成中......",
+            )
+            for _ in parts
         ]
-        ask_message = await ask_channel.send(
-            content="進捗確認を作成中......",
-        )
+        ask_message = ask_messages[0]
         summary_message = await interaction.channel.send(
             content="進捗確認を作成中......",
         )
         await interaction.response.send_message("進捗確認を作成します", ephemeral=True)
 
         # 進捗確認を作成
+        part_message_ids = [message.id for message in ask_messages[1:]]
         with get_db() as db:
-            progress_ask_crud.create(
+            progress_ask = progress_ask_crud.create(
                 db,
                 guild_id=interaction.guild.id,
                 ask_channel_id=ask_message.channel.id,
@@ -331,41 +604,57 @@ class ProgressAskCreateModal(discord.ui.Modal):
                 summary_channel_id=summary_message.channel.id,
                 summary_message_id=summary_message.id,
                 role_ids=role_ids,
-                contents=contents
+                contents=contents,
+                closes_at=closes_at,
+                emojis=emojis_value,
+                part_message_ids=part_message_ids
+            )
+            progress_ask_id = progress_ask.id
+
+        # 追跡対象に追加
+        cog = interaction.client.get_cog("ProgressAsk")
+        if cog is not None:
+            cog.track(ask_message.id, TrackedAsk(
+                progress_ask_id, interaction.guild.id, closes_at, emojis_value, tuple(part_message_ids)
+            ))
+
+        for message, part_title, ask_contents in zip(ask_messages, part_titles, part_ask_contents):
+            await message.edit(
+                content="## 【進捗確認】",
+                embed=discord.Embed(
+                    title=title,
+                ).add_field(
+                    name=part_title,
+                    value=ask_contents,
+                    inline=False
+                )
             )
 
-        await ask_message.edit(
-            content="## 【進捗確認】",
-            embed=discord.Embed(
-                title=title,
-            ).add_field(
-                name="手順",
-                value="\n".join(ask_contents),
+        header_embed = discord.Embed(
+            title=title,
+        )
+        for part_title, ask_contents in zip(part_titles, part_ask_contents):
+            header_embed.add_field(
+                name=part_title,
+                value=ask_contents,
                 inline=False
             )
-        )
 
         await summary_message.edit(
             content="## 【進捗チェック】",
             embeds=[
-                discord.Embed(
-                    title=title,
-                ).add_field(
-                    name="手順",
-                    value="\n".join(ask_contents),
-                    inline=False
-                ),
-                await ProgressAskUtil.create_progress_summary_embed(
+                header_embed,
+                ProgressAskUtil.create_progress_summary_embed(
                     interaction.guild,
                     role_ids,
-                    [],
-                    len(contents)
+                    AskProgress(len(contents), emojis.for_step)
                 )
             ]
         )
 
-        for index in range(len(contents)):
-            await ask_message.add_reaction(ProgressAskUtil.get_reaction(index))
+        for message, part in zip(ask_messages, parts):
+            for index in range(len(part)):
+                await message.add_reaction(emojis.for_step(index))
 
 
 class ProgressAskBaseView(discord.ui.View):
@@ -373,6 +662,7 @@ class ProgressAskBaseView(discord.ui.View):
         super().__init__(timeout=None)
 
     @discord.ui.button(label="進捗確認を作成する", style=discord.ButtonStyle.primary, custom_id="progress_ask:create")
+    @interaction_priority
     async def create_progress_ask(self, _: discord.ui.Button, interaction: discord.Interaction):
         await interaction.response.send_modal(modal=ProgressAskCreateModal())
 
@@ -381,10 +671,464 @@ class ProgressAsk(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.logger = logging.getLogger(type(self).__name__)
+        self.store = get_store()
+
+        # 追跡中（締め切られていない）の進捗確認　{公開側メッセージID: TrackedAsk}
+        # StateStoreの内容をプロセス内にも保持し、リアクションごとの判定はこちらで行う
+        self.tracked_asks: dict[int, TrackedAsk] = {}
+        # 追跡中の進捗確認の公開側メッセージ　{メッセージID: (進捗確認のメッセージID, メッセージの順番)}
+        self.message_parts: dict[int, tuple[int, int]] = {}
+
+        # 進捗状態と描画キャッシュ　{公開側メッセージID: AskProgress}　最近使ったものほど後ろ
+        self.progress: OrderedDict[int, AskProgress] = OrderedDict()
+        # 上限により破棄した進捗確認の公開側メッセージID　次はDiscordではなくDBから読み込む
+        self.evicted: set[int] = set()
+
+        # 起動時・再接続時の突き合わせ
+        self.reconcile_job: asyncio.Task | None = None
+        self.last_reconcile: dict = {}
+
+        # リアクションの記録はまとめてDBに書き込む
+        # 再起動で失われないよう、書き込むまではローカルのジャーナルにも記録し、起動時に書き込み直す
+        self.reaction_buffer: WriteBehindBuffer[tuple[int, int, int]] = WriteBehindBuffer(
+            "progress_ask_reactions",
+            progress_ask_reaction_crud.apply_operations,
+            journal=open_journal("progress_ask_reactions", assigned_shard_label(self.bot))
+        )
+        # 起動時にon_readyの後で読み込まれた場合やリロード時はon_readyが呼ばれないため、ここで準備する
+        # 引き継いだ状態がある場合はimport_stateで取り消す
+        self.load_job: asyncio.Task | None = None
+        if self.bot.is_ready():
+            self.load_job = self.bot.loop.create_task(self.on_ready())
+
+        self.archive_task.start()
+        self.refresh_task.start()
+
+    def cog_unload(self):
+        self.archive_task.cancel()
+        self.refresh_task.cancel()
+        if self.reconcile_job is not None:
+            self.reconcile_job.cancel()
+        # 残っているリアクションの記録を全て書き込む
+        # イベントループを止める時間を抑えるため、待つのはREACTION_BUFFER_CLOSE_TIMEOUT秒までとし、
+        # 書き込みきれなかった分はバッファのスレッドが続けて書き込む（ジャーナルからも起動時に反映し直す）
+        self.reaction_buffer.close(timeout=REACTION_BUFFER_CLOSE_TIMEOUT)
+
+    async def export_state(self) -> dict:
+        """
+        リロード後のCogに引き継ぐ状態を書き出す
+
+        処理中のサマリー更新を待ち、反映待ちのリアクションをDBに書き込んでから書き出す
+        更新待ちの進捗確認・レートリミット・サマリーのダイジェストはStateStoreにあるため、そのまま引き継がれる
+
+        Returns
+        -------
+        dict
+            引き継ぐ状態
+        """
+        # 処理中の周期が終わるまで待ち、以降のサマリー更新は止める
+        self.refresh_task.stop()
+        refresh_job = self.refresh_task.get_task()
+        if refresh_job is not None and not refresh_job.done():
+            await asyncio.wait({refresh_job}, timeout=10)
+
+        await asyncio.to_thread(self.reaction_buffer.flush)
+
+        # 突き合わせは中断し、リロード後にやり直す
+        reconcile_pending = self.reconcile_job is not None and not self.reconcile_job.done()
+        if reconcile_pending:
+            self.reconcile_job.cancel()
+
+        return {
+            "tracked_asks": dict(self.tracked_asks),
+            "progress": OrderedDict(self.progress),
+            "evicted": set(self.evicted),
+            "last_reconcile": self.last_reconcile,
+            "reconcile_pending": reconcile_pending,
+        }
+
+    async def import_state(self, state: dict) -> None:
+        """
+        リロード前のCogが書き出した状態を引き継ぐ
+
+        Parameters
+        ----------
+        state : dict
+            export_stateで書き出した状態
+        """
+        if self.load_job is not None:
+            self.load_job.cancel()
+
+        self.set_tracked_asks(state["tracked_asks"])
+        self.progress = OrderedDict(state["progress"])
+        self.evicted = state.get("evicted", set())
+        self.last_reconcile = state["last_reconcile"]
+
+        # リロードに失敗して同じCogに戻した場合、止めたサマリー更新を再開する
+        if not self.refresh_task.is_running():
+            self.refresh_task.start()
+        if state["reconcile_pending"]:
+            self.start_reconcile("reload")
+
+    def stats(self) -> dict[str, dict]:
+        """
+        /statsに表示する統計情報を取得する
+
+        Returns
+        -------
+        dict[str, dict]
+            {項目名: 統計情報}
+        """
+        render_stats: dict[str, int] = {}
+        memory: dict[int, int] = {}
+        for ask_message_id, progress in self.progress.items():
+            for key, value in progress.stats().items():
+                render_stats[key] = render_stats.get(key, 0) + value
+            memory[ask_message_id] = progress.memory_usage()
+
+        largest = sorted(memory.items(), key=lambda item: item[1], reverse=True)[:3]
+        return {
+            "tracked_asks": {
+                "count": len(self.tracked_asks),
+                "loaded": len(self.progress),
+                "evicted": len(self.evicted),
+                "max_loaded": MAX_LOADED_ASKS,
+            },
+            "summary_render": render_stats,
+            "progress_memory": {
+                "total_kb": sum(memory.values()) // 1024,
+                **{f"ask {ask_message_id}_kb": size // 1024 for ask_message_id, size in largest},
+            },
+            "reaction_buffer": self.reaction_buffer.stats(),
+            "role_index": role_index.stats(),
+            "fetches": {
+                f"{flight.name} {key}": value
+                for flight in (GUILD_FETCHES, CHANNEL_FETCHES, MESSAGE_FETCHES)
+                for key, value in flight.stats().items()
+            },
+            "last_reconcile": self.last_reconcile,
+        }
 
     @commands.Cog.listener()
     async def on_ready(self):
         self.bot.add_view(ProgressAskBaseView())
+        await self.load_tracked_asks()
+        self.start_reconcile("ready")
+
+    @commands.Cog.listener()
+    async def on_resumed(self):
+        self.start_reconcile("resumed")
+
+    def start_reconcile(self, reason: str) -> None:
+        """
+        突き合わせをバックグラウンドで開始する　実行中の場合は何もしない
+
+        Parameters
+        ----------
+        reason : str
+            開始した理由（ログ用）
+        """
+        if self.reconcile_job is not None and not self.reconcile_job.done():
+            return
+        self.reconcile_job = self.bot.loop.create_task(self.reconcile_all(reason))
+
+    async def reconcile_all(self, reason: str) -> None:
+        """
+        追跡中の全ての進捗確認について、Discord上のリアクションとDBの記録を突き合わせる
+
+        停止中・切断中に付けられたリアクションを反映し、変化のあった進捗確認だけサマリーを更新する
+
+        Parameters
+        ----------
+        reason : str
+            開始した理由（ログ用）
+        """
+        started_at = time.perf_counter()
+        requests_before = api_stats.total_requests
+
+        # 同時に処理する数はスケジューラで制限し、インタラクションとサマリー更新を優先する
+        async def run(ask_message_id: int, tracked_ask: TrackedAsk) -> bool:
+            async with scheduler.slot(RECONCILE):
+                try:
+                    return await self.reconcile_ask(ask_message_id, tracked_ask)
+                except Exception:
+                    self.logger.exception(f"Failed to reconcile progress ask: {ask_message_id}")
+                    return False
+
+        results = await asyncio.gather(*[
+            run(ask_message_id, tracked_ask) for ask_message_id, tracked_ask in list(self.tracked_asks.items())
+        ])
+
+        self.last_reconcile = {
+            "reason": reason,
+            "asks": len(results),
+            "changed": sum(results),
+            "seconds": round(time.perf_counter() - started_at, 2),
+            # 同時に行われた他の処理のリクエストも含む
+            "api_calls": api_stats.total_requests - requests_before,
+        }
+        self.logger.info(f"Reconciled progress asks: {self.last_reconcile}")
+
+    async def reconcile_ask(self, ask_message_id: int, tracked_ask: TrackedAsk) -> bool:
+        """
+        進捗確認1件について、Discord上のリアクションとDBの記録・プロセス内の進捗状態を突き合わせる
+
+        Parameters
+        ----------
+        ask_message_id : int
+            進捗確認（公開側）のメッセージID
+        tracked_ask : TrackedAsk
+            進捗確認の情報
+
+        Returns
+        -------
+        bool
+            差分があった場合はTrue
+        """
+        # DBの記録との差分を書き込むため、レプリカの遅延の影響を受けないようプライマリから読む
+        with get_read_db(replica=False) as db:
+            progress_ask = progress_ask_crud.get(db, tracked_ask.guild_id, ask_message_id)
+            if progress_ask is None:
+                return False
+            ask_contents_len = len(progress_ask.contents)
+            layout = AskLayout.of(progress_ask)
+            stored = progress_ask_reaction_crud.get_by_ask(db, tracked_ask.progress_ask_id)
+
+        guild = await ProgressAskUtil.get_or_fetch_guild(self.bot, tracked_ask.guild_id)
+        if guild is None:
+            return False
+
+        progress = self.get_or_create_progress(ask_message_id, ask_contents_len, layout)
+        # サマリー更新などで読み込み中の場合は、終わるまで待つ
+        # 並行して読み込むと取得中に受け取ったリアクションの記録が失われ、古い状態をDBに書き込んでしまう
+        waited = 0.0
+        while progress.loading:
+            if waited >= RECONCILE_LOAD_WAIT:
+                self.logger.warning(f"Skipped reconciling progress ask {ask_message_id}: still loading")
+                return False
+            await asyncio.sleep(0.5)
+            waited += 0.5
+            progress = self.get_or_create_progress(ask_message_id, ask_contents_len, layout)
+        before = dict(progress.masks) if progress.loaded else None
+
+        # 取得中に受け取ったリアクションは、取得後に適用し直す
+        progress.begin_load()
+        try:
+            masks = await self.fetch_ask_masks(guild, layout)
+            if masks is None:
+                return False
+            progress.load(masks)
+            self.evicted.discard(ask_message_id)
+        finally:
+            progress.loading = False
+
+        # DBの記録との差分を書き込む
+        # 取得中に受け取ったリアクションを適用し直した後の状態と比べるため、書き込む操作が新しい操作を上書きすることはない
+        masks = progress.masks
+        stored_masks = build_masks(stored)
+
+        db_changed = False
+        for user_id in set(masks) | set(stored_masks):
+            diff = masks.get(user_id, 0) ^ stored_masks.get(user_id, 0)
+            for step_index in range(diff.bit_length()):
+                if diff >> step_index & 1:
+                    self.reaction_buffer.put(
+                        (tracked_ask.progress_ask_id, user_id, step_index),
+                        bool(masks.get(user_id, 0) >> step_index & 1)
+                    )
+                    db_changed = True
+
+        # プロセス内の進捗状態が変わった場合（初回読み込みを含む）はサマリーを更新する
+        changed = db_changed or before != progress.masks
+        if changed:
+            await self.mark_dirty(tracked_ask.guild_id, ask_message_id)
+        return changed
+
+    async def load_tracked_asks(self) -> None:
+        """
+        追跡中の進捗確認を読み込む
+
+        StateStoreは複数のプロセスで共有するため、他のプロセスの担当分が混ざったり、自分の担当分が欠けたりする
+        そのため常にDBの有効な進捗確認から、このプロセスが担当するシャードのものだけを読み込む
+        """
+        with get_db() as db:
+            active_index = progress_ask_crud.get_active_index(db)
+
+        self.set_tracked_asks({})
+        for progress_ask_id, guild_id, ask_message_id, closes_at, emojis, part_message_ids in active_index:
+            if owns_guild(self.bot, guild_id):
+                self.track(
+                    ask_message_id,
+                    TrackedAsk(
+                        progress_ask_id, guild_id, ProgressAskUtil.as_utc(closes_at), emojis, tuple(part_message_ids)
+                    )
+                )
+        self.logger.info(f"Tracking progress asks: {len(self.tracked_asks)}")
+
+    def set_tracked_asks(self, tracked_asks: dict[int, TrackedAsk]) -> None:
+        """
+        追跡中の進捗確認をまとめて置き換える
+
+        Parameters
+        ----------
+        tracked_asks : dict[int, TrackedAsk]
+            {公開側メッセージID: TrackedAsk}
+        """
+        self.tracked_asks = tracked_asks
+        self.message_parts = {}
+        for ask_message_id, tracked_ask in tracked_asks.items():
+            self.index_message_parts(ask_message_id, tracked_ask)
+
+    def index_message_parts(self, ask_message_id: int, tracked_ask: TrackedAsk) -> None:
+        # 公開側の全てのメッセージから、進捗確認と手順の位置を引けるようにする
+        self.message_parts[ask_message_id] = (ask_message_id, 0)
+        for part_index, message_id in enumerate(tracked_ask.part_message_ids, start=1):
+            self.message_parts[message_id] = (ask_message_id, part_index)
+
+    def track(self, ask_message_id: int, tracked_ask: TrackedAsk) -> None:
+        """
+        進捗確認を追跡対象に追加する
+
+        Parameters
+        ----------
+        ask_message_id : int
+            進捗確認（公開側）のメッセージID
+        tracked_ask : TrackedAsk
+            進捗確認の情報
+        """
+        self.tracked_asks[ask_message_id] = tracked_ask
+        self.index_message_parts(ask_message_id, tracked_ask)
+
+    async def untrack(self, ask_message_id: int) -> None:
+        """
+        進捗確認を追跡対象から外す
+
+        Parameters
+        ----------
+        ask_message_id : int
+            進捗確認（公開側）のメッセージID
+        """
+        tracked_ask = self.tracked_asks.pop(ask_message_id, None)
+        if tracked_ask is not None:
+            for message_id in (ask_message_id, *tracked_ask.part_message_ids):
+                self.message_parts.pop(message_id, None)
+        self.progress.pop(ask_message_id, None)
+        self.evicted.discard(ask_message_id)
+        await self.store.hdel(SUMMARY_DIGESTS_KEY, str(ask_message_id))
+
+    async def is_tracked(self, ask_message_id: int) -> bool:
+        """
+        進捗確認が追跡中かどうか判定する　締切を過ぎていれば追跡対象から外す
+
+        Parameters
+        ----------
+        ask_message_id : int
+            進捗確認（公開側）のメッセージID
+
+        Returns
+        -------
+        bool
+            追跡中かどうか
+        """
+        if ask_message_id not in self.tracked_asks:
+            return False
+
+        closes_at = self.tracked_asks[ask_message_id].closes_at
+        if closes_at is not None and closes_at <= datetime.now(UTC):
+            await self.untrack(ask_message_id)
+            return False
+        return True
+
+    @tasks.loop(minutes=10)
+    async def archive_task(self):
+        """
+        締切を過ぎた進捗確認を締め切り、締め切られてから一定時間経ったものをアーカイブに移動する
+        """
+
+        def run() -> tuple[list[int], int]:
+            with get_db() as db:
+                closed = progress_ask_crud.close_expired(db)
+                archived = progress_ask_crud.archive_closed(db, datetime.now(UTC) - ARCHIVE_AFTER)
+            return closed, archived
+
+        # 複数プロセスで同時に移動しないよう、シャード0を担当するプロセスだけが実行する
+        if 0 not in get_local_shard_ids(self.bot):
+            return
+
+        try:
+            closed, archived = await asyncio.to_thread(run)
+        except Exception:
+            self.logger.exception("Failed to archive progress asks")
+            return
+
+        for ask_message_id in closed:
+            await self.untrack(ask_message_id)
+
+        if len(closed) > 0 or archived > 0:
+            self.logger.info(f"Progress asks closed: {len(closed)}, archived: {archived}")
+
+    @archive_task.before_loop
+    async def before_archive_task(self):
+        await self.bot.wait_until_ready()
+
+    @tasks.loop(seconds=1)
+    async def refresh_task(self):
+        """
+        更新待ちの進捗確認のサマリーをまとめて更新する
+
+        同じ進捗確認へのリアクションが連続しても、1周期につき1回だけ更新する
+        """
+        dirty: set[str] = set()
+        for shard_id in get_local_shard_ids(self.bot):
+            dirty |= await self.store.spop_all(f"{DIRTY_ASKS_KEY_PREFIX}{shard_id}")
+        if len(dirty) == 0:
+            return
+
+        # インタラクションの応答を優先し、同時に更新する数はスケジューラで制限する
+        await asyncio.gather(*[scheduler.run(REFRESH, self.refresh_dirty_ask(entry)) for entry in dirty])
+
+    @refresh_task.before_loop
+    async def before_refresh_task(self):
+        await self.bot.wait_until_ready()
+
+    async def mark_dirty(self, guild_id: int, ask_message_id: int) -> None:
+        """
+        進捗確認をサマリーの更新待ちにする
+
+        Parameters
+        ----------
+        guild_id : int
+            対象GuildID
+        ask_message_id : int
+            進捗確認（公開側）のメッセージID
+        """
+        shard_id = shard_id_for(guild_id, get_shard_count(self.bot))
+        await self.store.sadd(f"{DIRTY_ASKS_KEY_PREFIX}{shard_id}", f"{guild_id}:{ask_message_id}")
+
+    async def refresh_dirty_ask(self, entry: str) -> None:
+        """
+        更新待ちの進捗確認1件のサマリーを更新する
+
+        レートリミットが取得できない場合は、次の周期に回す
+
+        Parameters
+        ----------
+        entry : str
+            "ギルドID:公開側メッセージID"
+        """
+        rate_limit = RateLimit("ReactionHandler", 3, self.store)
+        if not await rate_limit.acquire():
+            self.logger.info("Rate limited: ReactionHandler")
+            await self.mark_dirty(*(int(v) for v in entry.split(":")))
+            return
+
+        try:
+            guild_id, ask_message_id = (int(v) for v in entry.split(":"))
+            await self.refresh_summary(guild_id, ask_message_id)
+        except Exception:
+            self.logger.exception(f"Failed to refresh progress summary: {entry}")
+        finally:
+            await rate_limit.release()
 
     @slash_command(name="create_progress_ask_base", description="進捗確認のベースを作成")
     @commands.has_permissions(administrator=True)
@@ -411,6 +1155,192 @@ class ProgressAsk(commands.Cog):
             view=ProgressAskBaseView()
         )
 
+    @slash_command(name="delete_progress_ask", description="進捗確認を削除")
+    @commands.has_permissions(administrator=True)
+    async def delete_progress_ask(
+            self,
+            ctx: discord.commands.context.ApplicationContext,
+            ask_message_id: discord.Option(str, "進捗確認（公開側）のメッセージID"),
+    ):
+        try:
+            message_id = int(ask_message_id)
+        except ValueError:
+            await ctx.respond("メッセージIDが不正です。", ephemeral=True)
+            return
+
+        with get_db() as db:
+            progress_ask = progress_ask_crud.get(db, ctx.guild.id, message_id)
+            if progress_ask is None:
+                await ctx.respond("進捗確認が見つかりません。", ephemeral=True)
+                return
+            progress_ask_crud.soft_delete(db, progress_ask)
+
+        await self.untrack(message_id)
+        await ctx.respond("進捗確認を削除しました。", ephemeral=True)
+
+    @slash_command(name="close_progress_ask", description="進捗確認の締切を設定")
+    @commands.has_permissions(administrator=True)
+    async def close_progress_ask(
+            self,
+            ctx: discord.commands.context.ApplicationContext,
+            ask_message_id: discord.Option(str, "進捗確認（公開側）のメッセージID"),
+            closes_at: discord.Option(str, "締切（YYYY-MM-DD HH:MM・日本時間）　省略すると今すぐ締め切ります",
+                                      required=False, default=""),
+    ):
+        try:
+            message_id = int(ask_message_id)
+            close_time = ProgressAskUtil.parse_close_time(closes_at) or datetime.now(UTC)
+        except ValueError:
+            await ctx.respond("メッセージIDまたは締切が不正です。", ephemeral=True)
+            return
+
+        with get_db() as db:
+            progress_ask = progress_ask_crud.get(db, ctx.guild.id, message_id)
+            if progress_ask is None or progress_ask.closed_at is not None:
+                await ctx.respond("締め切られていない進捗確認が見つかりません。", ephemeral=True)
+                return
+            progress_ask = progress_ask_crud.set_closes_at(db, progress_ask, close_time)
+            closed = progress_ask.closed_at is not None
+            part_message_ids = tuple(message.message_id for message in progress_ask.messages)
+
+        if closed:
+            await self.untrack(message_id)
+            await ctx.respond("進捗確認を締め切りました。", ephemeral=True)
+        else:
+            self.track(message_id, TrackedAsk(
+                progress_ask.id, ctx.guild.id, close_time, progress_ask.emojis, part_message_ids
+            ))
+            await ctx.respond(
+                f"締切を {close_time.astimezone(CLOSE_TIME_ZONE).strftime(CLOSE_TIME_FORMAT)} に設定しました。",
+                ephemeral=True)
+
+    @slash_command(name="progress_ask_counts", description="進捗確認のロールごとの完了人数を表示")
+    @commands.has_permissions(administrator=True)
+    async def progress_ask_counts(
+            self,
+            ctx: discord.commands.context.ApplicationContext,
+            ask_message_id: discord.Option(str, "進捗確認（公開側）のメッセージID"),
+    ):
+        try:
+            message_id = int(ask_message_id)
+        except ValueError:
+            await ctx.respond("メッセージIDが不正です。", ephemeral=True)
+            return
+
+        # DBの混雑で応答期限を過ぎないよう、先に応答しておく
+        await ctx.defer(ephemeral=True)
+
+        def load() -> tuple | None:
+            with get_read_db() as db:
+                progress_ask = progress_ask_crud.get(db, ctx.guild.id, message_id)
+                if progress_ask is None:
+                    return None
+                return (
+                    len(progress_ask.contents),
+                    [role.role_id for role in progress_ask.roles],
+                    AskLayout.of(progress_ask),
+                )
+
+        # DBの読み込みでイベントループを止めないよう別スレッドで実行
+        loaded = await asyncio.to_thread(load)
+        if loaded is None:
+            await ctx.followup.send("進捗確認が見つかりません。", ephemeral=True)
+            return
+        ask_contents_len, role_ids, layout = loaded
+
+        progress = await self.get_progress(ctx.guild, message_id, layout, ask_contents_len)
+        if progress is None:
+            await ctx.followup.send("進捗確認を読み込み中です。しばらくしてから再度お試しください。", ephemeral=True)
+            return
+
+        roles: list[discord.Role] = [
+            role for role in [ctx.guild.get_role(role_id) for role_id in role_ids] if role is not None
+        ]
+        for role in roles:
+            progress.set_role_members(role.id, role_index.member_ids(ctx.guild, role.id))
+
+        await ctx.followup.send(
+            embed=discord.Embed(
+                title="完了人数",
+                description=progress.render_counts([(role.id, role.name) for role in roles]) or "対象のロールがありません。"
+            ),
+            ephemeral=True
+        )
+
+    @slash_command(name="export_progress_ask", description="進捗確認の結果をCSVで出力")
+    @commands.has_permissions(administrator=True)
+    async def export_progress_ask(
+            self,
+            ctx: discord.commands.context.ApplicationContext,
+            ask_message_id: discord.Option(str, "進捗確認（公開側）のメッセージID"),
+    ):
+        try:
+            message_id = int(ask_message_id)
+        except ValueError:
+            await ctx.respond("メッセージIDが不正です。", ephemeral=True)
+            return
+
+        # DBの混雑で応答期限を過ぎないよう、先に応答しておく
+        await ctx.defer(ephemeral=True)
+
+        def load() -> tuple | None:
+            with get_read_db() as db:
+                progress_ask = progress_ask_crud.get(db, ctx.guild.id, message_id)
+                if progress_ask is None:
+                    return None
+                return (
+                    progress_ask.id,
+                    [content.content for content in progress_ask.contents],
+                    [role.role_id for role in progress_ask.roles],
+                )
+
+        # DBの読み込みでイベントループを止めないよう別スレッドで実行
+        loaded = await asyncio.to_thread(load)
+        if loaded is None:
+            await ctx.followup.send("進捗確認が見つかりません。", ephemeral=True)
+            return
+        progress_ask_id, contents, role_ids = loaded
+
+        async def run(job: Job) -> dict:
+            # 対象ロールのメンバーはギルドのキャッシュから取得し、APIは呼び出さない
+            member_roles: dict[int, list[str]] = {}
+            for role in [ctx.guild.get_role(role_id) for role_id in role_ids]:
+                if role is None:
+                    continue
+                for member_id in role_index.member_ids(ctx.guild, role.id):
+                    member_roles.setdefault(member_id, []).append(role.name)
+
+            # 反映待ちのリアクションを書き込んでから、DBの内容だけで出力する
+            job.report("リアクションを書き込み中")
+            await asyncio.to_thread(self.reaction_buffer.flush)
+            job.report(f"{len(member_roles)}人分のCSVを作成中")
+            data = await asyncio.to_thread(export_progress_matrix_csv, progress_ask_id, contents, member_roles)
+            return {"file": discord.File(data, filename=f"progress_ask_{message_id}.csv")}
+
+        # 同じギルドで同時に実行できる出力は1つまで
+        await job_runner.submit(
+            ctx.followup, "export_progress_ask", ctx.guild.id, ctx.author.id, f"進捗確認 {message_id} のCSV出力", run
+        )
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before: discord.Member, after: discord.Member):
+        if before.roles == after.roles:
+            return
+        await self.member_roles_handler(after.guild.id, after.id, {role.id for role in after.roles})
+
+    @commands.Cog.listener()
+    async def on_raw_member_remove(self, payload: discord.RawMemberRemoveEvent):
+        await self.member_roles_handler(payload.guild_id, payload.user.id, set())
+
+    async def member_roles_handler(self, guild_id: int, member_id: int, role_ids: set[int]) -> None:
+        # 読み込み済みの進捗状態の完了人数を更新し、変化があればサマリーを更新待ちにする
+        for ask_message_id, progress in list(self.progress.items()):
+            tracked_ask = self.tracked_asks.get(ask_message_id)
+            if tracked_ask is None or tracked_ask.guild_id != guild_id:
+                continue
+            if progress.update_member_roles(member_id, role_ids):
+                await self.mark_dirty(guild_id, ask_message_id)
+
     @commands.Cog.listener()
     async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
         await self.reaction_handler(payload)
@@ -423,48 +1353,234 @@ class ProgressAsk(commands.Cog):
         if payload.user_id == self.bot.user.id:
             return
 
-        if not ProgressAskUtil.is_indexed_reaction(payload.emoji.name):
+        # 追跡中の進捗確認のメッセージ以外は無視
+        part = self.message_parts.get(payload.message_id)
+        if part is None:
             return
+        ask_message_id, part_index = part
 
-        # レートリミットを取得
-        rate_limit = RateLimit("ReactionHandler", 3)
-        if not rate_limit.acquire():
-            self.logger.info("Rate limited: ReactionHandler")
+        # 手順の絵文字以外は無視
+        emojis = get_step_emojis(self.tracked_asks[ask_message_id].emojis)
+        index = emojis.index_of(payload.emoji)
+        if index is None:
             return
 
-        with get_db() as db:
-            progress_ask = progress_ask_crud.get(db, payload.guild_id, payload.message_id)
-            if progress_ask is None:
+        # 締切を過ぎていれば無視
+        if not await self.is_tracked(ask_message_id):
+            return
+
+        step_index = part_index * len(emojis) + index
+        add = payload.event_type == "REACTION_ADD"
+
+        # リアクションを記録
+        self.reaction_buffer.put(
+            (self.tracked_asks[ask_message_id].progress_ask_id, payload.user_id, step_index),
+            add
+        )
+
+        # 進捗状態を更新　まだ読み込んでいない場合は初回のサマリー更新時に読み込む
+        # 破棄した進捗状態はDBから読み込み直すため、ここでは何もしない
+        progress = self.progress.get(ask_message_id)
+        if progress is not None:
+            self.progress.move_to_end(ask_message_id)
+            progress.apply(payload.user_id, step_index, add)
+
+        # 更新待ちに追加し、サマリーの更新はrefresh_taskでまとめて行う
+        await self.mark_dirty(payload.guild_id, ask_message_id)
+
+    async def fetch_ask_masks(self, guild: discord.Guild, layout: AskLayout) -> dict[int, int] | None:
+        """
+        進捗確認（公開側）の全てのメッセージのリアクションから、メンバーごとの進捗のビットマスクを作成
+
+        Parameters
+        ----------
+        guild : discord.Guild
+            ギルド
+        layout : AskLayout
+            進捗確認（公開側）のメッセージの構成
+
+        Returns
+        -------
+        dict[int, int] | None
+            {メンバーID: ビットマスク}　メッセージが見つからない場合はNone
+        """
+        ask_channel = await ProgressAskUtil.get_or_fetch_channel(guild, layout.ask_channel_id)
+        masks: dict[int, int] = {}
+        for part_index, message_id in enumerate(layout.message_ids):
+            # 読み込みを始める前のリアクションの状態を使うと、その後に付いたリアクションが失われるため、必ずfetchし直す
+            message = await ProgressAskUtil.get_or_fetch_message(ask_channel, message_id, fresh=True)
+            if message is None:
+                return None
+            await ProgressAskUtil.fetch_progress_masks(message, layout.emojis, part_index * len(layout.emojis), masks)
+        return masks
+
+    def get_or_create_progress(self, ask_message_id: int, step_count: int, layout: AskLayout) -> AskProgress:
+        progress = self.progress.get(ask_message_id)
+        if progress is None:
+            # 読み込み中のリアクションも記録できるよう、先に登録しておく
+            progress = AskProgress(step_count, layout.emojis.for_step)
+            self.progress[ask_message_id] = progress
+            self.evict_idle()
+        else:
+            self.progress.move_to_end(ask_message_id)
+        return progress
+
+    def evict_idle(self) -> None:
+        """
+        進捗状態の数が上限を超えていれば、最も長く使われていないものから破棄する
+
+        リアクションは全てDBに記録しているため、破棄した進捗確認は次に必要になった時にDBから読み込み直す
+        読み込み中の進捗状態は、読み込み中に受け取ったリアクションを失わないよう破棄しない
+        """
+        for ask_message_id in list(self.progress):
+            if len(self.progress) <= MAX_LOADED_ASKS:
                 return
+            if self.progress[ask_message_id].loading:
+                continue
+            del self.progress[ask_message_id]
+            self.evicted.add(ask_message_id)
 
-            ask_contents_len = len(progress_ask.contents)
+    async def load_evicted_masks(self, ask_message_id: int) -> dict[int, int] | None:
+        """
+        破棄した進捗確認のビットマスクをDBから読み込む
+
+        Parameters
+        ----------
+        ask_message_id : int
+            進捗確認（公開側）のメッセージID
 
-            # 対象ギルド取得
-            guild = await ProgressAskUtil.get_or_fetch_guild(self.bot, payload.guild_id)
+        Returns
+        -------
+        dict[int, int] | None
+            {メンバーID: ビットマスク}　追跡中でない場合はNone
+        """
+        tracked_ask = self.tracked_asks.get(ask_message_id)
+        if tracked_ask is None:
+            return None
 
-            # 進捗確認のメッセージ取得
-            ask_channel = await ProgressAskUtil.get_or_fetch_channel(guild, progress_ask.ask_channel_id)
-            ask_message = await ProgressAskUtil.get_or_fetch_message(ask_channel, progress_ask.ask_message_id)
+        def load() -> dict[int, int]:
+            # 反映待ちのリアクションを書き込んでから読み込む
+            self.reaction_buffer.flush()
+            with get_read_db(replica=False) as db:
+                return build_masks(progress_ask_reaction_crud.get_by_ask(db, tracked_ask.progress_ask_id))
 
-            # 進捗確認のサマリー取得
-            summary_channel = await ProgressAskUtil.get_or_fetch_channel(guild, progress_ask.summary_channel_id)
-            summary_message = await ProgressAskUtil.get_or_fetch_message(summary_channel,
-                                                                         progress_ask.summary_message_id)
+        masks = await asyncio.to_thread(load)
+        self.evicted.discard(ask_message_id)
+        return masks
 
-            summary_embeds = summary_message.embeds
-            summary_embeds[1] = await ProgressAskUtil.create_progress_summary_embed(
-                guild,
-                [role.role_id for role in progress_ask.roles],
-                ask_message.reactions,
-                ask_contents_len
-            )
+    async def get_progress(
+            self,
+            guild: discord.Guild,
+            ask_message_id: int,
+            layout: AskLayout,
+            step_count: int
+    ) -> AskProgress | None:
+        """
+        進捗状態を取得する　なければ進捗確認のメッセージのリアクションから作成する
+
+        上限により破棄した進捗確認は、リアクションのユーザ一覧をfetchせずDBの記録から作成する
+
+        Parameters
+        ----------
+        guild : discord.Guild
+            ギルド
+        ask_message_id : int
+            進捗確認（公開側）のメッセージID
+        layout : AskLayout
+            進捗確認（公開側）のメッセージの構成
+        step_count : int
+            手順の数
+
+        Returns
+        -------
+        AskProgress | None
+            進捗状態　読み込み中の場合はNone
+        """
+        progress = self.get_or_create_progress(ask_message_id, step_count, layout)
+        if progress.loading:
+            return None
+
+        if not progress.loaded:
+            progress.begin_load()
+            try:
+                masks = None
+                if ask_message_id in self.evicted:
+                    masks = await self.load_evicted_masks(ask_message_id)
+                if masks is None:
+                    masks = await self.fetch_ask_masks(guild, layout)
+                progress.load(masks or {})
+            finally:
+                progress.loading = False
+
+        return progress
+
+    async def refresh_summary(self, guild_id: int, ask_message_id: int) -> None:
+        """
+        進捗確認のサマリーを作り直し、前回から変化があれば更新する
+
+        進捗状態はプロセス内に保持し、リアクションのユーザ一覧のfetchは進捗確認ごとに初回のみ行う
+
+        Parameters
+        ----------
+        guild_id : int
+            対象GuildID
+        ask_message_id : int
+            進捗確認（公開側）のメッセージID
+        """
+        def load() -> tuple | None:
+            with get_db() as db:
+                progress_ask = progress_ask_crud.get(db, guild_id, ask_message_id)
+                if progress_ask is None:
+                    return None
+                return (
+                    len(progress_ask.contents),
+                    [role.role_id for role in progress_ask.roles],
+                    AskLayout.of(progress_ask),
+                    progress_ask.summary_channel_id,
+                    progress_ask.summary_message_id,
+                )
+
+        # DBの読み込みでイベントループを止めないよう別スレッドで実行
+        loaded = await asyncio.to_thread(load)
+        if loaded is None:
+            return
+        ask_contents_len, role_ids, layout, summary_channel_id, summary_message_id = loaded
+
+        # 対象ギルド取得
+        guild = await ProgressAskUtil.get_or_fetch_guild(self.bot, guild_id)
+
+        # 他の処理が読み込み中の場合は、次の周期で改めて更新する
+        # 読み込みの呼び出し元（集計コマンドなど）は更新待ちにしないため、ここで戻しておく
+        progress = await self.get_progress(guild, ask_message_id, layout, ask_contents_len)
+        if progress is None:
+            await self.mark_dirty(guild_id, ask_message_id)
+            return
+
+        # 進捗確認のサマリー取得
+        summary_channel = await ProgressAskUtil.get_or_fetch_channel(guild, summary_channel_id)
+        if progress.header_embed is None:
+            summary_message = await ProgressAskUtil.get_or_fetch_message(summary_channel, summary_message_id)
+            progress.header_embed = summary_message.embeds[0]
+        else:
+            summary_message = summary_channel.get_partial_message(summary_message_id)
+
+        summary_embeds = [
+            progress.header_embed,
+            ProgressAskUtil.create_progress_summary_embed(guild, role_ids, progress)
+        ]
+
+        # 前回描画した内容と同じであれば編集しない
+        digest = hashlib.sha1(
+            json.dumps([embed.to_dict() for embed in summary_embeds], sort_keys=True).encode("utf-8")
+        ).hexdigest()
+        if await self.store.hget(SUMMARY_DIGESTS_KEY, str(ask_message_id)) == digest:
+            return
 
         await summary_message.edit(
             content="## 【進捗チェック】",
             embeds=summary_embeds
         )
-
-        rate_limit.release()
+        await self.store.hset(SUMMARY_DIGESTS_KEY, str(ask_message_id), digest)
 
 
 def setup(bot):
@@ -1,23 +1,87 @@
 import os
-from datetime import datetime
 
-import discord
+from utils.owner_notifier import OwnerNotifier
 
 TOKEN = os.environ.get("DISCORD_BOT_TOKEN")
-OWNER_ID = os.environ.get("DISCORD_OWNER_ID")
+OWNER_ID = int(os.environ.get("DISCORD_OWNER_ID") or 0)
 
 SENTRY_DSN = os.environ.get("SENTRY_DSN")
 
+# シャーディング
+# DISCORD_SHARD_COUNT: 空の場合はシャーディングしない、"auto"の場合はDiscordの推奨値を使う
+# DISCORD_SHARD_IDS: このプロセスが担当するシャード（例: "0-3", "0,2"）　空の場合は全て
+SHARD_COUNT = os.environ.get("DISCORD_SHARD_COUNT", "")
+SHARD_IDS = os.environ.get("DISCORD_SHARD_IDS", "")
+
+
+def parse_shard_ids(value: str) -> list[int] | None:
+    """
+    担当シャードの指定をパースする
+
+    Parameters
+    ----------
+    value : str
+        "0-3"や"0,2"形式の文字列
+
+    Returns
+    -------
+    list[int] | None
+        シャードIDのリスト　空の場合はNone
+    """
+    if value.strip() == "":
+        return None
+
+    shard_ids: list[int] = []
+    for part in value.split(","):
+        if "-" in part:
+            start, end = part.split("-")
+            shard_ids.extend(range(int(start), int(end) + 1))
+        else:
+            shard_ids.append(int(part))
+    return shard_ids
+
+
+def parse_shard_count(value: str, shard_ids: list[int] | None) -> int | None:
+    """
+    シャード数の指定をパースする
+
+    Parameters
+    ----------
+    value : str
+        シャード数　"auto"の場合はDiscordの推奨値を使う
+    shard_ids : list[int] | None
+        このプロセスが担当するシャード
+
+    Returns
+    -------
+    int | None
+        シャード数　"auto"の場合はNone
+
+    Raises
+    ------
+    ValueError
+        指定が不正な場合
+    """
+    if value == "auto":
+        # 推奨値はプロセスごとに変わりうるため、担当を分ける場合はシャード数を揃えて明示させる
+        if shard_ids is not None:
+            raise ValueError("DISCORD_SHARD_COUNT must be a number when DISCORD_SHARD_IDS is set.")
+        return None
+
+    shard_count = int(value)
+    if shard_ids is not None and any(shard_id < 0 or shard_id >= shard_count for shard_id in shard_ids):
+        raise ValueError(f"DISCORD_SHARD_IDS must be between 0 and {shard_count - 1}.")
+    return shard_count
+
+
+owner_notifier: OwnerNotifier | None = None
+
 
 async def NOTIFY_TO_OWNER(bot, message: str):
-    owner = await bot.fetch_user(OWNER_ID)
-    dmCh = await owner.create_dm()
-    await dmCh.send(
-        content="Bot Status Notification",
-        embed=discord.Embed().add_field(
-            name="Status",
-            value=message
-        ).set_footer(
-            text=str(datetime.now())
-        )
-    )
+    # 送信はOwnerNotifierがバックグラウンドでまとめて行う
+    global owner_notifier
+    if OWNER_ID == 0:
+        return
+    if owner_notifier is None:
+        owner_notifier = OwnerNotifier(bot, OWNER_ID)
+    owner_notifier.notify(message)
@@ -0,0 +1,140 @@
+"""
+起動時のimportにかかる時間を計測して表示する
+
+bot.pyと同じ順にモジュールをimportする子プロセスを `python -X importtime` で実行し、
+その出力（stderr）を集計して、時間のかかったモジュールを表示する
+ゲートウェイへの接続前にimportするもの（connect）と、接続を始めてから読み込むもの（deferred）を分けて計測する
+
+    python3 scripts/importtime_report.py [--top 20]
+"""
+import argparse
+import os
+import subprocess
+import sys
+from typing import NamedTuple
+
+# スクリプトのあるディレクトリの親（bot.pyのあるディレクトリ）
+BOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# ゲートウェイへの接続前にimportするモジュール
+CONNECT_MODULES: list[str] = [
+    "discord",
+    "sentry_sdk",
+    "discord.ext.commands",
+    "config.bot_config",
+    "utils.api_stats",
+    "utils.role_index",
+    "utils.scheduler",
+    "utils.startup",
+    "cogs.Admin",
+    "cogs.CogManager",
+    "cogs.JobManager",
+]
+
+
+class ImportTime(NamedTuple):
+    name: str
+    # 自身のimportにかかった時間（マイクロ秒）
+    self_us: int
+    # 依存するモジュールを含めたimportにかかった時間（マイクロ秒）
+    cumulative_us: int
+    # importの入れ子の深さ　0がトップレベル
+    depth: int
+
+
+def parse_importtime(output: str) -> list[ImportTime]:
+    """
+    -X importtimeの出力をパースする
+
+    Parameters
+    ----------
+    output : str
+        子プロセスのstderr
+
+    Returns
+    -------
+    list[ImportTime]
+        モジュールごとのimport時間
+    """
+    results: list[ImportTime] = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            # ヘッダ行
+            continue
+        name = fields[2].rstrip()
+        stripped = name.lstrip()
+        results.append(ImportTime(
+            name=stripped,
+            self_us=int(fields[0]),
+            cumulative_us=int(fields[1]),
+            depth=(len(name) - len(stripped) - 1) // 2
+        ))
+    return results
+
+
+def measure(modules: list[str], preloaded: list[str]) -> list[ImportTime]:
+    """
+    モジュールのimport時間を子プロセスで計測する
+
+    Parameters
+    ----------
+    modules : list[str]
+        計測するモジュール
+    preloaded : list[str]
+        計測前にimportしておくモジュール　これらが既にimportしたものは計測に含まれない
+
+    Returns
+    -------
+    list[ImportTime]
+        計測したモジュールのimport時間
+    """
+    marker = "--- importtime report ---"
+    code = "\n".join(
+        [f"import {name}" for name in preloaded]
+        + [f"import sys; print({marker!r}, file=sys.stderr, flush=True)"]
+        + [f"import {name}" for name in modules]
+    )
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=BOT_DIR,
+        capture_output=True,
+        text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1])
+
+    _, _, output = completed.stderr.partition(marker)
+    return parse_importtime(output)
+
+
+def print_report(title: str, results: list[ImportTime], top: int) -> None:
+    total_us = sum(result.cumulative_us for result in results if result.depth == 0)
+    print(f"== {title}: {total_us / 1000:.1f}ms ({len(results)} modules)")
+
+    print(f"-- top {top} by cumulative")
+    for result in sorted(results, key=lambda r: r.cumulative_us, reverse=True)[:top]:
+        print(f"{result.cumulative_us / 1000:10.1f}ms  {result.name}")
+
+    print(f"-- top {top} by self")
+    for result in sorted(results, key=lambda r: r.self_us, reverse=True)[:top]:
+        print(f"{result.self_us / 1000:10.1f}ms  {result.name}")
+    print()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="起動時のimportにかかる時間を表示する")
+    parser.add_argument("--top", type=int, default=20, help="表示するモジュールの数")
+    args = parser.parse_args()
+
+    sys.path.insert(0, BOT_DIR)
+    from utils.startup import DEFERRED_EXTENSIONS, HEAVY_MODULES
+
+    print_report("connect", measure(CONNECT_MODULES, []), args.top)
+    print_report("deferred", measure(HEAVY_MODULES + DEFERRED_EXTENSIONS, CONNECT_MODULES), args.top)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import logging
+import re
+import time
+from collections import Counter, deque
+
+import discord
+
+# discord.httpがレートリミット時に出力するログからリトライ秒数を抜き出す
+RATE_LIMIT_LOG_PATTERN = re.compile(r"(?:rate limit|rate limited).*?Retrying in ([\d.]+) seconds", re.IGNORECASE)
+
+
+class ApiStats:
+    """
+    Discord APIの呼び出し状況を記録するクラス
+
+    直近window秒間の、キャッシュヒット／HTTP fetchの回数（アクセス経路別）、
+    ルート別のHTTPリクエスト数、429の回数とretry-afterの合計を集計する
+    """
+
+    def __init__(self, window: float = 600.0) -> None:
+        self.window = window
+        # (記録時刻, 種別, キー, 値)
+        self._events: deque[tuple[float, str, str, float]] = deque()
+        # 起動してからのHTTPリクエストの総数（区間の呼び出し回数を差分で求めるのに使う）
+        self.total_requests = 0
+
+    def _record(self, kind: str, key: str, value: float = 1.0) -> None:
+        now = time.monotonic()
+        self._events.append((now, kind, key, value))
+        self._prune(now)
+
+    def _prune(self, now: float) -> None:
+        threshold = now - self.window
+        while len(self._events) > 0 and self._events[0][0] < threshold:
+            self._events.popleft()
+
+    def record_cache_hit(self, path: str) -> None:
+        """
+        キャッシュから取得できたことを記録する
+
+        Parameters
+        ----------
+        path : str
+            アクセス経路の名前
+        """
+        self._record("cache_hit", path)
+
+    def record_fetch(self, path: str) -> None:
+        """
+        キャッシュになくHTTPでfetchしたことを記録する
+
+        Parameters
+        ----------
+        path : str
+            アクセス経路の名前
+        """
+        self._record("fetch", path)
+
+    def record_request(self, route: str) -> None:
+        """
+        HTTPリクエストを記録する
+
+        Parameters
+        ----------
+        route : str
+            "METHOD /path/{param}" 形式のルート
+        """
+        self.total_requests += 1
+        self._record("request", route)
+
+    def record_rate_limited(self, retry_after: float) -> None:
+        """
+        429を受けたことを記録する
+
+        Parameters
+        ----------
+        retry_after : float
+            待機を指示された秒数
+        """
+        self._record("rate_limited", "429", retry_after)
+
+    def snapshot(self) -> dict:
+        """
+        直近window秒間の集計結果を取得する
+
+        Returns
+        -------
+        dict
+            集計結果
+        """
+        self._prune(time.monotonic())
+
+        counters: dict[str, Counter] = {
+            "cache_hit": Counter(),
+            "fetch": Counter(),
+            "request": Counter(),
+        }
+        rate_limited = 0
+        retry_after_total = 0.0
+
+        for _, kind, key, value in self._events:
+            if kind == "rate_limited":
+                rate_limited += 1
+                retry_after_total += value
+            else:
+                counters[kind][key] += 1
+
+        return {
+            "window": self.window,
+            "cache_hits": dict(counters["cache_hit"]),
+            "fetches": dict(counters["fetch"]),
+            "requests": dict(counters["request"]),
+            "rate_limited": rate_limited,
+            "retry_after_total": retry_after_total,
+        }
+
+
+class RateLimitLogHandler(logging.Handler):
+    """
+    discord.httpのレートリミットのログを拾ってApiStatsに記録するハンドラ
+
+    py-cordは429を内部でリトライするため、呼び出し元には例外として届かない
+    """
+
+    def __init__(self, stats: ApiStats) -> None:
+        super().__init__(level=logging.WARNING)
+        self.stats = stats
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            match = RATE_LIMIT_LOG_PATTERN.search(record.getMessage())
+        except Exception:
+            return
+        if match is not None:
+            self.stats.record_rate_limited(float(match.group(1)))
+
+
+api_stats = ApiStats()
+
+
+def install(bot: discord.Client) -> None:
+    """
+    ボットのHTTPクライアントをラップし、全リクエストをapi_statsに記録させる
+
+    Parameters
+    ----------
+    bot : discord.Client
+        ボット
+    """
+    http = bot.http
+    if getattr(http, "_api_stats_installed", False):
+        return
+
+    original_request = http.request
+
+    async def request(route, **kwargs):
+        api_stats.record_request(f"{route.method} {route.path}")
+        return await original_request(route, **kwargs)
+
+    http.request = request
+    http._api_stats_installed = True
+
+    logging.getLogger("discord.http").addHandler(RateLimitLogHandler(api_stats))
+
+
+def merge_snapshots(snapshots: list[dict]) -> dict:
+    """
+    複数プロセスの集計結果を合算する
+
+    Parameters
+    ----------
+    snapshots : list[dict]
+        ApiStats.snapshotの結果のリスト
+
+    Returns
+    -------
+    dict
+        合算した集計結果
+    """
+    merged: dict = {
+        "window": max([snapshot["window"] for snapshot in snapshots], default=api_stats.window),
+        "cache_hits": Counter(),
+        "fetches": Counter(),
+        "requests": Counter(),
+        "rate_limited": 0,
+        "retry_after_total": 0.0,
+    }
+    for snapshot in snapshots:
+        for key in ["cache_hits", "fetches", "requests"]:
+            merged[key].update(snapshot[key])
+        merged["rate_limited"] += snapshot["rate_limited"]
+        merged["retry_after_total"] += snapshot["retry_after_total"]
+
+    for key in ["cache_hits", "fetches", "requests"]:
+        merged[key] = dict(merged[key])
+    return merged
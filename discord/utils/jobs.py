@@ -0,0 +1,311 @@
+import asyncio
+import itertools
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable
+
+import discord
+
+# ジョブの状態
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+STATUS_LABELS: dict[str, str] = {
+    QUEUED: "待機中",
+    RUNNING: "実行中",
+    DONE: "完了",
+    FAILED: "失敗",
+    CANCELLED: "キャンセル",
+}
+
+
+class Job:
+    """
+    管理者コマンドから投入された時間のかかる処理
+    """
+
+    def __init__(self, job_id: int, job_type: str, guild_id: int, user_id: int, description: str) -> None:
+        self.job_id = job_id
+        self.job_type = job_type
+        self.guild_id = guild_id
+        self.user_id = user_id
+        self.description = description
+
+        self.status = QUEUED
+        # 処理から報告された進捗
+        self.progress = ""
+        self.error: str | None = None
+        self.created_at = time.monotonic()
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+
+        self.task: asyncio.Task | None = None
+        # 状態を表示するメッセージ
+        self.message: discord.WebhookMessage | None = None
+
+    @property
+    def active(self) -> bool:
+        """
+        待機中または実行中かどうか
+        """
+        return self.status in (QUEUED, RUNNING)
+
+    def report(self, progress: str) -> None:
+        """
+        進捗を報告する　状態のメッセージには定期的に反映される
+
+        Parameters
+        ----------
+        progress : str
+            進捗（「120/500件」など）
+        """
+        self.progress = progress
+
+    def render(self) -> str:
+        """
+        状態のメッセージの内容を作成する
+
+        Returns
+        -------
+        str
+            メッセージの内容
+        """
+        elapsed = (self.finished_at or time.monotonic()) - (self.started_at or self.created_at)
+        lines = [f"ジョブ #{self.job_id}（{self.description}）：{STATUS_LABELS[self.status]}　{elapsed:.0f}秒"]
+        if self.progress != "":
+            lines.append(self.progress)
+        if self.error is not None:
+            lines.append(f"エラー：{self.error}")
+        if self.active:
+            lines.append(f"キャンセルする場合は `/cancel_job {self.job_id}` を実行してください。")
+        return "\n".join(lines)
+
+
+class JobRunner:
+    """
+    管理者コマンドの時間のかかる処理をバックグラウンドで実行するクラス
+
+    同じ種類のジョブは、同じギルドで待機中・実行中のものがあれば新しく投入せずそれを返す
+    ジョブの種類ごとに同時実行数を制限し、超えた分は待機させる
+    ジョブの状態はコマンドの応答（followup）のメッセージにupdate_interval秒ごとに反映し、
+    完了したら処理の結果をfollowupで送信する
+    """
+
+    def __init__(self, limits: dict[str, int], default_limit: int = 1, update_interval: float = 5.0,
+                 history: int = 50) -> None:
+        self.limits = limits
+        self.default_limit = default_limit
+        self.update_interval = update_interval
+        self.history = history
+        self.logger = logging.getLogger(type(self).__name__)
+
+        self._ids = itertools.count(1)
+        self._jobs: OrderedDict[int, Job] = OrderedDict()
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+
+        # metrics
+        self.submitted = 0
+        self.deduplicated = 0
+
+    def find_active(self, job_type: str, guild_id: int) -> Job | None:
+        """
+        同じギルドで待機中・実行中の同じ種類のジョブを取得する
+
+        Parameters
+        ----------
+        job_type : str
+            ジョブの種類
+        guild_id : int
+            ギルドID
+
+        Returns
+        -------
+        Job | None
+            ジョブ　なければNone
+        """
+        for job in self._jobs.values():
+            if job.active and job.job_type == job_type and job.guild_id == guild_id:
+                return job
+        return None
+
+    async def submit(
+            self,
+            followup: discord.Webhook,
+            job_type: str,
+            guild_id: int,
+            user_id: int,
+            description: str,
+            func: Callable[[Job], Awaitable[dict[str, Any] | None]]
+    ) -> tuple[Job, bool]:
+        """
+        ジョブを投入する　応答はdefer済みであること
+
+        Parameters
+        ----------
+        followup : discord.Webhook
+            状態のメッセージと結果を送信するfollowup
+        job_type : str
+            ジョブの種類
+        guild_id : int
+            ギルドID
+        user_id : int
+            投入したユーザのID
+        description : str
+            状態のメッセージに表示する説明
+        func : Callable[[Job], Awaitable[dict[str, Any] | None]]
+            処理　followup.sendに渡す引数（contentやfile）を返す　Noneの場合は状態のメッセージだけを更新する
+
+        Returns
+        -------
+        tuple[Job, bool]
+            (ジョブ, 新しく投入した場合はTrue)　同じ種類のジョブが実行中の場合はそのジョブとFalse
+        """
+        existing = self.find_active(job_type, guild_id)
+        if existing is not None:
+            self.deduplicated += 1
+            await followup.send(
+                f"同じ種類のジョブ #{existing.job_id}（{existing.description}）が{STATUS_LABELS[existing.status]}です。",
+                ephemeral=True
+            )
+            return existing, False
+
+        job = Job(next(self._ids), job_type, guild_id, user_id, description)
+        self._jobs[job.job_id] = job
+        self.submitted += 1
+        self._prune()
+
+        try:
+            job.message = await followup.send(job.render(), ephemeral=True, wait=True)
+        except Exception as e:
+            # 待機中のまま残ると、同じ種類のジョブを投入できなくなるため終了させる
+            job.status = FAILED
+            job.error = str(e) or type(e).__name__
+            job.finished_at = time.monotonic()
+            raise
+        job.task = asyncio.get_running_loop().create_task(self._run(job, followup, func))
+        return job, True
+
+    async def _run(
+            self,
+            job: Job,
+            followup: discord.Webhook,
+            func: Callable[[Job], Awaitable[dict[str, Any] | None]]
+    ) -> None:
+        semaphore = self._semaphores.get(job.job_type)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.limits.get(job.job_type, self.default_limit))
+            self._semaphores[job.job_type] = semaphore
+
+        updater = asyncio.get_running_loop().create_task(self._update_periodically(job))
+        result: dict[str, Any] | None = None
+        try:
+            async with semaphore:
+                job.status = RUNNING
+                job.started_at = time.monotonic()
+                await self._update(job)
+                result = await func(job)
+            job.status = DONE
+        except asyncio.CancelledError:
+            job.status = CANCELLED
+        except Exception as e:
+            job.status = FAILED
+            job.error = str(e) or type(e).__name__
+            self.logger.exception(f"Job #{job.job_id} ({job.job_type}) failed")
+        finally:
+            job.finished_at = time.monotonic()
+            updater.cancel()
+
+        await self._update(job)
+        if result is not None:
+            try:
+                await followup.send(**result, ephemeral=True)
+            except discord.HTTPException:
+                self.logger.exception(f"Failed to send result of job #{job.job_id}")
+
+    async def _update_periodically(self, job: Job) -> None:
+        while True:
+            await asyncio.sleep(self.update_interval)
+            await self._update(job)
+
+    async def _update(self, job: Job) -> None:
+        if job.message is None:
+            return
+        try:
+            await job.message.edit(content=job.render())
+        except discord.HTTPException:
+            # 応答のトークンの期限（15分）が切れた場合などは、以降の更新をやめる
+            job.message = None
+
+    def _prune(self) -> None:
+        # 終了したジョブは新しいものからhistory件だけ残す
+        finished = [job_id for job_id, job in self._jobs.items() if not job.active]
+        for job_id in finished[:max(len(self._jobs) - self.history, 0)]:
+            del self._jobs[job_id]
+
+    def cancel(self, job_id: int, guild_id: int) -> Job | None:
+        """
+        待機中・実行中のジョブをキャンセルする
+
+        Parameters
+        ----------
+        job_id : int
+            ジョブID
+        guild_id : int
+            ギルドID　他のギルドのジョブはキャンセルできない
+
+        Returns
+        -------
+        Job | None
+            キャンセルしたジョブ　見つからない場合や終了している場合はNone
+        """
+        job = self._jobs.get(job_id)
+        if job is None or job.guild_id != guild_id or not job.active or job.task is None:
+            return None
+        job.task.cancel()
+        return job
+
+    def list_jobs(self, guild_id: int) -> list[Job]:
+        """
+        ギルドのジョブを新しい順に取得する
+
+        Parameters
+        ----------
+        guild_id : int
+            ギルドID
+
+        Returns
+        -------
+        list[Job]
+            ジョブのリスト
+        """
+        return [job for job in reversed(self._jobs.values()) if job.guild_id == guild_id]
+
+    def stats(self) -> dict:
+        """
+        統計情報を取得する
+
+        Returns
+        -------
+        dict
+            投入した件数・重複により投入しなかった件数・状態ごとの件数
+        """
+        counts = {status: 0 for status in STATUS_LABELS}
+        for job in self._jobs.values():
+            counts[job.status] += 1
+        return {
+            "submitted": self.submitted,
+            "deduplicated": self.deduplicated,
+            **counts,
+        }
+
+
+job_runner = JobRunner({
+    "export_progress_ask": 2,
+    "import_participants": 1,
+    "add_roles": 1,
+    "sync_participants": 1,
+})
@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import discord
+
+from utils.api_stats import api_stats
+
+# Embedのフィールドの値の最大文字数
+FIELD_VALUE_LIMIT = 1024
+
+
+class OwnerNotifier:
+    """
+    ボットのオーナーへのDM通知をまとめて送るクラス
+
+    notifyはキューに積むだけで、送信はバックグラウンドのタスクが最短min_interval秒間隔で行う
+    同じ内容の通知は、キューで待っている間とwindow秒以内に送った後は件数だけ数え、
+    まとめて「(xN in the last 60s)」として送る　キューがmax_queue件を超えた新しい通知（まとめたものを含む）は破棄する
+    DMチャンネルは初回のみfetchし、以降は使い回す
+    """
+
+    def __init__(
+            self,
+            bot: discord.Client,
+            owner_id: int,
+            window: float = 60.0,
+            max_queue: int = 100,
+            min_interval: float = 2.0
+    ) -> None:
+        self.bot = bot
+        self.owner_id = owner_id
+        self.window = window
+        self.max_queue = max_queue
+        self.min_interval = min_interval
+        self.logger = logging.getLogger(type(self).__name__)
+
+        # 送信待ちの通知 {(内容, まとめた件数): 件数}　まとめた件数はwindow秒の間に送らなかった件数で、まとめていない通知は0
+        self._queue: OrderedDict[tuple[str, int], int] = OrderedDict()
+        # window秒以内に送った通知 {内容: (送信時刻, 送信後に受け取った件数)}
+        self._recent: dict[str, tuple[float, int]] = {}
+        self._wakeup = asyncio.Event()
+        self._channel: discord.DMChannel | None = None
+        self._task: asyncio.Task | None = None
+
+        # metrics
+        self.received = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self._dropped_unreported = 0
+
+    def notify(self, message: str) -> None:
+        """
+        通知を送信待ちに追加する
+
+        Parameters
+        ----------
+        message : str
+            通知の内容
+        """
+        self.received += 1
+        self._ensure_task()
+
+        if (message, 0) in self._queue:
+            self._queue[(message, 0)] += 1
+            self.coalesced += 1
+            return
+
+        recent = self._recent.get(message)
+        if recent is not None and time.monotonic() - recent[0] < self.window:
+            self._recent[message] = (recent[0], recent[1] + 1)
+            self.coalesced += 1
+            if recent[1] == 0:
+                # まとめて送る時刻を待つよう、送信タスクを起こす
+                self._wakeup.set()
+            return
+
+        if len(self._queue) >= self.max_queue:
+            self.dropped += 1
+            self._dropped_unreported += 1
+            return
+
+        self._queue[(message, 0)] = 1
+        self._wakeup.set()
+
+    def _ensure_task(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def _collect_expired(self) -> None:
+        # window秒が過ぎた通知のうち、送信後にも受け取っていたものは件数をまとめて送信待ちに戻し、
+        # 次のwindow秒も同じ内容をまとめ続ける
+        now = time.monotonic()
+        for message, (sent_at, count) in list(self._recent.items()):
+            if now - sent_at < self.window:
+                continue
+            if count > 0 and len(self._queue) < self.max_queue:
+                self._recent[message] = (now, 0)
+                self._queue[(message, count)] = 1
+            else:
+                if count > 0:
+                    self.dropped += count
+                    self._dropped_unreported += count
+                del self._recent[message]
+
+    def _next_expiry(self) -> float | None:
+        pending = [sent_at + self.window for sent_at, count in self._recent.values() if count > 0]
+        if len(pending) == 0:
+            return None
+        return max(min(pending) - time.monotonic(), 0.0)
+
+    async def _run(self) -> None:
+        while True:
+            self._collect_expired()
+            if len(self._queue) == 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self._next_expiry())
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            (message, summarized), count = self._queue.popitem(last=False)
+            suffixes: list[str] = []
+            if summarized > 0:
+                # まとめた通知はwindow秒の計測を_collect_expiredで始め直している
+                suffixes.append(f"(x{summarized} in the last {int(self.window)}s)")
+            else:
+                self._recent[message] = (time.monotonic(), 0)
+            if count > 1:
+                suffixes.append(f"(x{count})")
+            if self._dropped_unreported > 0:
+                suffixes.append(f"({self._dropped_unreported}件の通知をキューの上限により破棄しました)")
+                self._dropped_unreported = 0
+
+            try:
+                await self._send(self._format(message, suffixes))
+                self.sent += 1
+            except Exception:
+                self.logger.exception("Failed to notify owner")
+
+            await asyncio.sleep(self.min_interval)
+
+    @staticmethod
+    def _format(message: str, suffixes: list[str]) -> str:
+        # 件数の表示が切れないよう、本文の方を切り詰める
+        suffix = "".join(f"\n{line}" for line in suffixes)
+        return message[:max(FIELD_VALUE_LIMIT - len(suffix), 0)] + suffix
+
+    async def _get_channel(self) -> discord.DMChannel:
+        if self._channel is not None:
+            api_stats.record_cache_hit("OwnerNotifier.dm_channel")
+            return self._channel
+
+        api_stats.record_fetch("OwnerNotifier.dm_channel")
+        owner = self.bot.get_user(self.owner_id) or await self.bot.fetch_user(self.owner_id)
+        self._channel = owner.dm_channel or await owner.create_dm()
+        return self._channel
+
+    async def _send(self, message: str) -> None:
+        channel = await self._get_channel()
+        await channel.send(
+            content="Bot Status Notification",
+            embed=discord.Embed().add_field(
+                name="Status",
+                value=message[:FIELD_VALUE_LIMIT]
+            ).set_footer(
+                text=str(datetime.now())
+            )
+        )
+
+    def stats(self) -> dict:
+        """
+        通知の統計情報を取得する
+
+        Returns
+        -------
+        dict
+            送信待ちの件数・受け付けた件数・送信した件数・まとめた件数・破棄した件数
+        """
+        return {
+            "queue": len(self._queue),
+            "received": self.received,
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,422 @@
+import sys
+from array import array
+from bisect import bisect_left
+from typing import Callable, Iterable
+
+# ビットマスクは64ビットの符号なし整数の配列に格納するため、手順のindexは64未満
+MAX_STEP_BITS = 64
+
+
+def build_masks(rows: Iterable[tuple[int, int]]) -> dict[int, int]:
+    """
+    (メンバーID, 手順のindex)の組から、メンバーごとのビットマスクを作成する
+
+    Parameters
+    ----------
+    rows : Iterable[tuple[int, int]]
+        (メンバーID, 手順のindex)の組
+
+    Returns
+    -------
+    dict[int, int]
+        {メンバーID: ビットマスク}
+    """
+    masks: dict[int, int] = {}
+    for member_id, step_index in rows:
+        masks[member_id] = masks.get(member_id, 0) | (1 << step_index)
+    return masks
+
+
+class AskProgress:
+    """
+    1つの進捗確認の進捗状態と、サマリーの描画キャッシュ
+
+    メンバーごとの進捗は、完了した手順のindexをビットで表した整数（ビットマスク）で保持する
+    多数の進捗確認を同時に保持できるよう、メンバーIDとビットマスクはメンバーIDの昇順に並べた2つの配列に詰め、
+    メンバーの検索は二分探索で行う　進捗の保持のためにメンバーごとのPythonオブジェクトは作らない
+    （ロールの所属メンバーと描画待ちのメンバーはIDのセットで保持する）
+    サマリーはビットマスクごとの絵文字のテキストと、ロールごとのフィールドのテキストをキャッシュし、
+    ビットマスクまたはロールの所属メンバーが変わった部分だけを描画し直す
+    ロールごと・手順ごとの完了人数は、リアクションと所属メンバーの変化のたびに差分で更新する
+    """
+
+    __slots__ = (
+        "step_count", "get_reaction",
+        "_member_ids", "_masks", "dirty",
+        "loaded", "loading", "_replay",
+        "_role_members", "_role_counts",
+        "_mask_texts", "_field_cache", "header_embed",
+        "lines_rendered", "fields_rendered", "fields_reused",
+    )
+
+    def __init__(self, step_count: int, get_reaction: Callable[[int], str | None]) -> None:
+        self.step_count = step_count
+        self.get_reaction = get_reaction
+
+        # メンバーIDの昇順に並べたメンバーIDと、同じindexのメンバーのビットマスク
+        self._member_ids = array("Q")
+        self._masks = array("Q")
+        # 前回の描画から進捗が変わったメンバー
+        self.dirty: set[int] = set()
+
+        # 読み込み中のイベント　読み込み完了後に適用し直す
+        self.loaded = False
+        self.loading = False
+        self._replay: list[tuple[int, int, bool]] = []
+
+        # {ロールID: 所属メンバーIDのセット}
+        self._role_members: dict[int, set[int]] = {}
+        # {ロールID: 手順ごとの完了人数}
+        self._role_counts: dict[int, array] = {}
+
+        # 描画キャッシュ
+        # {ビットマスク: 手順ごとの絵文字を並べたテキスト}
+        self._mask_texts: dict[int, str] = {}
+        # {ロールID: (所属メンバーの数, 所属メンバーIDの並びのハッシュ, ロール名, フィールドのテキスト)}
+        self._field_cache: dict[int, tuple[int, int, str, str]] = {}
+
+        # 進捗確認の手順を表示するEmbed（サマリーメッセージの1つ目）
+        self.header_embed = None
+
+        # metrics
+        self.lines_rendered = 0
+        self.fields_rendered = 0
+        self.fields_reused = 0
+
+    @property
+    def masks(self) -> dict[int, int]:
+        """
+        進捗のあるメンバーのビットマスク（呼び出すたびに作成するコピー）
+
+        Returns
+        -------
+        dict[int, int]
+            {メンバーID: ビットマスク}
+        """
+        return {member_id: mask for member_id, mask in zip(self._member_ids, self._masks) if mask != 0}
+
+    def apply(self, member_id: int, step_index: int, add: bool) -> bool:
+        """
+        リアクションの追加・削除を反映する
+
+        Parameters
+        ----------
+        member_id : int
+            メンバーID
+        step_index : int
+            手順のindex
+        add : bool
+            追加の場合はTrue、削除の場合はFalse
+
+        Returns
+        -------
+        bool
+            ビットマスクが変化した場合はTrue
+        """
+        if self.loading:
+            self._replay.append((member_id, step_index, add))
+        if step_index >= MAX_STEP_BITS:
+            return False
+
+        slot = bisect_left(self._member_ids, member_id)
+        if slot == len(self._member_ids) or self._member_ids[slot] != member_id:
+            if not add:
+                return False
+            self._member_ids.insert(slot, member_id)
+            self._masks.insert(slot, 0)
+
+        before = self._masks[slot]
+        after = before | (1 << step_index) if add else before & ~(1 << step_index)
+        if before == after:
+            return False
+
+        self._masks[slot] = after
+        self.dirty.add(member_id)
+
+        if step_index < self.step_count:
+            for role_id, member_ids in self._role_members.items():
+                if member_id in member_ids:
+                    self._role_counts[role_id][step_index] += 1 if add else -1
+        return True
+
+    def begin_load(self) -> None:
+        """
+        読み込みを開始する　load()までに受け取ったイベントは読み込み完了後に適用し直す
+        """
+        self.loading = True
+        self._replay = []
+
+    def load(self, masks: dict[int, int]) -> None:
+        """
+        読み込みの結果を反映し、読み込み中に受け取ったイベントを適用し直す
+
+        Parameters
+        ----------
+        masks : dict[int, int]
+            {メンバーID: ビットマスク}
+        """
+        replay, self._replay = self._replay, []
+        self.dirty |= set(self._member_ids) | set(masks)
+
+        # 進捗のないメンバーを除いて配列を詰め直す
+        self._member_ids = array("Q")
+        self._masks = array("Q")
+        for member_id, mask in sorted(masks.items()):
+            mask &= (1 << MAX_STEP_BITS) - 1
+            if mask != 0:
+                self._member_ids.append(member_id)
+                self._masks.append(mask)
+
+        self.loaded = True
+        self.loading = False
+        for role_id, member_ids in self._role_members.items():
+            self._role_counts[role_id] = self._count(member_ids)
+        for member_id, step_index, add in replay:
+            self.apply(member_id, step_index, add)
+
+    def _count(self, member_ids: set[int]) -> array:
+        counts = array("l", [0] * self.step_count)
+        for member_id in member_ids:
+            self._add_counts(counts, self.get_mask(member_id), 1)
+        return counts
+
+    def _add_counts(self, counts: array, mask: int, sign: int) -> None:
+        for i in range(min(mask.bit_length(), self.step_count)):
+            if mask >> i & 1:
+                counts[i] += sign
+
+    def _join(self, role_id: int, member_id: int) -> None:
+        self._role_members[role_id].add(member_id)
+        self._add_counts(self._role_counts[role_id], self.get_mask(member_id), 1)
+
+    def _leave(self, role_id: int, member_id: int) -> None:
+        self._role_members[role_id].discard(member_id)
+        self._add_counts(self._role_counts[role_id], self.get_mask(member_id), -1)
+
+    def set_role_members(self, role_id: int, member_ids: list[int]) -> bool:
+        """
+        ロールの所属メンバーを設定し、差分だけ完了人数を更新する
+
+        Parameters
+        ----------
+        role_id : int
+            ロールID
+        member_ids : list[int]
+            所属メンバーIDのリスト
+
+        Returns
+        -------
+        bool
+            所属メンバーが変化した場合はTrue
+        """
+        current = self._role_members.get(role_id)
+        if current is None:
+            self._role_members[role_id] = set()
+            self._role_counts[role_id] = array("l", [0] * self.step_count)
+            current = self._role_members[role_id]
+
+        new = set(member_ids)
+        joined = new - current
+        left = current - new
+        for member_id in joined:
+            self._join(role_id, member_id)
+        for member_id in left:
+            self._leave(role_id, member_id)
+        return len(joined) > 0 or len(left) > 0
+
+    def update_member_roles(self, member_id: int, role_ids: set[int]) -> bool:
+        """
+        メンバーの所属ロールの変化を反映する　対象ロール以外は無視する
+
+        Parameters
+        ----------
+        member_id : int
+            メンバーID
+        role_ids : set[int]
+            メンバーが現在所属しているロールIDのセット（脱退した場合は空）
+
+        Returns
+        -------
+        bool
+            対象ロールの所属メンバーが変化した場合はTrue
+        """
+        changed = False
+        for role_id, member_ids in self._role_members.items():
+            if role_id in role_ids and member_id not in member_ids:
+                self._join(role_id, member_id)
+                changed = True
+            elif role_id not in role_ids and member_id in member_ids:
+                self._leave(role_id, member_id)
+                changed = True
+        return changed
+
+    def get_counts(self, role_id: int) -> tuple[int, list[int]]:
+        """
+        ロールの所属人数と、手順ごとの完了人数を取得する
+
+        Parameters
+        ----------
+        role_id : int
+            ロールID
+
+        Returns
+        -------
+        tuple[int, list[int]]
+            (所属人数, 手順ごとの完了人数のリスト)
+        """
+        return len(self._role_members.get(role_id, ())), list(self._role_counts.get(role_id, [0] * self.step_count))
+
+    def render_counts(self, roles: list[tuple[int, str]]) -> str:
+        """
+        ロールごとの完了人数の概要を描画する
+
+        Parameters
+        ----------
+        roles : list[tuple[int, str]]
+            (ロールID, ロール名)のリスト
+
+        Returns
+        -------
+        str
+            ロールごとに1行、手順ごとの完了人数と割合を並べたテキスト
+        """
+        lines: list[str] = []
+        for role_id, role_name in roles:
+            total, counts = self.get_counts(role_id)
+            steps = " ".join([
+                f"{self.get_reaction(i)} {count}/{total}" + (f"({count * 100 // total}%)" if total > 0 else "")
+                for i, count in enumerate(counts)
+            ])
+            lines.append(f"**【{role_name}】** {steps}")
+        return "\n".join(lines)
+
+    def get_mask(self, member_id: int) -> int:
+        """
+        メンバーのビットマスクを取得する
+
+        Parameters
+        ----------
+        member_id : int
+            メンバーID
+
+        Returns
+        -------
+        int
+            ビットマスク
+        """
+        slot = bisect_left(self._member_ids, member_id)
+        if slot == len(self._member_ids) or self._member_ids[slot] != member_id:
+            return 0
+        return self._masks[slot]
+
+    def render_mask(self, mask: int) -> str:
+        """
+        ビットマスクを手順ごとの絵文字を並べたテキストにする
+
+        Parameters
+        ----------
+        mask : int
+            ビットマスク
+
+        Returns
+        -------
+        str
+            完了した手順は番号の絵文字、未完了は❌を並べたテキスト
+        """
+        text = self._mask_texts.get(mask)
+        if text is None:
+            text = " ".join([
+                self.get_reaction(i) if mask >> i & 1 else "❌" for i in range(self.step_count)
+            ])
+            self._mask_texts[mask] = text
+        return text
+
+    def render_line(self, member_id: int) -> str:
+        """
+        メンバー1人分の行を描画する
+
+        絵文字のテキストはビットマスクごとにキャッシュしたものを使い、行自体はメンバーごとにキャッシュしない
+
+        Parameters
+        ----------
+        member_id : int
+            メンバーID
+
+        Returns
+        -------
+        str
+            行のテキスト
+        """
+        self.lines_rendered += 1
+        return f"**<@{member_id}>**\n{self.render_mask(self.get_mask(member_id))}\n"
+
+    def render_fields(self, roles: list[tuple[int, str, list[int]]]) -> list[tuple[str, str]]:
+        """
+        ロールごとのフィールドを描画する
+
+        所属メンバーとロール名が前回と同じで、進捗が変わったメンバーがいないロールはキャッシュを使う
+
+        Parameters
+        ----------
+        roles : list[tuple[int, str, list[int]]]
+            (ロールID, ロール名, 所属メンバーIDのリスト)のリスト
+
+        Returns
+        -------
+        list[tuple[str, str]]
+            (フィールド名, フィールドのテキスト)のリスト
+        """
+        fields: list[tuple[str, str]] = []
+        for role_id, role_name, member_ids in roles:
+            self.set_role_members(role_id, member_ids)
+            # 所属メンバーの並びはタプルを保持せず、数とハッシュで比べる
+            key = (len(member_ids), hash(tuple(member_ids)), role_name)
+            cached = self._field_cache.get(role_id)
+            if cached is not None and cached[:3] == key and self.dirty.isdisjoint(member_ids):
+                self.fields_reused += 1
+                value = cached[3]
+            else:
+                value = "\n".join([self.render_line(member_id) for member_id in member_ids])
+                self._field_cache[role_id] = (*key, value)
+                self.fields_rendered += 1
+            fields.append((f"**【{role_name}】**", value))
+
+        self.dirty.clear()
+        return fields
+
+    def memory_usage(self) -> int:
+        """
+        進捗状態と描画キャッシュが使っているおおよそのメモリ量を取得する
+
+        Returns
+        -------
+        int
+            バイト数（コンテナ・文字列と、セットで保持するメンバーIDの整数を数える）
+        """
+        size = sys.getsizeof(self)
+        for container in (self._member_ids, self._masks, self.dirty, self._replay,
+                          self._role_members, self._role_counts, self._mask_texts, self._field_cache):
+            size += sys.getsizeof(container)
+        size += sum(sys.getsizeof(member_ids) for member_ids in self._role_members.values())
+        size += sum(sys.getsizeof(member_id) for member_ids in self._role_members.values() for member_id in member_ids)
+        size += sum(sys.getsizeof(member_id) for member_id in self.dirty)
+        size += sum(sys.getsizeof(counts) for counts in self._role_counts.values())
+        size += sum(sys.getsizeof(text) for text in self._mask_texts.values())
+        size += sum(sys.getsizeof(cached[3]) for cached in self._field_cache.values())
+        return size
+
+    def stats(self) -> dict:
+        """
+        描画キャッシュの統計情報を取得する
+
+        Returns
+        -------
+        dict
+            メンバー数・行の描画回数・フィールドの描画回数／キャッシュ利用回数
+        """
+        return {
+            "members": sum(1 for mask in self._masks if mask != 0),
+            "lines_rendered": self.lines_rendered,
+            "fields_rendered": self.fields_rendered,
+            "fields_reused": self.fields_reused,
+        }
@@ -0,0 +1,203 @@
+import discord
+
+
+class RoleIndex:
+    """
+    ギルドごとの「ロールID → 所属メンバーID」の索引
+
+    py-cordのrole.membersは参照のたびにギルドの全メンバーを走査するため、
+    ギルドごとに初回だけ全メンバーを走査して索引を作り、以降はメンバーのイベントで差分を反映する
+    所属メンバーは{メンバーID: None}の辞書で保持し、role.membersと同じく加入順に並べる
+    """
+
+    def __init__(self) -> None:
+        # {ギルドID: {ロールID: {メンバーID: None}}}
+        self._roles: dict[int, dict[int, dict[int, None]]] = {}
+        # {ギルドID: {メンバーID: None}}
+        self._members: dict[int, dict[int, None]] = {}
+
+        # metrics
+        self.builds = 0
+        self.updates = 0
+
+    def _get(self, guild: discord.Guild) -> tuple[dict[int, dict[int, None]], dict[int, None]]:
+        if guild.id in self._roles:
+            return self._roles[guild.id], self._members[guild.id]
+
+        roles: dict[int, dict[int, None]] = {}
+        members: dict[int, None] = {}
+        for member in guild.members:
+            members[member.id] = None
+            for role in member.roles:
+                roles.setdefault(role.id, {})[member.id] = None
+        self.builds += 1
+
+        # メンバー一覧の取得（chunk）が終わるまでは不完全なため、保持せずに次回作り直す
+        if guild.chunked:
+            self._roles[guild.id] = roles
+            self._members[guild.id] = members
+        return roles, members
+
+    def member_ids(self, guild: discord.Guild, role_id: int) -> list[int]:
+        """
+        ロールに所属するメンバーのIDを取得する
+
+        Parameters
+        ----------
+        guild : discord.Guild
+            ギルド
+        role_id : int
+            ロールID
+
+        Returns
+        -------
+        list[int]
+            メンバーIDのリスト
+        """
+        # @everyoneロールはギルドの全メンバー
+        if role_id == guild.id:
+            return self.guild_member_ids(guild)
+        roles, _ = self._get(guild)
+        return list(roles.get(role_id, ()))
+
+    def guild_member_ids(self, guild: discord.Guild) -> list[int]:
+        """
+        ギルドの全メンバーのIDを取得する
+
+        Parameters
+        ----------
+        guild : discord.Guild
+            ギルド
+
+        Returns
+        -------
+        list[int]
+            メンバーIDのリスト
+        """
+        _, members = self._get(guild)
+        return list(members)
+
+    def add_member(self, member: discord.Member) -> None:
+        """
+        メンバーの加入・所属ロールの変化を反映する　索引を作っていないギルドは何もしない
+
+        Parameters
+        ----------
+        member : discord.Member
+            メンバー（変化後）
+        """
+        roles = self._roles.get(member.guild.id)
+        if roles is None:
+            return
+
+        role_ids = {role.id for role in member.roles}
+        for role_id, member_ids in roles.items():
+            if role_id not in role_ids:
+                member_ids.pop(member.id, None)
+        for role_id in role_ids:
+            roles.setdefault(role_id, {})[member.id] = None
+        self._members[member.guild.id][member.id] = None
+        self.updates += 1
+
+    def remove_member(self, guild_id: int, member_id: int) -> None:
+        """
+        メンバーの脱退を反映する
+
+        Parameters
+        ----------
+        guild_id : int
+            ギルドID
+        member_id : int
+            メンバーID
+        """
+        roles = self._roles.get(guild_id)
+        if roles is None:
+            return
+
+        for member_ids in roles.values():
+            member_ids.pop(member_id, None)
+        self._members[guild_id].pop(member_id, None)
+        self.updates += 1
+
+    def remove_role(self, guild_id: int, role_id: int) -> None:
+        """
+        ロールの削除を反映する
+
+        Parameters
+        ----------
+        guild_id : int
+            ギルドID
+        role_id : int
+            ロールID
+        """
+        roles = self._roles.get(guild_id)
+        if roles is not None:
+            roles.pop(role_id, None)
+
+    def drop(self, guild_id: int) -> None:
+        """
+        ギルドの索引を破棄する　次に参照した時に作り直す
+
+        Parameters
+        ----------
+        guild_id : int
+            ギルドID
+        """
+        self._roles.pop(guild_id, None)
+        self._members.pop(guild_id, None)
+
+    def stats(self) -> dict:
+        """
+        索引の統計情報を取得する
+
+        Returns
+        -------
+        dict
+            索引を作ったギルド数・作った回数・差分を反映した回数
+        """
+        return {
+            "guilds": len(self._roles),
+            "builds": self.builds,
+            "updates": self.updates,
+        }
+
+
+role_index = RoleIndex()
+
+
+def install(bot: discord.Client) -> None:
+    """
+    メンバー・ロールのイベントで索引を更新させる
+
+    Parameters
+    ----------
+    bot : discord.Client
+        ボット
+    """
+
+    async def on_member_join(member: discord.Member):
+        role_index.add_member(member)
+
+    async def on_member_update(before: discord.Member, after: discord.Member):
+        if before.roles != after.roles:
+            role_index.add_member(after)
+
+    async def on_raw_member_remove(payload: discord.RawMemberRemoveEvent):
+        role_index.remove_member(payload.guild_id, payload.user.id)
+
+    async def on_guild_role_delete(role: discord.Role):
+        role_index.remove_role(role.guild.id, role.id)
+
+    # 再接続でメンバー一覧を取得し直した場合や、ギルドから外れた場合は作り直す
+    async def on_guild_available(guild: discord.Guild):
+        role_index.drop(guild.id)
+
+    async def on_guild_remove(guild: discord.Guild):
+        role_index.drop(guild.id)
+
+    bot.add_listener(on_member_join)
+    bot.add_listener(on_member_update)
+    bot.add_listener(on_raw_member_remove)
+    bot.add_listener(on_guild_role_delete)
+    bot.add_listener(on_guild_available)
+    bot.add_listener(on_guild_remove)
@@ -0,0 +1,315 @@
+import asyncio
+import contextlib
+import functools
+import itertools
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, TypeVar
+
+import discord
+
+T = TypeVar("T")
+
+# 優先度の高い順
+INTERACTION = "interaction"
+REFRESH = "refresh"
+RECONCILE = "reconcile"
+PRIORITIES: list[str] = [INTERACTION, REFRESH, RECONCILE]
+
+# インタラクションは応答期限（3秒）の間だけ、バックグラウンドの処理より優先する
+INTERACTION_GRACE = 3.0
+# バックグラウンドの処理がインタラクションや優先度の高い処理に待たされる時間の上限
+# インタラクションが途切れなく続いても、これ以上待った処理は同時実行数の範囲で開始する
+BACKGROUND_MAX_HOLD = 10.0
+
+
+class PriorityScheduler:
+    """
+    優先度ごとに同時実行数を制限して処理を実行するスケジューラ
+
+    待っている処理は優先度の高いものから開始し、同じ優先度の中では先着順に開始する
+    インタラクションの処理が始まってからINTERACTION_GRACE秒の間は、
+    バックグラウンドの処理（インタラクション以外）を新しく開始しない
+    ただしBACKGROUND_MAX_HOLD秒以上待った処理は、飢餓状態にならないよう同時実行数の範囲で開始する
+    優先度ごとに待ち件数・待ち時間・実行時間を記録する
+    """
+
+    def __init__(self, limits: dict[str, int | None]) -> None:
+        # {優先度: 同時実行数の上限}　Noneの場合は上限なし
+        self.limits = limits
+        self._running: dict[str, int] = {priority: 0 for priority in PRIORITIES}
+        # {優先度: (待っている処理のFuture, 待ち始めた時刻)のキュー}
+        self._waiters: dict[str, deque[tuple[asyncio.Future, float]]] = {priority: deque() for priority in PRIORITIES}
+        # 実行中のインタラクション {トークン: 開始時刻}
+        self._interactions: dict[int, float] = {}
+        self._tokens = itertools.count()
+        self._timer: asyncio.TimerHandle | None = None
+
+        # metrics
+        self._started: dict[str, int] = {priority: 0 for priority in PRIORITIES}
+        self._wait_total: dict[str, float] = {priority: 0.0 for priority in PRIORITIES}
+        self._wait_max: dict[str, float] = {priority: 0.0 for priority in PRIORITIES}
+        self._run_total: dict[str, float] = {priority: 0.0 for priority in PRIORITIES}
+        # 待ち時間の上限により、優先する処理を待たずに開始した件数
+        self._forced: dict[str, int] = {priority: 0 for priority in PRIORITIES}
+
+    def _interaction_blocks_until(self) -> float | None:
+        # 応答期限内のインタラクションがある場合、その期限のうち最も遅い時刻
+        if len(self._interactions) == 0:
+            return None
+        until = max(self._interactions.values()) + INTERACTION_GRACE
+        return until if until > time.monotonic() else None
+
+    def _within_limit(self, priority: str) -> bool:
+        limit = self.limits.get(priority)
+        return limit is None or self._running[priority] < limit
+
+    def _can_start(self, priority: str) -> bool:
+        if not self._within_limit(priority):
+            return False
+        if priority == INTERACTION:
+            return True
+        return self._interaction_blocks_until() is None
+
+    def _dispatch(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        now = time.monotonic()
+        higher_waiting = False
+        for priority in PRIORITIES:
+            waiters = self._waiters[priority]
+            while len(waiters) > 0:
+                waiter, enqueued_at = waiters[0]
+                if waiter.done():
+                    waiters.popleft()
+                    continue
+                # 優先度の高い処理が待っている間やインタラクションの応答期限内は開始しないが、
+                # 待ち時間の上限を超えた処理は同時実行数の範囲で開始する
+                if higher_waiting or not self._can_start(priority):
+                    if now - enqueued_at < BACKGROUND_MAX_HOLD or not self._within_limit(priority):
+                        break
+                    self._forced[priority] += 1
+                waiters.popleft()
+                self._running[priority] += 1
+                waiter.set_result(None)
+            if len(waiters) > 0:
+                higher_waiting = True
+
+        # インタラクションの応答期限が過ぎた時と、待っている処理が待ち時間の上限に達した時に改めて開始する
+        wake_at = [
+            self._waiters[priority][0][1] + BACKGROUND_MAX_HOLD
+            for priority in PRIORITIES
+            if priority != INTERACTION and len(self._waiters[priority]) > 0
+        ]
+        if len(wake_at) > 0:
+            until = self._interaction_blocks_until()
+            if until is not None:
+                wake_at.append(until)
+            wake_at = [t for t in wake_at if t > now]
+            if len(wake_at) > 0:
+                self._timer = asyncio.get_running_loop().call_later(min(wake_at) - now, self._dispatch)
+
+    async def acquire(self, priority: str) -> float:
+        """
+        実行枠を確保する　確保できるまで待つ
+
+        Parameters
+        ----------
+        priority : str
+            優先度
+
+        Returns
+        -------
+        float
+            待った秒数
+        """
+        started_at = time.monotonic()
+        higher_waiting = any(len(self._waiters[p]) > 0 for p in PRIORITIES[:PRIORITIES.index(priority) + 1])
+        if not higher_waiting and self._can_start(priority):
+            self._running[priority] += 1
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            entry = (waiter, started_at)
+            self._waiters[priority].append(entry)
+            self._dispatch()
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # 枠を確保した直後にキャンセルされた場合は返す
+                    self.release(priority)
+                else:
+                    with contextlib.suppress(ValueError):
+                        self._waiters[priority].remove(entry)
+                raise
+
+        waited = time.monotonic() - started_at
+        self._started[priority] += 1
+        self._wait_total[priority] += waited
+        self._wait_max[priority] = max(self._wait_max[priority], waited)
+        return waited
+
+    def release(self, priority: str) -> None:
+        """
+        実行枠を返す
+
+        Parameters
+        ----------
+        priority : str
+            優先度
+        """
+        self._running[priority] -= 1
+        self._dispatch()
+
+    def begin_interaction(self) -> int:
+        """
+        インタラクションの処理の開始を記録する　インタラクションの実行数に上限はないため待たない
+
+        Returns
+        -------
+        int
+            end_interactionに渡すトークン
+        """
+        token = next(self._tokens)
+        self._interactions[token] = time.monotonic()
+        self._running[INTERACTION] += 1
+        self._started[INTERACTION] += 1
+        return token
+
+    def end_interaction(self, token: int) -> None:
+        """
+        インタラクションの処理の終了を記録する
+
+        Parameters
+        ----------
+        token : int
+            begin_interactionが返したトークン
+        """
+        started_at = self._interactions.pop(token, None)
+        if started_at is None:
+            return
+        self._run_total[INTERACTION] += time.monotonic() - started_at
+        self._running[INTERACTION] -= 1
+        self._dispatch()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, priority: str):
+        """
+        実行枠を確保して処理を行うコンテキストマネージャ
+
+        Parameters
+        ----------
+        priority : str
+            優先度
+        """
+        if priority == INTERACTION:
+            token = self.begin_interaction()
+            try:
+                yield
+            finally:
+                self.end_interaction(token)
+            return
+
+        await self.acquire(priority)
+        started_at = time.monotonic()
+        try:
+            yield
+        finally:
+            self._run_total[priority] += time.monotonic() - started_at
+            self.release(priority)
+
+    async def run(self, priority: str, awaitable: Awaitable[T]) -> T:
+        """
+        実行枠を確保してから処理を実行する
+
+        Parameters
+        ----------
+        priority : str
+            優先度
+        awaitable : Awaitable[T]
+            処理（コルーチン）
+
+        Returns
+        -------
+        T
+            処理の結果
+        """
+        async with self.slot(priority):
+            return await awaitable
+
+    def stats(self) -> dict[str, dict]:
+        """
+        優先度ごとの統計情報を取得する
+
+        Returns
+        -------
+        dict[str, dict]
+            {優先度: 実行中・待ち件数・開始した件数・待ち時間の上限により開始した件数・平均／最大の待ち時間・平均の実行時間}
+        """
+        result: dict[str, dict] = {}
+        for priority in PRIORITIES:
+            started = self._started[priority]
+            result[priority] = {
+                "running": self._running[priority],
+                "waiting": len(self._waiters[priority]),
+                "started": started,
+                "forced": self._forced[priority],
+                "wait_avg_ms": round(self._wait_total[priority] / started * 1000, 1) if started > 0 else 0,
+                "wait_max_ms": round(self._wait_max[priority] * 1000, 1),
+                "run_avg_ms": round(self._run_total[priority] / started * 1000, 1) if started > 0 else 0,
+            }
+        return result
+
+
+scheduler = PriorityScheduler({
+    INTERACTION: None,
+    REFRESH: 4,
+    RECONCILE: 3,
+})
+
+
+def interaction_priority(func: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+    """
+    モーダル・ボタンなどのコールバックをインタラクションの優先度で実行するデコレータ
+
+    Parameters
+    ----------
+    func : Callable[..., Awaitable[Any]]
+        コールバック
+
+    Returns
+    -------
+    Callable[..., Awaitable[Any]]
+        デコレートしたコールバック
+    """
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        async with scheduler.slot(INTERACTION):
+            return await func(*args, **kwargs)
+
+    return wrapper
+
+
+def install(bot: discord.Bot) -> None:
+    """
+    スラッシュコマンドの実行をインタラクションの優先度で記録させる
+
+    Parameters
+    ----------
+    bot : discord.Bot
+        ボット
+    """
+
+    async def before_invoke(ctx):
+        ctx.scheduler_token = scheduler.begin_interaction()
+
+    async def after_invoke(ctx):
+        token = getattr(ctx, "scheduler_token", None)
+        if token is not None:
+            scheduler.end_interaction(token)
+
+    bot.before_invoke(before_invoke)
+    bot.after_invoke(after_invoke)
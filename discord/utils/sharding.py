@@ -0,0 +1,121 @@
+import os
+import socket
+
+import discord
+
+
+def shard_id_for(guild_id: int, shard_count: int) -> int:
+    """
+    ギルドが属するシャードのIDを求める
+
+    Parameters
+    ----------
+    guild_id : int
+        ギルドID
+    shard_count : int
+        シャード数
+
+    Returns
+    -------
+    int
+        シャードID
+    """
+    return (guild_id >> 22) % shard_count
+
+
+def get_shard_count(bot: discord.Client) -> int:
+    """
+    ボット全体のシャード数を取得する　シャーディングしていない場合は1
+
+    Parameters
+    ----------
+    bot : discord.Client
+        ボット
+
+    Returns
+    -------
+    int
+        シャード数
+    """
+    return bot.shard_count or 1
+
+
+def get_local_shard_ids(bot: discord.Client) -> list[int]:
+    """
+    このプロセスが担当するシャードのIDを取得する
+
+    Parameters
+    ----------
+    bot : discord.Client
+        ボット
+
+    Returns
+    -------
+    list[int]
+        シャードIDのリスト
+    """
+    shard_ids = getattr(bot, "shard_ids", None)
+    if shard_ids is not None:
+        return list(shard_ids)
+    if bot.shard_id is not None:
+        return [bot.shard_id]
+    return list(range(get_shard_count(bot)))
+
+
+def owns_guild(bot: discord.Client, guild_id: int) -> bool:
+    """
+    ギルドがこのプロセスの担当シャードに属するか判定する
+
+    Parameters
+    ----------
+    bot : discord.Client
+        ボット
+    guild_id : int
+        ギルドID
+
+    Returns
+    -------
+    bool
+        担当している場合はTrue
+    """
+    return shard_id_for(guild_id, get_shard_count(bot)) in get_local_shard_ids(bot)
+
+
+def process_label(bot: discord.Client) -> str:
+    """
+    統計情報の集計などでプロセスを区別するためのラベルを取得する
+
+    Parameters
+    ----------
+    bot : discord.Client
+        ボット
+
+    Returns
+    -------
+    str
+        "ホスト名:pid[シャードID,...]"形式のラベル
+    """
+    shard_ids = ",".join(str(shard_id) for shard_id in get_local_shard_ids(bot))
+    return f"{socket.gethostname()}:{os.getpid()}[{shard_ids}]"
+
+
+def assigned_shard_label(bot: discord.Client) -> str | None:
+    """
+    DISCORD_SHARD_IDSで割り当てたシャードを表すラベルを取得する
+
+    process_labelと異なり再起動しても変わらないため、プロセスごとのファイル名などに使う
+
+    Parameters
+    ----------
+    bot : discord.Client
+        ボット
+
+    Returns
+    -------
+    str | None
+        "シャードID-シャードID-..."形式のラベル　割り当てず全てのシャードを担当する場合はNone
+    """
+    shard_ids = getattr(bot, "shard_ids", None)
+    if shard_ids is None:
+        return None
+    return "-".join(str(shard_id) for shard_id in sorted(shard_ids))
@@ -0,0 +1,102 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Generic, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight(Generic[T]):
+    """
+    同じキーへの同時の取得を1回にまとめ、結果を短時間キャッシュするクラス
+
+    取得中のキーに対する呼び出しは、新しく取得せず実行中の取得の結果を待つ
+    取得はタスクとして実行するため、最初の呼び出し元がキャンセルされても他の呼び出し元の取得は続く
+    成功した結果（Noneを含む）はttl秒キャッシュし、例外はキャッシュしない　ttlが0以下の場合はキャッシュしない
+    """
+
+    def __init__(self, name: str, ttl: float, maxsize: int = 1024) -> None:
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize
+
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+        # {キー: (有効期限, 結果)}
+        self._cache: OrderedDict[Hashable, tuple[float, T]] = OrderedDict()
+
+        # metrics
+        self.calls = 0
+        self.hits = 0
+        self.shared = 0
+
+    async def do(self, key: Hashable, fetch: Callable[[], Awaitable[T]]) -> T:
+        """
+        キーに対応する値を取得する
+
+        Parameters
+        ----------
+        key : Hashable
+            キー
+        fetch : Callable[[], Awaitable[T]]
+            値を取得するコルーチン関数　キャッシュがなく、取得中でもない場合だけ呼び出す
+
+        Returns
+        -------
+        T
+            取得した値
+        """
+        cached = self._cache.get(key)
+        if cached is not None:
+            if cached[0] > time.monotonic():
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return cached[1]
+            del self._cache[key]
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.shared += 1
+        else:
+            self.calls += 1
+            task = asyncio.ensure_future(fetch())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+
+        # 呼び出し元がキャンセルされても、取得自体は他の呼び出し元のために続ける
+        return await asyncio.shield(task)
+
+    def _done(self, key: Hashable, task: asyncio.Task) -> None:
+        self._inflight.pop(key, None)
+        if self.ttl <= 0 or task.cancelled() or task.exception() is not None:
+            return
+        self._cache[key] = (time.monotonic() + self.ttl, task.result())
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        """
+        キーのキャッシュを破棄する
+
+        Parameters
+        ----------
+        key : Hashable
+            キー
+        """
+        self._cache.pop(key, None)
+
+    def stats(self) -> dict:
+        """
+        統計情報を取得する
+
+        Returns
+        -------
+        dict
+            実際に取得した回数・キャッシュを使った回数・取得中の結果を共有した回数・キャッシュの件数
+        """
+        return {
+            "calls": self.calls,
+            "hits": self.hits,
+            "shared": self.shared,
+            "cached": len(self._cache),
+        }
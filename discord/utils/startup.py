@@ -0,0 +1,56 @@
+import importlib
+import logging
+import time
+
+# ゲートウェイへの接続を始めてから読み込むCog
+# DB（SQLAlchemy・pydantic）を使うためimportに時間がかかる
+DEFERRED_EXTENSIONS: list[str] = [
+    "cogs.PersonalInfoAcquirer",
+    "cogs.ProgressAsk",
+]
+
+# 遅延して読み込むCogが使う重いモジュール　warm_upで先にimportしておく
+HEAVY_MODULES: list[str] = [
+    "db.package.models",
+    "db.package.schemas",
+    "db.package.crud.participant",
+    "db.package.crud.progress_ask",
+    "db.package.crud.progress_ask_reaction",
+    "db.package.session",
+    "db.package.write_behind",
+    "db.package.journal",
+    "redis_crud.package.store",
+]
+
+
+def warm_up() -> dict[str, float]:
+    """
+    DBまわりの準備をする　イベントループを止めないよう、別スレッドで実行する
+
+    重いモジュールをimportし、engineを作成して接続プールに接続を1つ用意する
+    DBに接続できなくても起動は続けられるよう、接続の失敗はログに残すだけにする
+
+    Returns
+    -------
+    dict[str, float]
+        {段階: 所要時間（秒）}
+    """
+    logger = logging.getLogger("startup")
+    timings: dict[str, float] = {}
+
+    start = time.perf_counter()
+    for name in HEAVY_MODULES:
+        importlib.import_module(name)
+    timings["import"] = time.perf_counter() - start
+
+    from db.package import connection
+
+    start = time.perf_counter()
+    try:
+        connection.warm_up()
+    except Exception:
+        logger.exception("Failed to warm up DB connection")
+    timings["connect"] = time.perf_counter() - start
+
+    logger.info("DB warm-up: " + ", ".join(f"{phase}={elapsed * 1000:.0f}ms" for phase, elapsed in timings.items()))
+    return timings
@@ -0,0 +1,163 @@
+import functools
+import re
+import unicodedata
+
+import discord
+
+# 1つのメッセージに付けられるリアクションの種類の上限
+MAX_REACTIONS_PER_MESSAGE = 20
+
+# カスタム絵文字 <:name:id> / <a:name:id>
+CUSTOM_EMOJI_PATTERN = re.compile(r"<a?:\w+:(\d+)>")
+# キーキャップの絵文字 1️⃣ #️⃣ など
+KEYCAP_EMOJI_PATTERN = re.compile("[0-9#*]\ufe0f?\u20e3")
+
+ZERO_WIDTH_JOINER = "\u200d"
+
+
+def is_unicode_emoji(text: str) -> bool:
+    """
+    文字列が1つのUnicode絵文字かどうか判定する
+
+    絵文字の一覧は持たず、記号（So）1つと、それに結合する文字（異体字セレクタ・肌の色・タグなど）だけで
+    構成されているかで判定する　ZWJで繋いだ記号と、2つの国旗用の文字（regional indicator）は1つの絵文字とみなす
+
+    Parameters
+    ----------
+    text : str
+        判定する文字列
+
+    Returns
+    -------
+    bool
+        絵文字の場合はTrue
+    """
+    if KEYCAP_EMOJI_PATTERN.fullmatch(text):
+        return True
+
+    bases = 0
+    regional_indicators = 0
+    previous = ""
+    for char in text:
+        category = unicodedata.category(char)
+        if category == "So":
+            if "\U0001f1e6" <= char <= "\U0001f1ff":
+                regional_indicators += 1
+                # 国旗は2文字で1つの絵文字
+                if regional_indicators % 2 == 0:
+                    previous = char
+                    continue
+            if previous != ZERO_WIDTH_JOINER:
+                bases += 1
+        elif char != ZERO_WIDTH_JOINER and category not in ("Mn", "Me", "Sk", "Cf"):
+            return False
+        previous = char
+    return bases == 1
+
+
+def emoji_key(emoji: str | discord.PartialEmoji | discord.Emoji) -> str:
+    """
+    絵文字を照合するためのキーを取得する
+
+    カスタム絵文字は名前が変わっても同じものとして扱えるようIDを、Unicode絵文字はその文字列を使う
+
+    Parameters
+    ----------
+    emoji : str | discord.PartialEmoji | discord.Emoji
+        絵文字
+
+    Returns
+    -------
+    str
+        照合用のキー
+    """
+    emoji_id = getattr(emoji, "id", None)
+    if emoji_id is not None:
+        return str(emoji_id)
+
+    text = emoji if isinstance(emoji, str) else emoji.name
+    match = CUSTOM_EMOJI_PATTERN.fullmatch(text)
+    if match is not None:
+        return match.group(1)
+    return text
+
+
+class StepEmojis:
+    """
+    進捗確認の手順に対応するリアクションの絵文字
+
+    絵文字からindexへの辞書を作成しておき、リアクションごとの判定を定数時間で行う
+    手順が絵文字の数より多い場合は、絵文字の数ずつ別のメッセージに分けて同じ絵文字を使い回す
+    """
+
+    def __init__(self, emojis: list[str]) -> None:
+        self.emojis = emojis
+        self._indexes: dict[str, int] = {emoji_key(emoji): index for index, emoji in enumerate(emojis)}
+
+    def __len__(self) -> int:
+        return len(self.emojis)
+
+    def index_of(self, emoji: str | discord.PartialEmoji | discord.Emoji) -> int | None:
+        """
+        絵文字に対応するメッセージ内の手順のindexを取得する
+
+        Parameters
+        ----------
+        emoji : str | discord.PartialEmoji | discord.Emoji
+            絵文字
+
+        Returns
+        -------
+        int | None
+            index　手順の絵文字でない場合はNone
+        """
+        return self._indexes.get(emoji_key(emoji))
+
+    def for_step(self, step_index: int) -> str:
+        """
+        手順（進捗確認全体でのindex）に対応する絵文字を取得する
+
+        Parameters
+        ----------
+        step_index : int
+            手順のindex
+
+        Returns
+        -------
+        str
+            絵文字
+        """
+        return self.emojis[step_index % len(self.emojis)]
+
+    def dumps(self) -> str:
+        """
+        DBに保存する形式（空白区切り）にする
+
+        Returns
+        -------
+        str
+            空白区切りの絵文字
+        """
+        return " ".join(self.emojis)
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_step_emojis(value: str | None, default: tuple[str, ...]) -> StepEmojis:
+    """
+    DBに保存した絵文字からStepEmojisを作成する　同じ値からは同じインスタンスを返す
+
+    Parameters
+    ----------
+    value : str | None
+        空白区切りの絵文字　空やNoneの場合は既定の絵文字
+    default : tuple[str, ...]
+        既定の絵文字
+
+    Returns
+    -------
+    StepEmojis
+        作成したStepEmojis
+    """
+    if value is None or value.strip() == "":
+        return StepEmojis(list(default))
+    return StepEmojis(value.split())
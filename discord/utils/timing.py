@@ -0,0 +1,44 @@
+import logging
+import time
+
+
+class PhaseTimer:
+    """
+    処理のフェーズごとの所要時間を計測してログに出力するクラス
+
+    mark(フェーズ名)を呼ぶたびに、前回のmarkからの経過時間をそのフェーズの時間として記録する
+    """
+
+    def __init__(self, logger: logging.Logger, name: str) -> None:
+        self.logger = logger
+        self.name = name
+        self.started_at = time.perf_counter()
+        self._last = self.started_at
+        self.phases: list[tuple[str, float]] = []
+
+    def mark(self, phase: str) -> None:
+        """
+        フェーズの終了を記録する
+
+        Parameters
+        ----------
+        phase : str
+            フェーズ名
+        """
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def log(self, **extra) -> None:
+        """
+        記録したフェーズごとの所要時間と合計をログに出力する
+
+        Parameters
+        ----------
+        **extra
+            一緒に出力する値（件数など）
+        """
+        phases = " / ".join(f"{phase} {seconds * 1000:.0f}ms" for phase, seconds in self.phases)
+        values = "".join(f" {key}={value}" for key, value in extra.items())
+        total = (time.perf_counter() - self.started_at) * 1000
+        self.logger.info(f"{self.name}: {phases} / total {total:.0f}ms{values}")
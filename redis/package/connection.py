@@ -0,0 +1,13 @@
+import os
+
+
+def get_env(key: str, default: str) -> str:
+    return os.environ.get(key, default)
+
+
+# get envs
+# 未設定の場合はRedisを使わず、プロセス内のストアにフォールバックする
+REDIS_URL = get_env("REDIS_URL", "")
+
+# キーの接頭辞
+KEY_PREFIX = get_env("REDIS_KEY_PREFIX", "toryumon:")
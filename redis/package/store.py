@@ -0,0 +1,221 @@
+import logging
+import time
+from typing import Any, Protocol
+
+from .connection import KEY_PREFIX, REDIS_URL
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+
+class StateStore(Protocol):
+    """
+    プロセス間で共有する状態のストア
+
+    Redisのデータ型（文字列・カウンタ・セット・ハッシュ）に合わせた最小限の操作を提供する
+    値は全て文字列で保存する
+    """
+
+    async def get(self, key: str) -> str | None: ...
+
+    async def put(self, key: str, value: str, ttl: float | None = None) -> None: ...
+
+    async def delete(self, key: str) -> None: ...
+
+    async def incr(self, key: str, amount: int = 1, ttl: float | None = None) -> int: ...
+
+    async def sadd(self, key: str, *members: str) -> None: ...
+
+    async def srem(self, key: str, *members: str) -> None: ...
+
+    async def smembers(self, key: str) -> set[str]: ...
+
+    async def spop_all(self, key: str) -> set[str]: ...
+
+    async def hset(self, key: str, field: str, value: str) -> None: ...
+
+    async def hget(self, key: str, field: str) -> str | None: ...
+
+    async def hdel(self, key: str, *fields: str) -> None: ...
+
+    async def hgetall(self, key: str) -> dict[str, str]: ...
+
+
+class MemoryStore:
+    """
+    プロセス内のStateStore
+
+    Redisを使わない場合のフォールバック　再起動で内容は失われる
+    """
+
+    def __init__(self) -> None:
+        self._values: dict[str, Any] = {}
+        self._expires: dict[str, float] = {}
+
+    def _lookup(self, key: str, default: Any = None) -> Any:
+        expires_at = self._expires.get(key)
+        if expires_at is not None and expires_at <= time.monotonic():
+            self._values.pop(key, None)
+            self._expires.pop(key, None)
+        return self._values.get(key, default)
+
+    def _expire(self, key: str, ttl: float | None) -> None:
+        if ttl is None:
+            self._expires.pop(key, None)
+        else:
+            self._expires[key] = time.monotonic() + ttl
+
+    async def get(self, key: str) -> str | None:
+        return self._lookup(key)
+
+    async def put(self, key: str, value: str, ttl: float | None = None) -> None:
+        self._values[key] = value
+        self._expire(key, ttl)
+
+    async def delete(self, key: str) -> None:
+        self._values.pop(key, None)
+        self._expires.pop(key, None)
+
+    async def incr(self, key: str, amount: int = 1, ttl: float | None = None) -> int:
+        value = int(self._lookup(key, "0")) + amount
+        self._values[key] = str(value)
+        if ttl is not None:
+            self._expire(key, ttl)
+        return value
+
+    async def sadd(self, key: str, *members: str) -> None:
+        self._values.setdefault(key, set()).update(members)
+
+    async def srem(self, key: str, *members: str) -> None:
+        self._lookup(key, set()).difference_update(members)
+
+    async def smembers(self, key: str) -> set[str]:
+        return set(self._lookup(key, set()))
+
+    async def spop_all(self, key: str) -> set[str]:
+        members = self._lookup(key, set())
+        self._values.pop(key, None)
+        return set(members)
+
+    async def hset(self, key: str, field: str, value: str) -> None:
+        self._values.setdefault(key, {})[field] = value
+
+    async def hget(self, key: str, field: str) -> str | None:
+        return self._lookup(key, {}).get(field)
+
+    async def hdel(self, key: str, *fields: str) -> None:
+        values = self._lookup(key, {})
+        for field in fields:
+            values.pop(field, None)
+
+    async def hgetall(self, key: str) -> dict[str, str]:
+        return dict(self._lookup(key, {}))
+
+
+class RedisStore:
+    """
+    Redis上のStateStore
+
+    複数のボットプロセスから同じ状態を参照でき、再起動しても内容が残る
+    """
+
+    def __init__(self, client: Any, prefix: str = KEY_PREFIX) -> None:
+        # redis.asyncio.Redis（fakeredisのものでも可）　decode_responses=Trueで作成すること
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, key: str) -> str:
+        return self.prefix + key
+
+    async def get(self, key: str) -> str | None:
+        return await self.client.get(self._key(key))
+
+    async def put(self, key: str, value: str, ttl: float | None = None) -> None:
+        await self.client.set(self._key(key), value, px=None if ttl is None else int(ttl * 1000))
+
+    async def delete(self, key: str) -> None:
+        await self.client.delete(self._key(key))
+
+    async def incr(self, key: str, amount: int = 1, ttl: float | None = None) -> int:
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.incrby(self._key(key), amount)
+            if ttl is not None:
+                pipe.pexpire(self._key(key), int(ttl * 1000))
+            results = await pipe.execute()
+        return int(results[0])
+
+    async def sadd(self, key: str, *members: str) -> None:
+        if len(members) > 0:
+            await self.client.sadd(self._key(key), *members)
+
+    async def srem(self, key: str, *members: str) -> None:
+        if len(members) > 0:
+            await self.client.srem(self._key(key), *members)
+
+    async def smembers(self, key: str) -> set[str]:
+        return set(await self.client.smembers(self._key(key)))
+
+    async def spop_all(self, key: str) -> set[str]:
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.smembers(self._key(key))
+            pipe.delete(self._key(key))
+            results = await pipe.execute()
+        return set(results[0])
+
+    async def hset(self, key: str, field: str, value: str) -> None:
+        await self.client.hset(self._key(key), field, value)
+
+    async def hget(self, key: str, field: str) -> str | None:
+        return await self.client.hget(self._key(key), field)
+
+    async def hdel(self, key: str, *fields: str) -> None:
+        if len(fields) > 0:
+            await self.client.hdel(self._key(key), *fields)
+
+    async def hgetall(self, key: str) -> dict[str, str]:
+        return dict(await self.client.hgetall(self._key(key)))
+
+
+def create_store(url: str) -> StateStore:
+    """
+    StateStoreを作成する
+
+    Parameters
+    ----------
+    url : str
+        RedisのURL　空の場合やredisパッケージがない場合はMemoryStoreを作成する
+
+    Returns
+    -------
+    StateStore
+        作成したStateStore
+    """
+    if url == "":
+        return MemoryStore()
+    if aioredis is None:
+        # プロセス間で状態を共有できなくなるため、気付けるようにしておく
+        logging.getLogger("StateStore").warning(
+            "REDIS_URL is set but the redis package is not installed; falling back to in-process MemoryStore"
+        )
+        return MemoryStore()
+    return RedisStore(aioredis.from_url(url, decode_responses=True))
+
+
+_store: StateStore | None = None
+
+
+def get_store() -> StateStore:
+    """
+    プロセス全体で共有するStateStoreを取得する
+
+    Returns
+    -------
+    StateStore
+        REDIS_URLから作成したStateStore
+    """
+    global _store
+    if _store is None:
+        _store = create_store(REDIS_URL)
+    return _store